@@ -1,629 +1,1979 @@
-from flask import Flask, request, jsonify, render_template
-import sqlite3
-import math
-import requests
-import json
-from datetime import datetime
-import polyline
-import os
-
-from flask_cors import CORS
-
-app = Flask(__name__)
-CORS(app)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Configuration
-CATEGORIES = ["Thực phẩm khô", "Tươi sống", "Đồ hộp", "Sữa/ Đồ lạnh","Gia vị"]
-DATE = ["Trong ngày", "Trong tuần", "Trong tháng", "Trên 6 tháng"]
-PSMETHOD = ["Bình thường", "Cần kho mát", "Đông lạnh"]
-WAREHOUSES = [
-    {"name": "Foodbank kho chính", "lat": 10.85609385, "lon": 106.76522639999999}, 
-    {"name": "Foodbank Quận 1", "lat": 10.7707525, "lon": 106.6976235},   
-    {"name": "Foodbank Quận Bình Thạnh", "lat": 10.80484845, "lon": 106.71676215550468}, 
-]
-NOMINATIM_URL = "https://nominatim.openstreetmap.org/search?"
-NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
-
-# SQLite database setup
-def setup_database():
-    # Donations database
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "donations.db"))
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS donations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_name TEXT,
-            user_lat REAL,
-            user_lon REAL,
-            user_address TEXT,
-            category TEXT,
-            warehouse_name TEXT,
-            warehouse_lat REAL,
-            warehouse_lon REAL,
-            distance TEXT,
-            duration TEXT,
-            polyline TEXT,
-            status TEXT,
-            timestamp TEXT,
-            date TEXT,
-            quantity REAL,
-            weight REAL,
-            method TEXT,
-            exp TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-    # Requests database
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "requestlist.db"))
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS requests (
-            rid INTEGER PRIMARY KEY AUTOINCREMENT,
-            requester_name TEXT,
-            requester_lat REAL,
-            requester_lon REAL,
-            requester_address TEXT,
-            warehouse_name TEXT,
-            warehouse_lat REAL,
-            warehouse_lon REAL,
-            distance TEXT,
-            duration TEXT,
-            polyline TEXT,
-            status TEXT,
-            timestamp TEXT,
-            dry_food_qty REAL,
-            fresh_food_qty REAL,
-            canned_food_qty REAL,
-            milk_cold_qty REAL,
-            spice_qty REAL
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# Haversine formula
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
-
-# Find nearest warehouse
-def find_nearest_warehouse(user_lat, user_lon):
-    nearest = None
-    min_distance = float("inf")
-    for warehouse in WAREHOUSES:
-        distance = haversine(user_lat, user_lon, warehouse["lat"], warehouse["lon"])
-        if distance < min_distance:
-            min_distance = distance
-            nearest = warehouse
-    return nearest, min_distance
-
-# Geocode address to lat/lon
-def geocode_address(address):
-    try:
-        response = requests.get(
-            NOMINATIM_URL,
-            params={
-                "q": address,
-                "format": "json",
-                "limit": 1
-            },
-            headers={"User-Agent": "CharityDonationApp"}
-        )
-        data = response.json()
-        if data:
-            return float(data[0]["lat"]), float(data[0]["lon"])
-        return None, "No results found for address"
-    except Exception as e:
-        return None, str(e)
-
-# Reverse geocode lat/lon to address
-def reverse_geocode(lat, lon):
-    try:
-        response = requests.get(
-            NOMINATIM_REVERSE_URL,
-            params={
-                "lat": lat,
-                "lon": lon,
-                "format": "json"
-            },
-            headers={"User-Agent": "CharityDonationApp"}
-        )
-        data = response.json()
-        return data.get("display_name", "Unknown address")
-    except:
-        return "Unknown address"
-
-# Get OSRM directions
-def get_directions(origin, destination):
-    try:
-        origin_lon, origin_lat = map(float, origin.split(','))
-        dest_lon, dest_lat = map(float, destination.split(','))
-
-        if not (-90 <= origin_lat <= 90 and -180 <= origin_lon <= 180 and
-                -90 <= dest_lat <= 90 and -180 <= dest_lon <= 180):
-            return None, "Invalid coordinate values"
-
-        if origin_lon == dest_lon and origin_lat == dest_lat:
-            return {
-                "distance": "0 km",
-                "duration": "0 mins",
-                "steps": [{"instruction": "No route needed (same location)", "distance": "0 km", "duration": "0 mins"}],
-                "polyline": [[origin_lat, origin_lon]]
-            }, None
-
-        url = f"http://router.project-osrm.org/route/v1/driving/{origin};{destination}?overview=full&steps=true"
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
-            return None, f"OSRM request failed: HTTP {response.status_code}"
-
-        data = response.json()
-        if not isinstance(data, dict) or "code" not in data or data["code"] != "Ok":
-            return None, f"OSRM error: {data.get('message', 'Unknown error')}"
-
-        route = data["routes"][0]
-        encoded_polyline = route["geometry"]
-        decoded_coords = polyline.decode(encoded_polyline)
-        polyline_coords = [[lat, lon] for lat, lon in decoded_coords]
-
-        return {
-            "distance": f"{route['distance']/1000:.1f} km",
-            "duration": f"{route['duration']/60:.1f} mins",
-            "steps": [
-                {
-                    "instruction": step["maneuver"].get("instruction", "Proceed"),
-                    "distance": f"{step['distance']/1000:.1f} km",
-                    "duration": f"{step['duration']/60:.1f} mins"
-                } for step in route["legs"][0]["steps"]
-            ],
-            "polyline": polyline_coords
-        }, None
-    except ValueError:
-        return None, "Invalid coordinate format"
-    except requests.RequestException as e:
-        return None, f"OSRM network error: {str(e)}"
-    except Exception as e:
-        return None, f"Routing error: {str(e)}"
-
-# Save donation
-def save_donation(user_name, user_lat, user_lon, user_address, category, warehouse, distance, duration, polyline, date, quantity, weight, method, exp):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "donations.db"))
-    cursor = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO donations (
-            user_name, user_lat, user_lon, user_address, category,
-            warehouse_name, warehouse_lat, warehouse_lon,
-            distance, duration, polyline, status, timestamp, date, quantity, weight, method, exp
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        user_name, user_lat, user_lon, user_address or "", category,
-        warehouse["name"], warehouse["lat"], warehouse["lon"],
-        distance, duration, json.dumps(polyline), "Pending", timestamp, date, quantity, weight, method, exp
-    ))
-    conn.commit()
-    conn.close()
-
-# Save request
-def save_request(requester_name, requester_lat, requester_lon, requester_address, warehouse, distance, duration, polyline, dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "requestlist.db"))
-    cursor = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO requests (
-            requester_name, requester_lat, requester_lon, requester_address,
-            warehouse_name, warehouse_lat, warehouse_lon,
-            distance, duration, polyline, status, timestamp,
-            dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        requester_name, requester_lat, requester_lon, requester_address or "",
-        warehouse["name"], warehouse["lat"], warehouse["lon"],
-        distance, duration, json.dumps(polyline), "Pending", timestamp,
-        dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty
-    ))
-    conn.commit()
-    conn.close()
-
-# API Endpoints
-@app.route("/donate", methods=["POST"])
-def donate():
-    data = request.get_json()
-    user_lat = None
-    user_lon = None
-    user_address = None
-    user_name = data.get("user_name", "Anonymous")
-    quantity = data.get("quantity")
-    weight = data.get("weight")
-    exp = data.get("exp")
-    
-    try:
-        category = data["category"].capitalize()
-        date = data["date"]
-        method = data["method"]
-        if "latitude" in data and "longitude" in data:
-            user_lat = float(data["latitude"])
-            user_lon = float(data["longitude"])
-        elif "address" in data:
-            user_address = data["address"]
-            user_lat, user_lon = geocode_address(user_address)
-            if user_lat is None:
-                return jsonify({"error": f"Could not geocode address: {user_lon}"}), 400
-        else:
-            return jsonify({"error": "Provide either latitude/longitude or address."}), 400
-    except (KeyError, ValueError):
-        return jsonify({"error": "Invalid input. Provide category, date and location."}), 400
-
-    if category not in CATEGORIES:
-        return jsonify({"error": f"Invalid category. Vui long chon lai: {', '.join(CATEGORIES)}"}), 400
-    if date not in DATE:
-        return jsonify({"error": f"Invalid date. Vui long chon lai: {', '.join(DATE)}"}), 400
-    
-    warehouse, min_distance_km = find_nearest_warehouse(user_lat, user_lon)
-    if not warehouse:
-        return jsonify({"error": "No warehouses found."}), 404
-    
-    origin = f"{user_lon},{user_lat}"
-    destination = f"{warehouse['lon']},{warehouse['lat']}"
-    route, error = get_directions(origin, destination)
-    
-    if not route:
-        return jsonify({"error": f"Could not calculate route: {error}"}), 500
-    
-    distance = route["distance"]
-    duration = route["duration"]
-    polyline = route["polyline"]
-    
-    save_donation(user_name, user_lat, user_lon, user_address, category, warehouse, distance, duration, polyline, date, quantity, weight, method, exp)
-    
-    response = {
-        "message": "Donation request submitted successfully",
-        "warehouse": {
-            "name": warehouse["name"],
-            "distance": distance,
-            "duration": duration
-        },
-        "category": category,
-    }
-    
-    return jsonify(response), 200
-
-@app.route("/request", methods=["POST"])
-def request_goods():
-    data = request.get_json()
-    requester_lat = None
-    requester_lon = None
-    requester_address = None
-
-    try:
-        requester_name = data.get("requester_name", "")
-        dry_food_qty = float(data.get("dry_food_qty", 0))
-        fresh_food_qty = float(data.get("fresh_food_qty", 0))
-        canned_food_qty = float(data.get("canned_food_qty", 0))
-        milk_cold_qty = float(data.get("milk_cold_qty", 0))
-        spice_qty = float(data.get("spice_qty", 0))
-
-        if not requester_name:
-            return jsonify({"error": "Requester name is required."}), 400
-        if dry_food_qty < 0 or fresh_food_qty < 0 or canned_food_qty < 0 or milk_cold_qty < 0 or spice_qty < 0:
-            return jsonify({"error": "Quantities must be non-negative."}), 400
-
-        if "latitude" in data and "longitude" in data:
-            requester_lat = float(data["latitude"])
-            requester_lon = float(data["longitude"])
-        elif "address" in data:
-            requester_address = data["address"]
-            requester_lat, requester_lon = geocode_address(requester_address)
-            if requester_lat is None:
-                return jsonify({"error": f"Could not geocode address: {requester_lon}"}), 400
-        else:
-            return jsonify({"error": "Provide either latitude/longitude or address."}), 400
-    except (KeyError, ValueError):
-        return jsonify({"error": "Invalid input. Provide name, quantities, and location."}), 400
-    
-    warehouse, min_distance_km = find_nearest_warehouse(requester_lat, requester_lon)
-    if not warehouse:
-        return jsonify({"error": "No warehouses found."}), 404
-    
-    origin = f"{requester_lon},{requester_lat}"
-    destination = f"{warehouse['lon']},{warehouse['lat']}"
-    route, error = get_directions(origin, destination)
-    
-    if not route:
-        return jsonify({"error": f"Could not calculate route: {error}"}), 500
-    
-    distance = route["distance"]
-    duration = route["duration"]
-    polyline = route["polyline"]
-    
-    save_request(requester_name, requester_lat, requester_lon, requester_address, warehouse, distance, duration, polyline, dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty)
-    
-    response = {
-        "message": "Request submitted successfully",
-        "warehouse": {
-            "name": warehouse["name"],
-            "distance": distance,
-            "duration": duration
-        }
-    }
-    
-    return jsonify(response), 200
-
-@app.route("/donations", methods=["GET"])
-def get_donations():
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "donations.db"))
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM donations ORDER BY timestamp DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    donations = [
-        {
-            "id": row[0],
-            "username": row[1],
-            "user_latitude": row[2],
-            "user_longitude": row[3],
-            "user_address": row[4] or reverse_geocode(row[2], row[3]),
-            "category": row[5],
-            "warehouse_name": row[6],
-            "warehouse_latitude": row[7],
-            "warehouse_longitude": row[8],
-            "warehouse_address": reverse_geocode(row[7], row[8]),
-            "distance": row[9],
-            "duration": row[10],
-            "polyline": json.loads(row[11]),
-            "status": row[12],
-            "timestamp": row[13],
-            "date": row[14],
-            "quantity": row[15],
-            "weight": row[16],
-            "method": row[17],
-            "exp": row[18]
-        }
-        for row in rows
-    ]
-    
-    return jsonify(donations), 200
-
-@app.route("/requests", methods=["GET"])
-def get_requests():
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "requestlist.db"))
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM requests ORDER BY timestamp DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    requests = [
-        {
-            "rid": row[0],
-            "requester_name": row[1],
-            "requester_latitude": row[2],
-            "requester_longitude": row[3],
-            "requester_address": row[4] or reverse_geocode(row[2], row[3]),
-            "warehouse_name": row[5],
-            "warehouse_latitude": row[6],
-            "warehouse_longitude": row[7],
-            "warehouse_address": reverse_geocode(row[6], row[7]),
-            "distance": row[8],
-            "duration": row[9],
-            "polyline": json.loads(row[10]),
-            "status": row[11],
-            "timestamp": row[12],
-            "dry_food_qty": row[13],
-            "fresh_food_qty": row[14],
-            "canned_food_qty": row[15],
-            "milk_cold_qty": row[16],
-            "spice_qty": row[17]
-        }
-        for row in rows
-    ]
-    
-    return jsonify(requests), 200
-
-@app.route("/update_status/<int:id>", methods=["POST"])
-def update_status(id):
-    data = request.get_json()
-    status = data.get("status")
-    if status not in ["Pending", "Processed", "Picked Up"]:
-        return jsonify({"error": "Invalid status."}), 400
-    
-    # Try updating donations
-    cconn = sqlite3.connect(os.path.join(BASE_DIR, "donations.db"))
-    cursor = conn.cursor()
-    cursor.execute("UPDATE donations SET status = ? WHERE id = ?", (status, id))
-    conn.commit()
-    conn.close()
-    
-    # Try updating requests
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "requestlist.db"))
-    cursor = conn.cursor()
-    cursor.execute("UPDATE requests SET status = ? WHERE id = ?", (status, id))
-    conn.commit()
-    conn.close()
-    
-    return jsonify({"message": f"Status for ID {id} updated to {status}"}), 200
-
-@app.route("/delete_donation/<int:donation_id>", methods=["DELETE"])
-def delete_donation(donation_id):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "donations.db"))
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT id FROM donations WHERE id = ?", (donation_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return jsonify({"error": f"Donation {donation_id} not found."}), 404
-    
-    cursor.execute("DELETE FROM donations WHERE id = ?", (donation_id,))
-    
-    cursor.execute("SELECT id FROM donations ORDER BY id ASC")
-    rows = cursor.fetchall()
-    for new_id, (old_id,) in enumerate(rows, 1):
-        if old_id != new_id:
-            cursor.execute("UPDATE donations SET id = ? WHERE id = ?", (new_id, old_id))
-    
-    cursor.execute("SELECT MAX(id) FROM donations")
-    max_id = cursor.fetchone()[0] or 0
-    cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'donations'", (max_id,))
-    
-    conn.commit()
-    conn.close()
-    
-    return jsonify({"message": f"Donation {donation_id} deleted and IDs reassigned."}), 200
-
-@app.route("/delete_request/<int:request_id>", methods=["DELETE"])
-def delete_request(request_id):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "requestlist.db"))
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT rid FROM requests WHERE rid = ?", (request_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return jsonify({"error": f"Request {request_id} not found."}), 404
-
-    cursor.execute("DELETE FROM requests WHERE rid = ?", (request_id,))
-
-    cursor.execute("SELECT rid FROM requests ORDER BY rid ASC")
-    rows = cursor.fetchall()
-    for new_rid, (old_rid,) in enumerate(rows, 1):
-        if old_rid != new_rid:
-            cursor.execute("UPDATE requests SET rid = ? WHERE rid = ?", (new_rid, old_rid))
-
-    cursor.execute("SELECT MAX(rid) FROM requests")
-    max_id = cursor.fetchone()[0] or 0
-    cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'requests'", (max_id,))
-        
-    conn.commit()
-    conn.close()
-    
-    return jsonify({"message": f"Request {request_id} deleted and IDs reassigned."}), 200
-
-
-
-@app.route("/admin")
-def admin_dashboard():
-    return render_template("admin.html")
-
-@app.route("/admin_requester")
-def admin_requester_dashboard():
-    return render_template("admin_requester.html")
-
-@app.route("/test_donate", methods=["GET", "POST"])
-def test_donate():
-    if request.method == "GET":
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD)
-    
-    date = request.form.get("date")
-    category = request.form.get("category")
-    exp = request.form.get("exp")
-    method = request.form.get("method")
-    user_address = request.form.get("address")
-    user_name = request.form.get("user_name", "Anonymous")
-    quantity = request.form.get("quantity")    
-    weight = request.form.get("weight")    
-    
-    if not category or not user_address:
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-                              error="Please provide category and address.")
-    
-    if category not in CATEGORIES:
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-                              error=f"Invalid category. Choose from: {', '.join(CATEGORIES)}")
-    
-    user_lat, user_lon = geocode_address(user_address)
-    if user_lat is None:
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-                              error=f"Could not geocode address: {user_lon}")
-    
-    warehouse, min_distance_km = find_nearest_warehouse(user_lat, user_lon)
-    if not warehouse:
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-                              error="No warehouses found.")
-    
-    origin = f"{user_lon},{user_lat}"
-    destination = f"{warehouse['lon']},{warehouse['lat']}"
-    route, error = get_directions(origin, destination)
-    
-    if not route:
-        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-                              error=f"Could not calculate route: {error}")
-    
-    distance = route["distance"]
-    duration = route["duration"]
-    polyline = route["polyline"]
-    
-    save_donation(user_name, user_lat, user_lon, user_address, category, warehouse, distance, duration, polyline, date, quantity, weight, method, exp)
-    
-    return render_template(
-        "test_donate.html",
-        categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
-        success=f"Donation submitted! Category: {category}, Warehouse: {warehouse['name']}, Distance: {distance}"
-    )
-
-@app.route("/test_donate_requester", methods=["GET", "POST"])
-def test_donate_requester():
-    if request.method == "GET":
-        return render_template("test_donate_requester.html")
-    
-    requester_name = request.form.get("requester_name")
-    requester_address = request.form.get("requester_address")
-    dry_food_qty = request.form.get("dry_food_qty")  # Map to Thực phẩm khô
-    fresh_food_qty = request.form.get("fresh_food_qty")  # Map to Tươi sống
-    canned_food_qty = request.form.get("canned_food_qty")  # Map to Đồ hộp
-    milk_cold_qty = request.form.get("milk_cold_qty")  # Map to Sữa/ Đồ lạnh
-    spice_qty = request.form.get("spice_qty")  # Map to Gia vị
-
-    if not requester_name or not requester_address:
-        return render_template("test_donate_requester.html",
-                              error="Please provide requester name and address.")
-    
-    try:
-        dry_food_qty = float(dry_food_qty) if dry_food_qty else 0
-        fresh_food_qty = float(fresh_food_qty) if fresh_food_qty else 0
-        canned_food_qty = float(canned_food_qty) if canned_food_qty else 0
-        milk_cold_qty = float(milk_cold_qty) if milk_cold_qty else 0
-        spice_qty = float(spice_qty) if spice_qty else 0
-        if dry_food_qty < 0 or fresh_food_qty < 0 or canned_food_qty < 0 or milk_cold_qty < 0 or spice_qty < 0:
-            return render_template("test_donate_requester.html",
-                                  error="Quantities must be non-negative.")
-    except ValueError:
-        return render_template("test_donate_requester.html",
-                              error="Quantities must be numbers.")
-    
-    requester_lat, requester_lon = geocode_address(requester_address)
-    if requester_lat is None:
-        return render_template("test_donate_requester.html",
-                              error=f"Could not geocode address: {requester_lon}")
-    
-    warehouse, min_distance_km = find_nearest_warehouse(requester_lat, requester_lon)
-    if not warehouse:
-        return render_template("test_donate_requester.html",
-                              error="No warehouses found.")
-    
-    origin = f"{requester_lon},{requester_lat}"
-    destination = f"{warehouse['lon']},{warehouse['lat']}"
-    route, error = get_directions(origin, destination)
-    
-    if not route:
-        return render_template("test_donate_requester.html",
-                              error=f"Could not calculate route: {error}")
-    
-    distance = route["distance"]
-    duration = route["duration"]
-    polyline = route["polyline"]
-    
-    save_request(requester_name, requester_lat, requester_lon, requester_address, warehouse, distance, duration, polyline, dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty)
-    
-    return render_template(
-        "test_donate_requester.html",
-        success=f"Request submitted! Warehouse: {warehouse['name']}, Distance: {distance}"
-    )
-
-if __name__ == "__main__":
-    setup_database()
+from flask import Flask, Response, g, request, jsonify, render_template
+import sqlite3
+import math
+import re
+import requests
+import json
+import base64
+import click
+import hmac
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import polyline
+import os
+import threading
+import time
+import zlib
+
+from flask_cors import CORS
+
+import cache
+import changes
+import db
+import events
+import gazetteer
+import http_client
+import jobs
+import matching
+import metrics
+import migrations
+import profiler
+import roadgraph
+import summaries
+import tours
+import warehouses
+
+app = Flask(__name__)
+CORS(app)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Configuration
+CATEGORIES = ["Thực phẩm khô", "Tươi sống", "Đồ hộp", "Sữa/ Đồ lạnh","Gia vị"]
+DATE = ["Trong ngày", "Trong tuần", "Trong tháng", "Trên 6 tháng"]
+PSMETHOD = ["Bình thường", "Cần kho mát", "Đông lạnh"]
+# Seed rows for the warehouses table; the table is the source of truth
+WAREHOUSES = [
+    {"name": "Foodbank kho chính", "lat": 10.85609385, "lon": 106.76522639999999}, 
+    {"name": "Foodbank Quận 1", "lat": 10.7707525, "lon": 106.6976235},   
+    {"name": "Foodbank Quận Bình Thạnh", "lat": 10.80484845, "lon": 106.71676215550468}, 
+]
+# Upstream services; the environment can point them elsewhere (see
+# bench/fake_services.py)
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search?")
+NOMINATIM_REVERSE_URL = os.environ.get("NOMINATIM_REVERSE_URL", "https://nominatim.openstreetmap.org/reverse")
+OSRM_URL = os.environ.get("OSRM_URL", "http://router.project-osrm.org")
+# Routing backends tried in order. "local" uses the offline road graph
+# (flask --app app build-road-graph <extract.osm>) when its file exists.
+ROUTING_BACKENDS = ["local", "osrm"]
+ROAD_GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roads.graph")
+# Geocoding backends tried in order. "local" uses the offline gazetteer
+# (flask --app app build-gazetteer <extract.osm or dump.csv>) when its
+# file exists; Nominatim only sees addresses it cannot place confidently.
+GEOCODING_BACKENDS = ["local", "nominatim"]
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.idx")
+# How submissions pick a warehouse: "duration" asks OSRM for drive times
+# to every warehouse (one table call, cached per origin cell) and falls
+# back to straight-line "haversine" distance if that fails.
+WAREHOUSE_SELECTION = "duration"
+WAREHOUSE_CANDIDATES = 5               # nearest warehouses compared by drive time
+OSRM_TABLE_MAX_COORDINATES = 100       # OSRM's default --max-table-size
+STATUSES = ["Pending", "Processed", "Picked Up"]
+# Set by the server while a submission waits for geocoding/routing
+ENRICHING = "Enriching"
+ENRICH_FAILED = "Failed"
+ENRICH_WORKERS = 2                     # background enrichment threads per worker process
+LIST_STATUSES = STATUSES + [ENRICHING, ENRICH_FAILED]
+# Request quantity column for each donation category
+CATEGORY_QTY_COLUMNS = {
+    "Thực phẩm khô": "dry_food_qty",
+    "Tươi sống": "fresh_food_qty",
+    "Đồ hộp": "canned_food_qty",
+    "Sữa/ Đồ lạnh": "milk_cold_qty",
+    "Gia vị": "spice_qty",
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+BULK_MAX_ROWS = 5000
+MAX_TOUR_STOPS = 250
+BULK_WORKERS = 8                       # concurrent geocode/route lookups per bulk upload
+CHANGES_CHUNK = 500                    # ids per IN (...) lookup when serving deltas
+EXPORT_CHUNK = 1000                    # rows per keyset query while streaming an export
+EXPORT_FLUSH_BYTES = 64 * 1024         # buffered output sent to the client at a time
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+BACKFILL_BATCH = 5000                  # rows per transaction when backfilling a new column
+METRICS_PUBLISH_S = 10                 # how often each worker stores its metrics and cache stats
+METRICS_MAX_AGE_S = 60                 # snapshots older than this are from exited workers
+# The profiler endpoints need this in an X-Admin-Token header; they are
+# disabled while it is unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Requests slower than SLOW_PROFILE_MS keep a sampled profile. Unset by
+# default: capture samples every request at 100 Hz, so turn it on only
+# while chasing a latency problem
+SLOW_PROFILE_MS = float(os.environ["SLOW_PROFILE_MS"]) if os.environ.get("SLOW_PROFILE_MS") else None
+PROFILE_MAX_SECONDS = 600              # longest on-demand profiling window
+
+# Schema migrations, in order; see migrations.py. Never edit a step that
+# has shipped, add a new one.
+def create_donations(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_name TEXT,
+            user_lat REAL,
+            user_lon REAL,
+            user_address TEXT,
+            category TEXT,
+            warehouse_name TEXT,
+            warehouse_lat REAL,
+            warehouse_lon REAL,
+            distance TEXT,
+            duration TEXT,
+            polyline TEXT,
+            status TEXT,
+            timestamp TEXT,
+            date TEXT,
+            quantity REAL,
+            weight REAL,
+            method TEXT,
+            exp TEXT
+        )
+    """)
+    # Keyset pagination walks (timestamp, id) newest first; the filtered
+    # listings use the status/warehouse prefixes.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_timestamp ON donations (timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_status ON donations (status, timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_warehouse ON donations (warehouse_name, timestamp, id)")
+
+def create_requests(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS requests (
+            rid INTEGER PRIMARY KEY AUTOINCREMENT,
+            requester_name TEXT,
+            requester_lat REAL,
+            requester_lon REAL,
+            requester_address TEXT,
+            warehouse_name TEXT,
+            warehouse_lat REAL,
+            warehouse_lon REAL,
+            distance TEXT,
+            duration TEXT,
+            polyline TEXT,
+            status TEXT,
+            timestamp TEXT,
+            dry_food_qty REAL,
+            fresh_food_qty REAL,
+            canned_food_qty REAL,
+            milk_cold_qty REAL,
+            spice_qty REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests (timestamp, rid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_status ON requests (status, timestamp, rid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_warehouse ON requests (warehouse_name, timestamp, rid)")
+
+# Convert routes stored as JSON [[lat, lon], ...] text into encoded
+# polylines
+def encode_json_polylines(table, key):
+    def step(conn):
+        rows = conn.execute(f"SELECT {key}, polyline FROM {table} WHERE polyline LIKE '[%'").fetchall()
+        updates = []
+        for row_id, text in rows:
+            try:
+                updates.append((encode_geometry(json.loads(text)), row_id))
+            except (ValueError, TypeError):
+                updates.append((None, row_id))
+        conn.executemany(f"UPDATE {table} SET polyline = ? WHERE {key} = ?", updates)
+    return step
+
+# Numeric copies of the "3.2 km" / "7.5 mins" route strings, so listings
+# can filter and sort by them in SQL
+def add_route_numbers(table):
+    def step(conn):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN distance_m REAL")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN duration_s REAL")
+    return step
+
+# Fill distance_m/duration_s from the text columns, BACKFILL_BATCH rows
+# per call in key order. Unparseable strings are left NULL.
+def backfill_route_numbers(table, key):
+    state = {"after": 0}
+    def step(conn):
+        rows = conn.execute(
+            f"SELECT {key}, distance, duration FROM {table} "
+            f"WHERE {key} > ? AND distance_m IS NULL AND distance IS NOT NULL ORDER BY {key} LIMIT ?",
+            (state["after"], BACKFILL_BATCH)
+        ).fetchall()
+        conn.executemany(
+            f"UPDATE {table} SET distance_m = ?, duration_s = ? WHERE {key} = ?",
+            [(parse_distance_m(row[1]), parse_duration_s(row[2]), row[0]) for row in rows]
+        )
+        if rows:
+            state["after"] = rows[-1][0]
+        return len(rows) == BACKFILL_BATCH
+    return step
+
+def index_route_numbers(table, key):
+    def step(conn):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_distance ON {table} (distance_m, {key})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_duration ON {table} (duration_s, {key})")
+    return step
+
+DONATION_MIGRATIONS = [
+    create_donations,
+    encode_json_polylines("donations", "id"),
+    add_route_numbers("donations"),
+    backfill_route_numbers("donations", "id"),
+    index_route_numbers("donations", "id"),
+]
+REQUEST_MIGRATIONS = [
+    create_requests,
+    encode_json_polylines("requests", "rid"),
+    add_route_numbers("requests"),
+    backfill_route_numbers("requests", "rid"),
+    index_route_numbers("requests", "rid"),
+]
+
+ROUTE_DISTANCE = re.compile(r"\s*(\d+(?:\.\d+)?)\s*(km|m)\s*")
+ROUTE_DURATION = re.compile(r"\s*(\d+(?:\.\d+)?)\s*(mins?|h|s)\s*")
+DISTANCE_UNITS = {"km": 1000, "m": 1}
+DURATION_UNITS = {"min": 60, "mins": 60, "h": 3600, "s": 1}
+
+def parse_distance_m(text):
+    match = ROUTE_DISTANCE.fullmatch(text or "")
+    return float(match.group(1)) * DISTANCE_UNITS[match.group(2)] if match else None
+
+def parse_duration_s(text):
+    match = ROUTE_DURATION.fullmatch(text or "")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)] if match else None
+
+# SQLite database setup. Migrations are idempotent and run at import,
+# so the gunicorn workers bring an old database up to date themselves.
+def setup_database():
+    migrations.migrate(db.DONATIONS_DB, DONATION_MIGRATIONS)
+    migrations.migrate(db.REQUESTS_DB, REQUEST_MIGRATIONS)
+    with db.transaction(db.DONATIONS_DB) as conn:
+        changes.setup_changes(conn, "donations", "id")
+    with db.transaction(db.REQUESTS_DB) as conn:
+        changes.setup_changes(conn, "requests", "rid")
+
+    jobs.setup_jobs(db.DONATIONS_DB)
+    jobs.setup_jobs(db.REQUESTS_DB)
+    warehouses.setup_warehouses(WAREHOUSES)
+    summaries.setup_summaries(CATEGORY_QTY_COLUMNS)
+
+# Haversine formula
+def haversine(lat1, lon1, lat2, lon2):
+    R = 6371
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return R * c
+
+# Find nearest warehouse
+@metrics.span("nearest_warehouse")
+def find_nearest_warehouse(user_lat, user_lon):
+    hits = warehouses.nearest(user_lat, user_lon, 1)
+    if not hits:
+        return None, float("inf")
+    return hits[0]
+
+# Drive time in seconds from an origin to each candidate warehouse, by
+# name. Cached entries are tied to the warehouse table version.
+def get_warehouse_durations(user_lat, user_lon, candidates):
+    version = warehouses.version()
+    cached = cache.get_durations(user_lat, user_lon)
+    if cached is not None and cached.get("version") == version:
+        cache.record("durations", True)
+        return cached["durations"]
+    cache.record("durations", False)
+
+    coordinates = ";".join([f"{user_lon},{user_lat}"] + [f"{w['lon']},{w['lat']}" for w in candidates])
+    response = http_client.get(
+        f"{OSRM_URL}/table/v1/driving/{coordinates}",
+        params={"sources": 0, "annotations": "duration"}
+    )
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get("code") != "Ok":
+        return None
+    durations = {
+        warehouse["name"]: seconds
+        for warehouse, seconds in zip(candidates, data["durations"][0][1:])
+        if seconds is not None
+    }
+    if durations:
+        cache.put_durations(user_lat, user_lon, {"version": version, "durations": durations})
+    return durations or None
+
+# Drive times for many origins at once, as one {name: seconds} (or None)
+# per origin. Cached origins are answered from cache.db; the rest share
+# OSRM table calls, each with as many origins as fit next to the union of
+# their candidates.
+def get_warehouse_durations_batch(points, candidates):
+    version = warehouses.version()
+    results = [None] * len(points)
+    missing = []
+    for i, (lat, lon) in enumerate(points):
+        cached = cache.get_durations(lat, lon)
+        if cached is not None and cached.get("version") == version:
+            cache.record("durations", True)
+            results[i] = cached["durations"]
+        elif candidates[i]:
+            cache.record("durations", False)
+            missing.append(i)
+
+    while missing:
+        batch, targets = [], {}
+        for i in missing:
+            names = {w["name"]: w for w, km in candidates[i]}
+            if batch and len(batch) + len(targets.keys() | names.keys()) > OSRM_TABLE_MAX_COORDINATES:
+                break
+            batch.append(i)
+            targets.update(names)
+        missing = missing[len(batch):]
+        targets = list(targets.values())
+        coordinates = ";".join(
+            [f"{points[i][1]},{points[i][0]}" for i in batch] + [f"{w['lon']},{w['lat']}" for w in targets]
+        )
+        try:
+            response = http_client.get(
+                f"{OSRM_URL}/table/v1/driving/{coordinates}",
+                params={
+                    "sources": ";".join(str(n) for n in range(len(batch))),
+                    "destinations": ";".join(str(len(batch) + n) for n in range(len(targets))),
+                    "annotations": "duration",
+                }
+            )
+            data = response.json() if response.status_code == 200 else {}
+            if data.get("code") != "Ok":
+                continue
+            for i, row in zip(batch, data["durations"]):
+                wanted = {w["name"] for w, km in candidates[i]}
+                durations = {
+                    warehouse["name"]: seconds
+                    for warehouse, seconds in zip(targets, row)
+                    if seconds is not None and warehouse["name"] in wanted
+                }
+                if durations:
+                    cache.put_durations(*points[i], {"version": version, "durations": durations})
+                    results[i] = durations
+        except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+            continue
+    return results
+
+# Pick the warehouse with the shortest drive among the nearest
+# candidates, or the nearest one when drive times are unavailable.
+# Bulk ingestion passes the candidates and drive times it looked up for
+# the whole batch; durations={} means drive times were tried and failed.
+# Returns (warehouse, haversine km).
+@metrics.span("choose_warehouse")
+def choose_warehouse(user_lat, user_lon, candidates=None, durations=None):
+    if WAREHOUSE_SELECTION == "duration":
+        if candidates is None:
+            candidates = warehouses.nearest(user_lat, user_lon, WAREHOUSE_CANDIDATES)
+        if durations is None:
+            try:
+                durations = get_warehouse_durations(user_lat, user_lon, [w for w, km in candidates])
+            except (requests.RequestException, ValueError, KeyError, IndexError):
+                durations = None
+        if durations:
+            return min(
+                ((w, km) for w, km in candidates if w["name"] in durations),
+                key=lambda hit: durations[hit[0]["name"]]
+            )
+    if candidates:
+        return candidates[0]
+    return find_nearest_warehouse(user_lat, user_lon)
+
+# Geocode address to lat/lon with Nominatim
+def nominatim_geocode(address):
+    try:
+        response = http_client.get(
+            NOMINATIM_URL,
+            params={
+                "q": address,
+                "format": "json",
+                "limit": 1
+            }
+        )
+        data = response.json()
+        if data:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        return None, "No results found for address"
+    except Exception as e:
+        return None, str(e)
+
+# Geocode address to lat/lon with the offline gazetteer
+def local_geocode(address):
+    index = gazetteer.get_gazetteer(GAZETTEER_PATH)
+    if index is None:
+        return None, "Offline gazetteer not available"
+    found = index.geocode(address)
+    if found is None:
+        return None, "No confident offline match for address"
+    return found[0], found[1]
+
+GEOCODERS = {"local": local_geocode, "nominatim": nominatim_geocode}
+# Geocoding answers that asking again will not change
+GEOCODE_NOT_FOUND = {
+    "Empty address", "No results found for address", "No confident offline match for address",
+}
+
+# Geocode address to lat/lon with the first backend that places it
+def geocode_address(address):
+    error = "No geocoding backend available"
+    for backend in GEOCODING_BACKENDS:
+        lat, error = GEOCODERS[backend](address)
+        if lat is not None:
+            return lat, error
+    return None, error
+
+# Geocode through the shared cache. Concurrent lookups of the same
+# normalized address are coalesced into a single Nominatim request.
+@metrics.span("geocode")
+def cached_geocode_address(address):
+    key = cache.normalize_address(address)
+    if not key:
+        return None, "Empty address"
+    cached = cache.get_forward(key)
+    if cached is not None:
+        cache.record("forward_geocode", True)
+        return cached
+    cache.record("forward_geocode", False)
+
+    def lookup():
+        # Another request may have filled the cache while we waited
+        cached = cache.get_forward(key)
+        if cached is not None:
+            return cached
+        lat, lon = geocode_address(address)
+        if lat is not None:
+            cache.put_forward(key, lat, lon)
+        return lat, lon
+
+    return cache.single_flight(("forward", key), lookup)
+
+# Reverse geocode lat/lon to address
+def reverse_geocode(lat, lon):
+    try:
+        response = http_client.get(
+            NOMINATIM_REVERSE_URL,
+            params={
+                "lat": lat,
+                "lon": lon,
+                "format": "json"
+            }
+        )
+        data = response.json()
+        return data.get("display_name", "Unknown address")
+    except:
+        return "Unknown address"
+
+# Reverse geocode through the shared cache. Failures are cached for
+# cache.REVERSE_FAILURE_TTL, so an address Nominatim cannot resolve (or
+# an outage) costs one rate-limited call per coordinate, not one per row.
+@metrics.span("reverse_geocode")
+def cached_reverse_geocode(lat, lon):
+    if lat is None or lon is None:
+        return "Unknown address"
+    address = cache.get_reverse(lat, lon)
+    if address == "":
+        return "Unknown address"
+    if address is None:
+        address = reverse_geocode(lat, lon)
+        cache.put_reverse(lat, lon, address if address != "Unknown address" else None)
+    return address
+
+# Warehouse addresses per worker as (address, when to look again); a
+# failed lookup is retried after cache.REVERSE_FAILURE_TTL
+WAREHOUSE_ADDRESSES = {}
+
+def resolve_warehouse_address(lat, lon):
+    address = cached_reverse_geocode(lat, lon)
+    retry_at = time.time() + cache.REVERSE_FAILURE_TTL if address == "Unknown address" else float("inf")
+    WAREHOUSE_ADDRESSES[(lat, lon)] = (address, retry_at)
+    return address
+
+def load_warehouse_addresses():
+    for warehouse in warehouses.all_warehouses():
+        resolve_warehouse_address(warehouse["lat"], warehouse["lon"])
+
+# lookup=False never calls Nominatim: an address this worker has not
+# resolved yet comes from the shared cache, or None
+def warehouse_address(lat, lon, lookup=True):
+    known = WAREHOUSE_ADDRESSES.get((lat, lon))
+    if known is not None and (not lookup or time.time() < known[1]):
+        return known[0]
+    if not lookup:
+        if lat is None or lon is None:
+            return None
+        return cache.get_reverse(lat, lon) or None
+    return resolve_warehouse_address(lat, lon)
+
+# Build the route response from raw OSRM values
+def build_route(distance_m, duration_s, steps, encoded_polyline):
+    return {
+        "distance": f"{distance_m/1000:.1f} km",
+        "duration": f"{duration_s/60:.1f} mins",
+        "distance_m": distance_m,
+        "duration_s": duration_s,
+        "steps": steps,
+        "geometry": encoded_polyline,
+        "polyline": decode_geometry(encoded_polyline)
+    }
+
+# Routes are stored as OSRM's encoded polyline (precision 5) and only
+# decoded into [lat, lon] pairs when a client asks for them.
+def decode_geometry(geometry):
+    if not geometry:
+        return []
+    return [[lat, lon] for lat, lon in polyline.decode(geometry)]
+
+def encode_geometry(coords):
+    return polyline.encode([(lat, lon) for lat, lon in coords])
+
+# Route from the OSRM server as (distance_m, duration_s, steps, encoded
+# geometry), or (None, error)
+def osrm_route(origin_lat, origin_lon, dest_lat, dest_lon):
+    url = f"{OSRM_URL}/route/v1/driving/{origin_lon},{origin_lat};{dest_lon},{dest_lat}?overview=full&steps=true"
+    response = http_client.get(url)
+    if response.status_code != 200:
+        return None, f"OSRM request failed: HTTP {response.status_code}"
+
+    data = response.json()
+    if not isinstance(data, dict) or "code" not in data or data["code"] != "Ok":
+        return None, f"OSRM error: {data.get('message', 'Unknown error')}"
+
+    route = data["routes"][0]
+    steps = [
+        {
+            "instruction": step["maneuver"].get("instruction", "Proceed"),
+            "distance": f"{step['distance']/1000:.1f} km",
+            "duration": f"{step['duration']/60:.1f} mins"
+        } for step in route["legs"][0]["steps"]
+    ]
+    return (route["distance"], route["duration"], steps, route["geometry"]), None
+
+# Same shape from the offline road graph
+def local_route(origin_lat, origin_lon, dest_lat, dest_lon):
+    graph = roadgraph.get_graph(ROAD_GRAPH_PATH)
+    if graph is None:
+        return None, "Offline road graph not available"
+    found = graph.route(origin_lat, origin_lon, dest_lat, dest_lon)
+    if found is None:
+        return None, "No offline route between these points"
+    distance_m, duration_s, stretches, coords = found
+    steps = [
+        {
+            "instruction": f"Continue on {name}" if name else "Continue",
+            "distance": f"{meters/1000:.1f} km",
+            "duration": f"{seconds/60:.1f} mins"
+        } for name, meters, seconds in stretches
+    ]
+    steps.append({"instruction": "Arrive at destination", "distance": "0.0 km", "duration": "0.0 mins"})
+    return (distance_m, duration_s, steps, encode_geometry(coords)), None
+
+ROUTERS = {"osrm": osrm_route, "local": local_route}
+
+# Get directions from the first routing backend that has a route
+@metrics.span("directions")
+def get_directions(origin, destination):
+    try:
+        origin_lon, origin_lat = map(float, origin.split(','))
+        dest_lon, dest_lat = map(float, destination.split(','))
+
+        if not (-90 <= origin_lat <= 90 and -180 <= origin_lon <= 180 and
+                -90 <= dest_lat <= 90 and -180 <= dest_lon <= 180):
+            return None, "Invalid coordinate values"
+
+        if origin_lon == dest_lon and origin_lat == dest_lat:
+            return {
+                "distance": "0 km",
+                "duration": "0 mins",
+                "distance_m": 0,
+                "duration_s": 0,
+                "steps": [{"instruction": "No route needed (same location)", "distance": "0 km", "duration": "0 mins"}],
+                "geometry": encode_geometry([[origin_lat, origin_lon]]),
+                "polyline": [[origin_lat, origin_lon]]
+            }, None
+
+        cached = cache.get_route(origin_lat, origin_lon, dest_lat, dest_lon)
+        if cached is not None:
+            cache.record("route", True)
+            return build_route(*cached), None
+        cache.record("route", False)
+
+        error = "No routing backend available"
+        for backend in ROUTING_BACKENDS:
+            try:
+                result, error = ROUTERS[backend](origin_lat, origin_lon, dest_lat, dest_lon)
+            except requests.RequestException as e:
+                result, error = None, f"OSRM network error: {str(e)}"
+            if result is not None:
+                cache.put_route(origin_lat, origin_lon, dest_lat, dest_lon, *result)
+                return build_route(*result), None
+        return None, error
+    except ValueError:
+        return None, "Invalid coordinate format"
+    except requests.RequestException as e:
+        return None, f"OSRM network error: {str(e)}"
+    except Exception as e:
+        return None, f"Routing error: {str(e)}"
+
+# Insert statements are module constants so each pooled connection
+# prepares them once and reuses them from its statement cache.
+INSERT_DONATION_SQL = """
+    INSERT INTO donations (
+        user_name, user_lat, user_lon, user_address, category,
+        warehouse_name, warehouse_lat, warehouse_lon,
+        distance, duration, distance_m, duration_s, polyline, status, timestamp, date, quantity, weight, method, exp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_REQUEST_SQL = """
+    INSERT INTO requests (
+        requester_name, requester_lat, requester_lon, requester_address,
+        warehouse_name, warehouse_lat, warehouse_lon,
+        distance, duration, distance_m, duration_s, polyline, status, timestamp,
+        dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Save donation
+@metrics.span("save")
+def save_donation(user_name, user_lat, user_lon, user_address, category, warehouse, route, date, quantity, weight, method, exp):
+    timestamp = datetime.now().isoformat()
+    with db.transaction(db.DONATIONS_DB) as conn:
+        conn.execute(INSERT_DONATION_SQL, (
+            user_name, user_lat, user_lon, user_address or "", category,
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            "Pending", timestamp, date, quantity, weight, method, exp
+        ))
+
+# Save request
+@metrics.span("save")
+def save_request(requester_name, requester_lat, requester_lon, requester_address, warehouse, route, dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty):
+    timestamp = datetime.now().isoformat()
+    with db.transaction(db.REQUESTS_DB) as conn:
+        conn.execute(INSERT_REQUEST_SQL, (
+            requester_name, requester_lat, requester_lon, requester_address or "",
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            "Pending", timestamp,
+            dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty
+        ))
+
+# Background enrichment. Submissions are stored straight away with
+# status "Enriching" and a job; a worker fills in coordinates, warehouse
+# and route, then moves the row to "Pending".
+def enrich_donation(donation_id, payload):
+    row = db.get_connection(db.DONATIONS_DB).execute(
+        "SELECT user_lat, user_lon, user_address FROM donations WHERE id = ? AND status = ?",
+        (donation_id, ENRICHING)
+    ).fetchone()
+    if row is None:
+        return
+    target = {"lat": row["user_lat"], "lon": row["user_lon"], "address": row["user_address"]}
+    warehouse, route, error = enrich_row(target)
+    if error:
+        raise (jobs.PermanentError if target.get("not_found") else RuntimeError)(error)
+    with metrics.span("save"), db.transaction(db.DONATIONS_DB) as conn:
+        conn.execute("""
+            UPDATE donations SET user_lat = ?, user_lon = ?, warehouse_name = ?, warehouse_lat = ?,
+                warehouse_lon = ?, distance = ?, duration = ?, distance_m = ?, duration_s = ?, polyline = ?,
+                status = 'Pending'
+            WHERE id = ? AND status = ?
+        """, (
+            target["lat"], target["lon"], warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            donation_id, ENRICHING
+        ))
+
+def enrich_request(request_id, payload):
+    row = db.get_connection(db.REQUESTS_DB).execute(
+        "SELECT requester_lat, requester_lon, requester_address FROM requests WHERE rid = ? AND status = ?",
+        (request_id, ENRICHING)
+    ).fetchone()
+    if row is None:
+        return
+    target = {"lat": row["requester_lat"], "lon": row["requester_lon"], "address": row["requester_address"]}
+    warehouse, route, error = enrich_row(target)
+    if error:
+        raise (jobs.PermanentError if target.get("not_found") else RuntimeError)(error)
+    with metrics.span("save"), db.transaction(db.REQUESTS_DB) as conn:
+        conn.execute("""
+            UPDATE requests SET requester_lat = ?, requester_lon = ?, warehouse_name = ?, warehouse_lat = ?,
+                warehouse_lon = ?, distance = ?, duration = ?, distance_m = ?, duration_s = ?, polyline = ?,
+                status = 'Pending'
+            WHERE rid = ? AND status = ?
+        """, (
+            target["lat"], target["lon"], warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            request_id, ENRICHING
+        ))
+
+def enrich_donation_failed(donation_id, error):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        conn.execute("UPDATE donations SET status = ? WHERE id = ? AND status = ?", (ENRICH_FAILED, donation_id, ENRICHING))
+
+def enrich_request_failed(request_id, error):
+    with db.transaction(db.REQUESTS_DB) as conn:
+        conn.execute("UPDATE requests SET status = ? WHERE rid = ? AND status = ?", (ENRICH_FAILED, request_id, ENRICHING))
+
+jobs.register("enrich_donation", enrich_donation)
+jobs.register("enrich_donation.failed", enrich_donation_failed)
+jobs.register("enrich_request", enrich_request)
+jobs.register("enrich_request.failed", enrich_request_failed)
+
+# API Endpoints
+@app.route("/donate", methods=["POST"])
+def donate():
+    try:
+        row = parse_donation_row(request.get_json(silent=True) or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    timestamp = datetime.now().isoformat()
+    with metrics.span("save"), db.transaction(db.DONATIONS_DB) as conn:
+        donation_id = conn.execute(INSERT_DONATION_SQL, (
+            row["user_name"], row["lat"], row["lon"], row["address"] or "", row["category"],
+            None, None, None, None, None, None, None, None, ENRICHING, timestamp,
+            row["date"], row["quantity"], row["weight"], row["method"], row["exp"]
+        )).lastrowid
+        jobs.enqueue(conn, "enrich_donation", donation_id)
+
+    response = {
+        "message": "Donation received. Routing to the nearest warehouse is in progress.",
+        "id": donation_id,
+        "status": ENRICHING,
+        "category": row["category"],
+    }
+
+    return jsonify(response), 202, {"Location": f"/donations/{donation_id}"}
+
+@app.route("/request", methods=["POST"])
+def request_goods():
+    try:
+        row = parse_request_row(request.get_json(silent=True) or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    timestamp = datetime.now().isoformat()
+    with metrics.span("save"), db.transaction(db.REQUESTS_DB) as conn:
+        request_id = conn.execute(INSERT_REQUEST_SQL, (
+            row["requester_name"], row["lat"], row["lon"], row["address"] or "",
+            None, None, None, None, None, None, None, None, ENRICHING, timestamp,
+            *[row[column] for column in CATEGORY_QTY_COLUMNS.values()]
+        )).lastrowid
+        jobs.enqueue(conn, "enrich_request", request_id)
+
+    response = {
+        "message": "Request received. Routing to the nearest warehouse is in progress.",
+        "rid": request_id,
+        "status": ENRICHING
+    }
+
+    return jsonify(response), 202, {"Location": f"/requests/{request_id}"}
+
+# Bulk ingestion helpers. The row parsers also validate single /donate
+# and /request submissions, so both ways in accept the same input.
+# Rows come from a JSON array body, a text/csv body or a CSV file
+# uploaded as "file". Empty CSV cells are treated as missing.
+def read_bulk_rows():
+    upload = request.files.get("file")
+    if upload is not None:
+        rows = list(csv.DictReader(io.StringIO(upload.read().decode("utf-8-sig"))))
+    elif request.mimetype == "text/csv":
+        rows = list(csv.DictReader(io.StringIO(request.get_data().decode("utf-8-sig"))))
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise ValueError("Body must be a JSON array or CSV.")
+    rows = [
+        {k.strip(): v for k, v in row.items() if k and v not in ("", None)} if isinstance(row, dict) else row
+        for row in rows
+    ]
+    if not rows:
+        raise ValueError("No rows provided.")
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f"At most {BULK_MAX_ROWS} rows per upload.")
+    return rows
+
+def optional_float(data, name):
+    value = data.get(name)
+    if value is None:
+        return None
+    value = float(value)
+    if value < 0:
+        raise ValueError(f"{name} must be non-negative.")
+    return value
+
+# Pull the location out of a row: coordinates if given, otherwise an address to geocode
+def parse_location(data):
+    if "latitude" in data and "longitude" in data:
+        lat, lon = float(data["latitude"]), float(data["longitude"])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("Invalid coordinate values")
+        return lat, lon, data.get("address")
+    if data.get("address"):
+        return None, None, data["address"]
+    raise ValueError("Provide either latitude/longitude or address.")
+
+CATEGORY_NAMES = {category.casefold(): category for category in CATEGORIES}
+
+# Validate one donation row without any network calls. Raises ValueError.
+def parse_donation_row(data):
+    if not isinstance(data, dict):
+        raise ValueError("Row must be an object.")
+    # Case-insensitive, so "gia vị" is accepted as "Gia vị"
+    category = CATEGORY_NAMES.get((data.get("category") or "").strip().casefold())
+    if category is None:
+        raise ValueError(f"Invalid category. Choose from: {', '.join(CATEGORIES)}")
+    date = (data.get("date") or "").strip()
+    if date not in DATE:
+        raise ValueError(f"Invalid date. Choose from: {', '.join(DATE)}")
+    method = (data.get("method") or "").strip()
+    if method not in PSMETHOD:
+        raise ValueError(f"Invalid method. Choose from: {', '.join(PSMETHOD)}")
+    lat, lon, address = parse_location(data)
+    return {
+        "user_name": data.get("user_name") or "Anonymous",
+        "category": category,
+        "date": date,
+        "method": method,
+        "quantity": optional_float(data, "quantity"),
+        "weight": optional_float(data, "weight"),
+        "exp": data.get("exp"),
+        "lat": lat,
+        "lon": lon,
+        "address": address,
+    }
+
+def parse_request_row(data):
+    if not isinstance(data, dict):
+        raise ValueError("Row must be an object.")
+    requester_name = (data.get("requester_name") or "").strip()
+    if not requester_name:
+        raise ValueError("Requester name is required.")
+    row = {"requester_name": requester_name}
+    for column in CATEGORY_QTY_COLUMNS.values():
+        row[column] = optional_float(data, column) or 0
+    row["lat"], row["lon"], row["address"] = parse_location(data)
+    return row
+
+# Fill in a parsed row's coordinates from its address. Returns an error
+# message, or None.
+def locate_row(row):
+    if row["lat"] is None:
+        lat, lon = cached_geocode_address(row["address"])
+        if lat is None:
+            row["not_found"] = lon in GEOCODE_NOT_FOUND
+            return f"Could not geocode address: {lon}"
+        row["lat"], row["lon"] = lat, lon
+    return None
+
+# Pick a warehouse for a located row and route to it. Returns
+# (warehouse, route, error).
+def route_row(row, candidates=None, durations=None):
+    lat, lon = row["lat"], row["lon"]
+    warehouse, min_distance_km = choose_warehouse(lat, lon, candidates, durations)
+    if not warehouse:
+        return None, None, "No warehouses found."
+    route, error = get_directions(f"{lon},{lat}", f"{warehouse['lon']},{warehouse['lat']}")
+    if not route:
+        return None, None, f"Could not calculate route: {error}"
+    return warehouse, route, None
+
+# Geocode and route one parsed row. Returns (warehouse, route, error).
+def enrich_row(row):
+    error = locate_row(row)
+    if error:
+        return None, None, error
+    return route_row(row)
+
+# Validate every row up front, geocode the valid ones concurrently, pick
+# the candidate warehouses (and their drive times) for the whole batch at
+# once, route each row concurrently, then insert them in one
+# transaction. Returns one result per input row.
+def ingest_rows(rows, parse_row, insert_sql, to_values, db_path):
+    results = [None] * len(rows)
+    parsed = []
+    for index, data in enumerate(rows):
+        try:
+            parsed.append((index, parse_row(data)))
+        except (TypeError, ValueError) as e:
+            results[index] = {"row": index, "status": "error", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as pool:
+        errors = list(pool.map(metrics.bind(lambda item: locate_row(item[1])), parsed))
+        located = [row for (index, row), error in zip(parsed, errors) if not error]
+        points = [(row["lat"], row["lon"]) for row in located]
+        with metrics.span("nearest_warehouse"):
+            candidates = warehouses.nearest_batch(
+                [lat for lat, lon in points], [lon for lat, lon in points],
+                WAREHOUSE_CANDIDATES if WAREHOUSE_SELECTION == "duration" else 1
+            )
+        if WAREHOUSE_SELECTION == "duration":
+            durations = [found or {} for found in get_warehouse_durations_batch(points, candidates)]
+        else:
+            durations = [{}] * len(located)
+        routed = iter(pool.map(metrics.bind(lambda args: route_row(*args)), zip(located, candidates, durations)))
+        enriched = [(None, None, error) if error else next(routed) for error in errors]
+
+    timestamp = datetime.now().isoformat()
+    with metrics.span("save"), db.transaction(db_path) as conn:
+        for (index, row), (warehouse, route, error) in zip(parsed, enriched):
+            if error:
+                results[index] = {"row": index, "status": "error", "error": error}
+                continue
+            row_id = conn.execute(insert_sql, to_values(row, warehouse, route, timestamp)).lastrowid
+            results[index] = {
+                "row": index,
+                "status": "ok",
+                "id": row_id,
+                "warehouse": warehouse["name"],
+                "distance": route["distance"],
+                "duration": route["duration"]
+            }
+    return results
+
+def bulk_response(results):
+    inserted = sum(1 for result in results if result["status"] == "ok")
+    return jsonify({"inserted": inserted, "failed": len(results) - inserted, "results": results}), 200
+
+@app.route("/donations/bulk", methods=["POST"])
+def bulk_donations():
+    try:
+        rows = read_bulk_rows()
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = ingest_rows(
+        rows, parse_donation_row, INSERT_DONATION_SQL,
+        lambda row, warehouse, route, timestamp: (
+            row["user_name"], row["lat"], row["lon"], row["address"] or "", row["category"],
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            "Pending", timestamp, row["date"], row["quantity"], row["weight"], row["method"], row["exp"]
+        ),
+        db.DONATIONS_DB
+    )
+    return bulk_response(results)
+
+@app.route("/requests/bulk", methods=["POST"])
+def bulk_requests():
+    try:
+        rows = read_bulk_rows()
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = ingest_rows(
+        rows, parse_request_row, INSERT_REQUEST_SQL,
+        lambda row, warehouse, route, timestamp: (
+            row["requester_name"], row["lat"], row["lon"], row["address"] or "",
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            route["distance"], route["duration"], route["distance_m"], route["duration_s"], route["geometry"],
+            "Pending", timestamp, row["dry_food_qty"], row["fresh_food_qty"], row["canned_food_qty"],
+            row["milk_cold_qty"], row["spice_qty"]
+        ),
+        db.REQUESTS_DB
+    )
+    return bulk_response(results)
+
+# Listing helpers
+DONATION_FIELDS = [
+    "id", "username", "user_latitude", "user_longitude", "user_address", "category",
+    "warehouse_name", "warehouse_latitude", "warehouse_longitude", "warehouse_address",
+    "distance", "duration", "distance_m", "duration_s", "polyline", "geometry", "status", "timestamp",
+    "date", "quantity", "weight", "method", "exp"
+]
+REQUEST_FIELDS = [
+    "rid", "requester_name", "requester_latitude", "requester_longitude", "requester_address",
+    "warehouse_name", "warehouse_latitude", "warehouse_longitude", "warehouse_address",
+    "distance", "duration", "distance_m", "duration_s", "polyline", "geometry", "status", "timestamp",
+    "dry_food_qty", "fresh_food_qty", "canned_food_qty", "milk_cold_qty", "spice_qty"
+]
+
+TABLE_COLUMNS = {
+    "donations": [
+        "id", "user_name", "user_lat", "user_lon", "user_address", "category",
+        "warehouse_name", "warehouse_lat", "warehouse_lon", "distance", "duration",
+        "distance_m", "duration_s", "polyline", "status", "timestamp", "date", "quantity", "weight",
+        "method", "exp"
+    ],
+    "requests": [
+        "rid", "requester_name", "requester_lat", "requester_lon", "requester_address",
+        "warehouse_name", "warehouse_lat", "warehouse_lon", "distance", "duration",
+        "distance_m", "duration_s", "polyline", "status", "timestamp", "dry_food_qty",
+        "fresh_food_qty", "canned_food_qty", "milk_cold_qty", "spice_qty"
+    ],
+}
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(value):
+    timestamp, row_id = base64.urlsafe_b64decode(value.encode("ascii")).decode("utf-8").rsplit("|", 1)
+    return timestamp, int(row_id)
+
+# Category filters: donations store one category, requests match when
+# they ask for a non-zero amount of it
+def donation_category_clause(category):
+    return "category = ?", [category]
+
+def request_category_clause(category):
+    return f"{CATEGORY_QTY_COLUMNS[category]} > 0", []
+
+# Turn status/category/warehouse/date filters into WHERE clauses.
+# Raises ValueError with a message for bad input.
+def parse_filters(args, category_clause):
+    where = []
+    params = []
+    if args.get("status"):
+        if args["status"] not in LIST_STATUSES:
+            raise ValueError(f"Invalid status. Choose from: {', '.join(LIST_STATUSES)}")
+        where.append("status = ?")
+        params.append(args["status"])
+    if args.get("category"):
+        if args["category"] not in CATEGORIES:
+            raise ValueError(f"Invalid category. Choose from: {', '.join(CATEGORIES)}")
+        clause, value = category_clause(args["category"])
+        where.append(clause)
+        params.extend(value)
+    if args.get("warehouse"):
+        where.append("warehouse_name = ?")
+        params.append(args["warehouse"])
+    for name, column in (("max_distance_m", "distance_m"), ("max_duration_s", "duration_s")):
+        if args.get(name):
+            try:
+                value = float(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number.")
+            where.append(f"{column} <= ?")
+            params.append(value)
+    if args.get("date_from"):
+        where.append("timestamp >= ?")
+        params.append(args["date_from"])
+    if args.get("date_to"):
+        date_to = args["date_to"]
+        # A bare date includes the whole day
+        if len(date_to) == 10:
+            try:
+                date_to = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            except ValueError:
+                raise ValueError("date_to must be YYYY-MM-DD or an ISO timestamp.")
+            where.append("timestamp < ?")
+        else:
+            where.append("timestamp <= ?")
+        params.append(date_to)
+    return where, params
+
+# Route geometry is only decoded when fields= asks for it
+GEOMETRY_FIELDS = ("polyline", "geometry")
+
+def default_fields(all_fields):
+    return [f for f in all_fields if f not in GEOMETRY_FIELDS]
+
+# fields= from the query string, or `default`. Raises ValueError for
+# unknown fields.
+def parse_fields(args, all_fields, default):
+    if not args.get("fields"):
+        return default
+    fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+    unknown = [f for f in fields if f not in all_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+# Parse limit, cursor, filters and fields= from the query string into a
+# WHERE clause. Raises ValueError with a message for bad input.
+def parse_list_args(args, key, all_fields, category_clause):
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer.")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+    fields = parse_fields(args, all_fields, default_fields(all_fields))
+    where, params = parse_filters(args, category_clause)
+    if args.get("cursor"):
+        try:
+            timestamp, row_id = decode_cursor(args["cursor"])
+        except Exception:
+            raise ValueError("Invalid cursor.")
+        where.append(f"(timestamp, {key}) < (?, ?)")
+        params.extend([timestamp, row_id])
+
+    return limit, fields, where, params
+
+# Leave the polyline column out unless geometry was asked for
+def list_columns(table, fields):
+    wants_geometry = any(f in GEOMETRY_FIELDS for f in fields)
+    return ", ".join(c for c in TABLE_COLUMNS[table] if c != "polyline" or wants_geometry)
+
+# Run one keyset page: rows newest first, plus the cursor of the next page
+def fetch_page(db_path, table, key, limit, fields, where, params):
+    columns = list_columns(table, fields)
+    sql = f"SELECT {columns} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY timestamp DESC, {key} DESC LIMIT ?"
+
+    rows = db.get_connection(db_path).execute(sql, params + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1][key])
+    return rows, next_cursor
+
+# Rows changed after version `since` (up to `until`) that match the
+# listing's filters. Changed rows that were deleted or no longer match
+# come back as ids in `deleted`. Returns None if the log was pruned past
+# `since`.
+def fetch_changes(db_path, table, key, since, until, fields, where, params):
+    ids = changes.changed_ids(db_path, table, since, until)
+    if ids is None:
+        return None
+    columns = list_columns(table, fields)
+    conn = db.get_connection(db_path)
+    rows = []
+    for start in range(0, len(ids), CHANGES_CHUNK):
+        chunk = ids[start:start + CHANGES_CHUNK]
+        clauses = where + [f"{key} IN ({', '.join('?' * len(chunk))})"]
+        sql = f"SELECT {columns} FROM {table} WHERE " + " AND ".join(clauses)
+        rows.extend(conn.execute(sql, params + chunk).fetchall())
+    rows.sort(key=lambda row: (row["timestamp"] or "", row[key]), reverse=True)
+    found = {row[key] for row in rows}
+    return rows, [row_id for row_id in ids if row_id not in found]
+
+# Serve a listing. The ETag is the table's change version plus the query
+# string, so an unchanged list costs one indexed read and a 304. With
+# ?since=<version> only the rows changed after that version are returned.
+def list_response(db_path, table, key, all_fields, category_clause, to_dict):
+    try:
+        limit, fields, where, params = parse_list_args(request.args, key, all_fields, category_clause)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.args.get("since", type=int)
+    if "since" in request.args and since is None:
+        return jsonify({"error": "since must be an integer."}), 400
+
+    version = changes.version(db_path, table)
+    etag = f"{version}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        with metrics.span("query"):
+            if since is None:
+                rows, next_cursor = fetch_page(db_path, table, key, limit, fields, where, params)
+                body = {"next_cursor": next_cursor}
+            else:
+                result = fetch_changes(db_path, table, key, since, version, fields, where, params)
+                if result is None:
+                    return jsonify({"error": "Changes since that version are no longer kept; reload the list.",
+                                    "version": version}), 410
+                rows, deleted = result
+                body = {"deleted": deleted}
+        with metrics.span("serialize"):
+            body["items"] = [to_dict(row, fields) for row in rows]
+            body["version"] = version
+            response = jsonify(body)
+        metrics.inc("rows_serialized_total", len(rows), table=table)
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Serialize a donation row, resolving addresses only when asked for.
+# lookup=False leaves a missing user address empty, and a warehouse
+# address not resolved yet unset, instead of asking Nominatim.
+def donation_to_dict(row, fields, lookup=True):
+    values = {
+        "id": lambda: row["id"],
+        "username": lambda: row["user_name"],
+        "user_latitude": lambda: row["user_lat"],
+        "user_longitude": lambda: row["user_lon"],
+        "user_address": lambda: row["user_address"] or (
+            cached_reverse_geocode(row["user_lat"], row["user_lon"]) if lookup else None
+        ),
+        "category": lambda: row["category"],
+        "warehouse_name": lambda: row["warehouse_name"],
+        "warehouse_latitude": lambda: row["warehouse_lat"],
+        "warehouse_longitude": lambda: row["warehouse_lon"],
+        "warehouse_address": lambda: warehouse_address(row["warehouse_lat"], row["warehouse_lon"], lookup),
+        "distance": lambda: row["distance"],
+        "duration": lambda: row["duration"],
+        "distance_m": lambda: row["distance_m"],
+        "duration_s": lambda: row["duration_s"],
+        "polyline": lambda: decode_geometry(row["polyline"]),
+        "geometry": lambda: row["polyline"],
+        "status": lambda: row["status"],
+        "timestamp": lambda: row["timestamp"],
+        "date": lambda: row["date"],
+        "quantity": lambda: row["quantity"],
+        "weight": lambda: row["weight"],
+        "method": lambda: row["method"],
+        "exp": lambda: row["exp"],
+    }
+    return {field: values[field]() for field in fields}
+
+def request_to_dict(row, fields, lookup=True):
+    values = {
+        "rid": lambda: row["rid"],
+        "requester_name": lambda: row["requester_name"],
+        "requester_latitude": lambda: row["requester_lat"],
+        "requester_longitude": lambda: row["requester_lon"],
+        "requester_address": lambda: row["requester_address"] or (
+            cached_reverse_geocode(row["requester_lat"], row["requester_lon"]) if lookup else None
+        ),
+        "warehouse_name": lambda: row["warehouse_name"],
+        "warehouse_latitude": lambda: row["warehouse_lat"],
+        "warehouse_longitude": lambda: row["warehouse_lon"],
+        "warehouse_address": lambda: warehouse_address(row["warehouse_lat"], row["warehouse_lon"], lookup),
+        "distance": lambda: row["distance"],
+        "duration": lambda: row["duration"],
+        "distance_m": lambda: row["distance_m"],
+        "duration_s": lambda: row["duration_s"],
+        "polyline": lambda: decode_geometry(row["polyline"]),
+        "geometry": lambda: row["polyline"],
+        "status": lambda: row["status"],
+        "timestamp": lambda: row["timestamp"],
+        "dry_food_qty": lambda: row["dry_food_qty"],
+        "fresh_food_qty": lambda: row["fresh_food_qty"],
+        "canned_food_qty": lambda: row["canned_food_qty"],
+        "milk_cold_qty": lambda: row["milk_cold_qty"],
+        "spice_qty": lambda: row["spice_qty"],
+    }
+    return {field: values[field]() for field in fields}
+
+@app.route("/donations", methods=["GET"])
+def get_donations():
+    return list_response(
+        db.DONATIONS_DB, "donations", "id", DONATION_FIELDS, donation_category_clause, donation_to_dict
+    )
+
+@app.route("/requests", methods=["GET"])
+def get_requests():
+    return list_response(
+        db.REQUESTS_DB, "requests", "rid", REQUEST_FIELDS, request_category_clause, request_to_dict
+    )
+
+# Rows matching the filters in id order, read EXPORT_CHUNK at a time by
+# keyset so memory stays flat and no read snapshot is held open while a
+# slow client downloads
+def iter_rows(db_path, table, key, fields, where, params):
+    columns = list_columns(table, fields)
+    conn = db.get_connection(db_path)
+    last = None
+    while True:
+        clauses = where + ([f"{key} > ?"] if last is not None else [])
+        sql = f"SELECT {columns} FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {key} LIMIT ?"
+        rows = conn.execute(sql, params + ([last] if last is not None else []) + [EXPORT_CHUNK]).fetchall()
+        metrics.inc("rows_serialized_total", len(rows), table=table)
+        yield from rows
+        if len(rows) < EXPORT_CHUNK:
+            return
+        last = rows[-1][key]
+
+# Encode rows as CSV (header first) or NDJSON, yielding about
+# EXPORT_FLUSH_BYTES at a time. Lists (decoded polylines) go into CSV
+# cells as JSON.
+def export_lines(rows, fields, to_dict, fmt):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(fields)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    for row in rows:
+        item = to_dict(row, fields, lookup=False)
+        if fmt == "csv":
+            writer.writerow([
+                json.dumps(item[f]) if isinstance(item[f], (list, dict)) else item[f] for f in fields
+            ])
+        else:
+            buffer.write(json.dumps(item, ensure_ascii=False))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Sync flush so each chunk reaches the client as it is produced
+        yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+# Stream every row matching the listing filters (status, category,
+# warehouse, date_from, date_to) as ?format=csv (default) or ndjson, with
+# fields= picking columns and gzip=1 compressing the download. Geometry is
+# left out unless asked for.
+def export_response(db_path, table, key, all_fields, category_clause, to_dict):
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Invalid format. Choose from: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        fields = parse_fields(request.args, all_fields, default_fields(all_fields))
+        where, params = parse_filters(request.args, category_clause)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    chunks = export_lines(iter_rows(db_path, table, key, fields, where, params), fields, to_dict, fmt)
+    filename = f"{table}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    mimetype = EXPORT_FORMATS[fmt]
+    if request.args.get("gzip") in ("1", "true"):
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+@app.route("/donations/export", methods=["GET"])
+def export_donations():
+    return export_response(
+        db.DONATIONS_DB, "donations", "id", DONATION_FIELDS, donation_category_clause, donation_to_dict
+    )
+
+@app.route("/requests/export", methods=["GET"])
+def export_requests():
+    return export_response(
+        db.REQUESTS_DB, "requests", "rid", REQUEST_FIELDS, request_category_clause, request_to_dict
+    )
+
+@app.route("/donations/<int:donation_id>", methods=["GET"])
+def get_donation(donation_id):
+    row = db.get_connection(db.DONATIONS_DB).execute("SELECT * FROM donations WHERE id = ?", (donation_id,)).fetchone()
+    if not row:
+        return jsonify({"error": f"Donation {donation_id} not found."}), 404
+    return jsonify(donation_to_dict(row, [f for f in DONATION_FIELDS if f != "polyline"])), 200
+
+@app.route("/requests/<int:request_id>", methods=["GET"])
+def get_request(request_id):
+    row = db.get_connection(db.REQUESTS_DB).execute("SELECT * FROM requests WHERE rid = ?", (request_id,)).fetchone()
+    if not row:
+        return jsonify({"error": f"Request {request_id} not found."}), 404
+    return jsonify(request_to_dict(row, [f for f in REQUEST_FIELDS if f != "polyline"])), 200
+
+@app.route("/jobs/stats", methods=["GET"])
+def job_stats():
+    return jsonify(jobs.get_stats()), 200
+
+events.register("donations", db.DONATIONS_DB, "id")
+events.register("requests", db.REQUESTS_DB, "rid")
+
+# Live inserts, status changes and deletes as server-sent events.
+# ?tables=donations,requests picks the tables; reconnects resume from
+# the Last-Event-ID header.
+@app.route("/events", methods=["GET"])
+def event_stream():
+    tables = ["donations", "requests"]
+    if request.args.get("tables"):
+        tables = [t.strip() for t in request.args["tables"].split(",") if t.strip()]
+        unknown = [t for t in tables if t not in ("donations", "requests")]
+        if unknown:
+            return jsonify({"error": f"Unknown tables: {', '.join(unknown)}"}), 400
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(
+        events.stream(tables, last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Route geometry for a single record, for clients that list without it
+def get_route_geometry(db_path, table, key, row_id):
+    return db.get_connection(db_path).execute(f"SELECT polyline FROM {table} WHERE {key} = ?", (row_id,)).fetchone()
+
+@app.route("/donations/<int:donation_id>/route", methods=["GET"])
+def get_donation_route(donation_id):
+    row = get_route_geometry(db.DONATIONS_DB, "donations", "id", donation_id)
+    if not row:
+        return jsonify({"error": f"Donation {donation_id} not found."}), 404
+    if request.args.get("format") == "encoded":
+        return jsonify({"id": donation_id, "geometry": row[0]}), 200
+    return jsonify({"id": donation_id, "polyline": decode_geometry(row[0])}), 200
+
+@app.route("/requests/<int:request_id>/route", methods=["GET"])
+def get_request_route(request_id):
+    row = get_route_geometry(db.REQUESTS_DB, "requests", "rid", request_id)
+    if not row:
+        return jsonify({"error": f"Request {request_id} not found."}), 404
+    if request.args.get("format") == "encoded":
+        return jsonify({"rid": request_id, "geometry": row[0]}), 200
+    return jsonify({"rid": request_id, "polyline": decode_geometry(row[0])}), 200
+
+# Status changes. Each is one UPDATE by primary key; rows still being
+# enriched keep their status and a status that is already set is not
+# rewritten, so no-op clicks do not reach the change log. Returns
+# "updated", "unchanged", "enriching" or "not_found".
+def apply_status(conn, table, key, row_id, status):
+    updated = conn.execute(
+        f"UPDATE {table} SET status = ? WHERE {key} = ? AND status IS NOT ? AND status IS NOT ?",
+        (status, row_id, status, ENRICHING)
+    ).rowcount
+    if updated:
+        return "updated"
+    row = conn.execute(f"SELECT status FROM {table} WHERE {key} = ?", (row_id,)).fetchone()
+    if row is None:
+        return "not_found"
+    return "enriching" if row["status"] == ENRICHING else "unchanged"
+
+def status_response(db_path, table, key, row_id, label):
+    data = request.get_json(silent=True) or {}
+    status = data.get("status")
+    if status not in STATUSES:
+        return jsonify({"error": f"Invalid status. Choose from: {', '.join(STATUSES)}"}), 400
+    result = apply_status(db.get_connection(db_path), table, key, row_id, status)
+    if result == "not_found":
+        return jsonify({"error": f"{label} {row_id} not found."}), 404
+    if result == "enriching":
+        return jsonify({"error": f"{label} {row_id} is still being geocoded."}), 409
+    return jsonify({"message": f"Status for {label.lower()} {row_id} updated to {status}", "result": result}), 200
+
+@app.route("/donations/<int:donation_id>/status", methods=["POST"])
+def update_donation_status(donation_id):
+    return status_response(db.DONATIONS_DB, "donations", "id", donation_id, "Donation")
+
+@app.route("/requests/<int:request_id>/status", methods=["POST"])
+def update_request_status(request_id):
+    return status_response(db.REQUESTS_DB, "requests", "rid", request_id, "Request")
+
+# Tables by update kind, as seen from the donations connection with
+# requestlist.db attached
+STATUS_KINDS = {
+    "donation": ("main.donations", "id"),
+    "request": ("requestlist.requests", "rid"),
+}
+
+# Apply [(kind, id, status)] to both databases in one transaction
+def apply_status_batch(updates):
+    with db.transaction(db.DONATIONS_DB, attached={"requestlist": db.REQUESTS_DB}) as conn:
+        return [
+            {"kind": kind, "id": row_id, "result": apply_status(conn, *STATUS_KINDS[kind], row_id, status)}
+            for kind, row_id, status in updates
+        ]
+
+# Many status changes in one transaction: {"updates": [{"kind":
+# "donation" | "request", "id": 12, "status": "Processed"}, ...]}. The
+# whole batch is validated before anything is written. Donations and
+# requests live in separate database files that commit one after the
+# other, so the batch is atomic per kind but not across the two.
+@app.route("/status/batch", methods=["POST"])
+def update_status_batch():
+    data = request.get_json(silent=True) or {}
+    items = data.get("updates")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty \"updates\" list."}), 400
+    if len(items) > BULK_MAX_ROWS:
+        return jsonify({"error": f"At most {BULK_MAX_ROWS} updates per batch."}), 400
+    updates = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get("kind") not in STATUS_KINDS:
+            return jsonify({"error": f"Update {index}: kind must be one of {', '.join(STATUS_KINDS)}."}), 400
+        if not isinstance(item.get("id"), int) or isinstance(item["id"], bool):
+            return jsonify({"error": f"Update {index}: id must be an integer."}), 400
+        if item.get("status") not in STATUSES:
+            return jsonify({"error": f"Update {index}: status must be one of {', '.join(STATUSES)}."}), 400
+        updates.append((item["kind"], item["id"], item["status"]))
+    results = apply_status_batch(updates)
+    return jsonify({
+        "results": results,
+        "updated": sum(1 for r in results if r["result"] == "updated"),
+    }), 200
+
+# Old dashboards' endpoint, kept for donations only: admin.html called it
+# with donation ids. New clients use the per-kind endpoints.
+@app.route("/update_status/<int:id>", methods=["POST"])
+def update_status(id):
+    return update_donation_status(id)
+
+# IDs are stable: a delete is a single statement and never renumbers
+@app.route("/delete_donation/<int:donation_id>", methods=["DELETE"])
+def delete_donation(donation_id):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        deleted = conn.execute("DELETE FROM donations WHERE id = ?", (donation_id,)).rowcount
+    if not deleted:
+        return jsonify({"error": f"Donation {donation_id} not found."}), 404
+
+    return jsonify({"message": f"Donation {donation_id} deleted."}), 200
+
+@app.route("/delete_request/<int:request_id>", methods=["DELETE"])
+def delete_request(request_id):
+    with db.transaction(db.REQUESTS_DB) as conn:
+        deleted = conn.execute("DELETE FROM requests WHERE rid = ?", (request_id,)).rowcount
+    if not deleted:
+        return jsonify({"error": f"Request {request_id} not found."}), 404
+
+    return jsonify({"message": f"Request {request_id} deleted."}), 200
+
+# Delete by {"ids": [...]} or by {"filter": {status, category, warehouse,
+# date_from, date_to}} in one transaction. An empty filter is rejected so
+# a malformed call cannot wipe the table.
+def bulk_delete(db_path, table, key, category_clause, data):
+    if not isinstance(data, dict):
+        raise ValueError("Provide ids or filter.")
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("ids must be a non-empty list.")
+        try:
+            ids = [(int(row_id),) for row_id in ids]
+        except (TypeError, ValueError):
+            raise ValueError("ids must be integers.")
+        with db.transaction(db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", ids)
+            return conn.total_changes - before
+    if "filter" in data:
+        if not isinstance(data["filter"], dict):
+            raise ValueError("filter must be an object.")
+        where, params = parse_filters(data["filter"], category_clause)
+        if not where:
+            raise ValueError("filter must set at least one of status, category, warehouse, date_from, date_to.")
+        with db.transaction(db_path) as conn:
+            return conn.execute(f"DELETE FROM {table} WHERE " + " AND ".join(where), params).rowcount
+    raise ValueError("Provide ids or filter.")
+
+@app.route("/donations/bulk_delete", methods=["POST"])
+def bulk_delete_donations():
+    try:
+        deleted = bulk_delete(db.DONATIONS_DB, "donations", "id", donation_category_clause, request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"message": f"Deleted {deleted} donations.", "deleted": deleted}), 200
+
+@app.route("/requests/bulk_delete", methods=["POST"])
+def bulk_delete_requests():
+    try:
+        deleted = bulk_delete(db.REQUESTS_DB, "requests", "rid", request_category_clause, request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"message": f"Deleted {deleted} requests.", "deleted": deleted}), 200
+
+
+
+@app.route("/warehouses", methods=["GET"])
+def list_warehouses():
+    return jsonify(warehouses.all_warehouses()), 200
+
+@app.route("/warehouses", methods=["POST"])
+def add_warehouse():
+    data = request.get_json(silent=True) or {}
+    try:
+        name = data["name"].strip()
+        lat = float(data["lat"])
+        lon = float(data["lon"])
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return jsonify({"error": "Provide name, lat and lon."}), 400
+    if not name or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "Invalid name or coordinates."}), 400
+    try:
+        warehouse_id = warehouses.add(name, lat, lon)
+    except sqlite3.IntegrityError:
+        return jsonify({"error": f"Warehouse {name} already exists."}), 409
+    cache.sync_warehouses(warehouses.all_warehouses())
+    return jsonify({"id": warehouse_id, "name": name, "lat": lat, "lon": lon}), 201
+
+@app.route("/warehouses/<int:warehouse_id>", methods=["DELETE"])
+def delete_warehouse(warehouse_id):
+    if not warehouses.remove(warehouse_id):
+        return jsonify({"error": f"Warehouse {warehouse_id} not found."}), 404
+    cache.sync_warehouses(warehouses.all_warehouses())
+    return jsonify({"message": f"Warehouse {warehouse_id} deleted."}), 200
+
+# k nearest warehouses (?k=) or all within a radius (?radius_km=)
+@app.route("/warehouses/nearest", methods=["GET"])
+def nearest_warehouses():
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+        if "radius_km" in request.args:
+            hits = warehouses.within(lat, lon, float(request.args["radius_km"]))
+        else:
+            hits = warehouses.nearest(lat, lon, max(1, min(int(request.args.get("k", 1)), 100)))
+    except (KeyError, ValueError):
+        return jsonify({"error": "Provide lat, lon and optionally k or radius_km."}), 400
+    return jsonify([dict(w, distance_km=round(km, 3)) for w, km in hits]), 200
+
+# Multi-stop pickup plan for a warehouse's pending donations. The JSON
+# body may list donation_ids (default: every pending donation routed to
+# this warehouse) and a vehicle capacity in the same unit as weight.
+@app.route("/warehouses/<int:warehouse_id>/tour", methods=["POST"])
+def pickup_tour(warehouse_id):
+    warehouse = next((w for w in warehouses.all_warehouses() if w["id"] == warehouse_id), None)
+    if warehouse is None:
+        return jsonify({"error": f"Warehouse {warehouse_id} not found."}), 404
+    data = request.get_json(silent=True) or {}
+    donation_ids = data.get("donation_ids")
+    capacity = data.get("capacity")
+    if donation_ids is not None and (
+        not isinstance(donation_ids, list) or not all(isinstance(i, int) for i in donation_ids)
+    ):
+        return jsonify({"error": "donation_ids must be a list of integers."}), 400
+    if capacity is not None and (not isinstance(capacity, (int, float)) or capacity <= 0):
+        return jsonify({"error": "capacity must be a positive number."}), 400
+
+    sql = ("SELECT id, user_name, user_lat, user_lon, weight, method FROM donations "
+           "WHERE status = 'Pending' AND warehouse_name = ? AND user_lat IS NOT NULL")
+    params = [warehouse["name"]]
+    if donation_ids is not None:
+        if not donation_ids:
+            return jsonify({"error": "donation_ids is empty."}), 400
+        if len(donation_ids) > MAX_TOUR_STOPS:
+            return jsonify({"error": f"At most {MAX_TOUR_STOPS} stops per tour."}), 400
+        sql += f" AND id IN ({', '.join('?' * len(donation_ids))})"
+        params.extend(donation_ids)
+    sql += " ORDER BY id LIMIT ?"
+    rows = db.get_connection(db.DONATIONS_DB).execute(sql, params + [MAX_TOUR_STOPS + 1]).fetchall()
+    if len(rows) > MAX_TOUR_STOPS:
+        return jsonify({"error": f"More than {MAX_TOUR_STOPS} pending donations; pass donation_ids."}), 400
+
+    stops = [{
+        "donation_id": row["id"],
+        "username": row["user_name"],
+        "lat": row["user_lat"],
+        "lon": row["user_lon"],
+        "weight": row["weight"],
+        "method": row["method"],
+    } for row in rows]
+    found = {stop["donation_id"] for stop in stops}
+    plan = tours.plan_tour(warehouse, stops, capacity, OSRM_URL) if stops else {
+        "trips": [], "total_duration_s": 0, "matrix": {"cache": 0, "osrm": 0, "estimate": 0}
+    }
+    plan["warehouse"] = warehouse
+    plan["skipped"] = [i for i in donation_ids if i not in found] if donation_ids is not None else []
+    return jsonify(plan), 200
+
+# Every request is traced: its latency goes into
+# http_request_duration_seconds and, above metrics.SLOW_REQUEST_S, one
+# JSON line with the per-stage breakdown goes to the slow log. Streamed
+# bodies (exports, /events) are only timed until the response starts.
+# The trace is finished on teardown, which also runs for requests that
+# raised; those are recorded as 500s.
+@app.before_request
+def start_request_trace():
+    metrics.start_trace()
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error):
+    trace = metrics.finish_trace()
+    if trace is not None:
+        status = 500 if error is not None else g.get("response_status", 500)
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe(
+            "http_request_duration_seconds", trace["seconds"],
+            method=request.method, endpoint=endpoint, status=status
+        )
+        metrics.log_slow(
+            trace, metrics.SLOW_REQUEST_S, "slow_request",
+            method=request.method, path=request.full_path.rstrip("?"), endpoint=endpoint, status=status
+        )
+
+# Requests are sampled while capture or an on-demand profile is on; a
+# request slower than SLOW_PROFILE_MS keeps its stacks under
+# /admin/profile/slow. Teardown runs even when the request raised, so no
+# thread is left being sampled.
+@app.before_request
+def start_request_profile():
+    profiler.begin()
+
+@app.teardown_request
+def finish_request_profile(error):
+    seconds, stacks = profiler.end()
+    if stacks and SLOW_PROFILE_MS is not None and seconds * 1000 >= SLOW_PROFILE_MS:
+        profiler.save_slow(
+            request.method, request.full_path.rstrip("?"),
+            request.url_rule.rule if request.url_rule else "unmatched", seconds, stacks
+        )
+    profiler.count_request()
+
+# Each worker stores its metrics and cache hit/miss counts in cache.db
+# every METRICS_PUBLISH_S, so /metrics and /cache/stats show the sum over
+# all gunicorn workers.
+def publish_metrics():
+    while True:
+        time.sleep(METRICS_PUBLISH_S)
+        try:
+            cache.put_metrics(os.getpid(), metrics.snapshot())
+            cache.flush_stats()
+        except sqlite3.Error:
+            pass
+
+# Prometheus text format. Counters restart from zero with each worker.
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    cache.put_metrics(os.getpid(), metrics.snapshot())
+    merged = metrics.merge(cache.get_metrics(METRICS_MAX_AGE_S))
+    queued = {}
+    for kind, states in jobs.get_stats().items():
+        for state, count in states.items():
+            queued[(("kind", kind), ("state", state))] = count
+    return Response(metrics.render(merged, {"jobs": queued}), mimetype="text/plain; version=0.0.4")
+
+def admin_denied():
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return jsonify({"error": "Admin token required."}), 403
+    return None
+
+# Start an on-demand profile of every worker for {"seconds": n} (default
+# 30) or until {"requests": n} requests have finished, whichever is first
+@app.route("/admin/profile", methods=["POST"])
+def start_profile():
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get("seconds", 30))
+        max_requests = int(data["requests"]) if data.get("requests") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds and requests must be numbers."}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {PROFILE_MAX_SECONDS}."}), 400
+    if max_requests is not None and max_requests < 1:
+        return jsonify({"error": "requests must be at least 1."}), 400
+    session_id = profiler.start_session(seconds, max_requests)
+    if session_id is None:
+        return jsonify({"error": "A profile is already running."}), 409
+    return jsonify({"id": session_id, "folded": f"/admin/profile/{session_id}/folded"}), 201
+
+@app.route("/admin/profile", methods=["GET"])
+def list_profiles():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(profiler.list_profiles()), 200
+
+@app.route("/admin/profile/<int:session_id>/stop", methods=["POST"])
+def stop_profile(session_id):
+    denied = admin_denied()
+    if denied:
+        return denied
+    if not profiler.stop_session(session_id):
+        return jsonify({"error": f"Profile {session_id} is not running."}), 404
+    return jsonify({"message": f"Profile {session_id} stopped."}), 200
+
+# Folded stacks ("frame;frame;frame count" per line) for flamegraph.pl or
+# speedscope; samples from other workers arrive within a second or so
+@app.route("/admin/profile/<int:session_id>/folded", methods=["GET"])
+def get_profile(session_id):
+    denied = admin_denied()
+    if denied:
+        return denied
+    found = profiler.get_session(session_id)
+    if found is None:
+        return jsonify({"error": f"Profile {session_id} not found."}), 404
+    return Response(profiler.folded_text(found[1]), mimetype="text/plain")
+
+@app.route("/admin/profile/slow/<int:capture_id>/folded", methods=["GET"])
+def get_slow_profile(capture_id):
+    denied = admin_denied()
+    if denied:
+        return denied
+    folded = profiler.get_slow(capture_id)
+    if folded is None:
+        return jsonify({"error": f"Slow request profile {capture_id} not found."}), 404
+    return Response(folded, mimetype="text/plain")
+
+@app.route("/http/stats", methods=["GET"])
+def http_stats():
+    return jsonify(http_client.get_stats()), 200
+
+# Supply and demand totals per warehouse, category and status, read from
+# the summary tables. ?warehouse=, ?category= and ?status= narrow them.
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    category = request.args.get("category")
+    if category is not None and category not in CATEGORIES:
+        return jsonify({"error": f"Invalid category. Choose from: {', '.join(CATEGORIES)}"}), 400
+    status = request.args.get("status")
+    if status is not None and status not in LIST_STATUSES:
+        return jsonify({"error": f"Invalid status. Choose from: {', '.join(LIST_STATUSES)}"}), 400
+    return jsonify(summaries.get_stats(request.args.get("warehouse"), category, status)), 200
+
+matching.configure(CATEGORY_QTY_COLUMNS, DATE)
+
+# Proposed allocation of pending donations to pending requests. Narrow
+# with ?category= or ?warehouse=; ?full=1 recomputes it from scratch.
+@app.route("/matches", methods=["GET"])
+def get_matches():
+    category = request.args.get("category")
+    if category is not None and category not in CATEGORIES:
+        return jsonify({"error": f"Invalid category. Choose from: {', '.join(CATEGORIES)}"}), 400
+    full = request.args.get("full") in ("1", "true")
+    return jsonify(matching.get_matches(category, request.args.get("warehouse"), full)), 200
+
+# flask --app app build-road-graph hcmc.osm
+@app.cli.command("build-road-graph")
+@click.argument("osm_path")
+def build_road_graph(osm_path):
+    nodes, edges = roadgraph.build(osm_path, ROAD_GRAPH_PATH)
+    print(f"Road graph written to {ROAD_GRAPH_PATH}: {nodes} nodes, {edges} edges.")
+
+# flask --app app build-gazetteer hcmc.osm   (or an address dump .csv
+# with name, kind, lat, lon columns)
+@app.cli.command("build-gazetteer")
+@click.argument("source_path")
+def build_gazetteer(source_path):
+    entries, tokens = gazetteer.build(source_path, GAZETTEER_PATH)
+    print(f"Gazetteer written to {GAZETTEER_PATH}: {entries} entries, {tokens} tokens.")
+
+# flask --app app rebuild-summaries
+@app.cli.command("rebuild-summaries")
+def rebuild_summaries():
+    summaries.rebuild(CATEGORY_QTY_COLUMNS)
+    print("Summaries rebuilt.")
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(cache.get_stats()), 200
+
+@app.route("/cache/routes/invalidate", methods=["POST"])
+def invalidate_routes():
+    deleted = cache.clear_routes()
+    return jsonify({"message": f"Cleared {deleted} cached routes."}), 200
+
+@app.route("/admin")
+def admin_dashboard():
+    return render_template("admin.html")
+
+@app.route("/admin_requester")
+def admin_requester_dashboard():
+    return render_template("admin_requester.html")
+
+@app.route("/test_donate", methods=["GET", "POST"])
+def test_donate():
+    if request.method == "GET":
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD)
+    
+    date = request.form.get("date")
+    category = request.form.get("category")
+    exp = request.form.get("exp")
+    method = request.form.get("method")
+    user_address = request.form.get("address")
+    user_name = request.form.get("user_name", "Anonymous")
+    quantity = request.form.get("quantity")    
+    weight = request.form.get("weight")    
+    
+    if not category or not user_address:
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+                              error="Please provide category and address.")
+    
+    if category not in CATEGORIES:
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+                              error=f"Invalid category. Choose from: {', '.join(CATEGORIES)}")
+    
+    user_lat, user_lon = cached_geocode_address(user_address)
+    if user_lat is None:
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+                              error=f"Could not geocode address: {user_lon}")
+    
+    warehouse, min_distance_km = choose_warehouse(user_lat, user_lon)
+    if not warehouse:
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+                              error="No warehouses found.")
+    
+    origin = f"{user_lon},{user_lat}"
+    destination = f"{warehouse['lon']},{warehouse['lat']}"
+    route, error = get_directions(origin, destination)
+    
+    if not route:
+        return render_template("test_donate.html", categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+                              error=f"Could not calculate route: {error}")
+    
+    distance = route["distance"]
+    
+    save_donation(user_name, user_lat, user_lon, user_address, category, warehouse, route, date, quantity, weight, method, exp)
+    
+    return render_template(
+        "test_donate.html",
+        categories=CATEGORIES, dates=DATE, methods=PSMETHOD,
+        success=f"Donation submitted! Category: {category}, Warehouse: {warehouse['name']}, Distance: {distance}"
+    )
+
+@app.route("/test_donate_requester", methods=["GET", "POST"])
+def test_donate_requester():
+    if request.method == "GET":
+        return render_template("test_donate_requester.html")
+    
+    requester_name = request.form.get("requester_name")
+    requester_address = request.form.get("requester_address")
+    dry_food_qty = request.form.get("dry_food_qty")  # Map to Thực phẩm khô
+    fresh_food_qty = request.form.get("fresh_food_qty")  # Map to Tươi sống
+    canned_food_qty = request.form.get("canned_food_qty")  # Map to Đồ hộp
+    milk_cold_qty = request.form.get("milk_cold_qty")  # Map to Sữa/ Đồ lạnh
+    spice_qty = request.form.get("spice_qty")  # Map to Gia vị
+
+    if not requester_name or not requester_address:
+        return render_template("test_donate_requester.html",
+                              error="Please provide requester name and address.")
+    
+    try:
+        dry_food_qty = float(dry_food_qty) if dry_food_qty else 0
+        fresh_food_qty = float(fresh_food_qty) if fresh_food_qty else 0
+        canned_food_qty = float(canned_food_qty) if canned_food_qty else 0
+        milk_cold_qty = float(milk_cold_qty) if milk_cold_qty else 0
+        spice_qty = float(spice_qty) if spice_qty else 0
+        if dry_food_qty < 0 or fresh_food_qty < 0 or canned_food_qty < 0 or milk_cold_qty < 0 or spice_qty < 0:
+            return render_template("test_donate_requester.html",
+                                  error="Quantities must be non-negative.")
+    except ValueError:
+        return render_template("test_donate_requester.html",
+                              error="Quantities must be numbers.")
+    
+    requester_lat, requester_lon = cached_geocode_address(requester_address)
+    if requester_lat is None:
+        return render_template("test_donate_requester.html",
+                              error=f"Could not geocode address: {requester_lon}")
+    
+    warehouse, min_distance_km = choose_warehouse(requester_lat, requester_lon)
+    if not warehouse:
+        return render_template("test_donate_requester.html",
+                              error="No warehouses found.")
+    
+    origin = f"{requester_lon},{requester_lat}"
+    destination = f"{warehouse['lon']},{warehouse['lat']}"
+    route, error = get_directions(origin, destination)
+    
+    if not route:
+        return render_template("test_donate_requester.html",
+                              error=f"Could not calculate route: {error}")
+    
+    distance = route["distance"]
+    
+    save_request(requester_name, requester_lat, requester_lon, requester_address, warehouse, route, dry_food_qty, fresh_food_qty, canned_food_qty, milk_cold_qty, spice_qty)
+    
+    return render_template(
+        "test_donate_requester.html",
+        success=f"Request submitted! Warehouse: {warehouse['name']}, Distance: {distance}"
+    )
+
+setup_database()
+cache.setup_cache()
+profiler.setup_profiler()
+cache.sync_warehouses(warehouses.all_warehouses())
+# Resolve warehouse addresses in the background so a slow Nominatim
+# does not hold up worker startup; listings fall back to the cache.
+threading.Thread(target=load_warehouse_addresses, daemon=True).start()
+threading.Thread(target=publish_metrics, daemon=True).start()
+profiler.start(SLOW_PROFILE_MS is not None)
+jobs.start_workers(ENRICH_WORKERS)
+
+if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import polyline
+
+# Stand-ins for Nominatim (/search, /reverse) and OSRM (/route, /table)
+# so benchmarks never touch the public services. Answers are
+# deterministic: an address always geocodes to the same point inside Ho
+# Chi Minh City, and routes are straight lines at city speed. Every
+# response waits --latency-ms (plus up to --jitter-ms) and fails with a
+# 503 at --error-rate.
+#
+#   python bench/fake_services.py --port 8090 --latency-ms 80 --error-rate 0.01
+#
+# then start the app with
+#   NOMINATIM_URL=http://127.0.0.1:8090/search
+#   NOMINATIM_REVERSE_URL=http://127.0.0.1:8090/reverse
+#   OSRM_URL=http://127.0.0.1:8090
+BOUNDS = (10.70, 10.88, 106.60, 106.80)   # lat min/max, lon min/max
+SPEED_MPS = 25 / 3.6
+ROAD_FACTOR = 1.3
+
+def _meters(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h)) * ROAD_FACTOR
+
+def geocode(query):
+    digest = hashlib.sha1(query.strip().lower().encode("utf-8")).digest()
+    a = int.from_bytes(digest[:4], "big") / 2 ** 32
+    b = int.from_bytes(digest[4:8], "big") / 2 ** 32
+    return BOUNDS[0] + a * (BOUNDS[1] - BOUNDS[0]), BOUNDS[2] + b * (BOUNDS[3] - BOUNDS[2])
+
+def reverse(lat, lon):
+    number = int(abs(lat * 1e5)) % 500 + 1
+    street = int(abs(lon * 1e3)) % 40 + 1
+    district = int(abs(lat * 1e2)) % 12 + 1
+    return f"{number} Đường số {street}, Quận {district}, Thành phố Hồ Chí Minh, Việt Nam"
+
+def _coordinates(path):
+    # /route/v1/driving/lon,lat;lon,lat
+    text = path.rsplit("/", 1)[-1]
+    return [tuple(reversed([float(v) for v in pair.split(",")])) for pair in text.split(";")]
+
+def route(points):
+    (lat1, lon1), (lat2, lon2) = points[0], points[-1]
+    meters = _meters(lat1, lon1, lat2, lon2)
+    seconds = meters / SPEED_MPS
+    middle = (lat1, lon2)
+    steps = [
+        {"distance": meters / 2, "duration": seconds / 2, "maneuver": {"instruction": "Head north"}},
+        {"distance": meters / 2, "duration": seconds / 2, "maneuver": {"instruction": "Turn right"}},
+        {"distance": 0, "duration": 0, "maneuver": {"instruction": "Arrive"}},
+    ]
+    return {
+        "code": "Ok",
+        "routes": [{
+            "distance": meters,
+            "duration": seconds,
+            "geometry": polyline.encode([(lat1, lon1), middle, (lat2, lon2)]),
+            "legs": [{"steps": steps}],
+        }],
+    }
+
+def _indices(value, count):
+    if not value or value == "all":
+        return list(range(count))
+    return [int(v) for v in value.split(";")]
+
+def table(points, params):
+    sources = _indices(params.get("sources", [""])[0], len(points))
+    destinations = _indices(params.get("destinations", [""])[0], len(points))
+    return {
+        "code": "Ok",
+        "durations": [
+            [_meters(*points[i], *points[j]) / SPEED_MPS for j in destinations] for i in sources
+        ],
+    }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = {"latency_ms": 0, "jitter_ms": 0, "error_rate": 0.0}
+    random = random.Random(0)
+    lock = threading.Lock()
+    counts = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        kind = url.path.strip("/").split("/")[0] or "root"
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            delay = (self.config["latency_ms"] + self.random.random() * self.config["jitter_ms"]) / 1000
+            fail = self.random.random() < self.config["error_rate"]
+        time.sleep(delay)
+        if fail:
+            return self._send(503, {"code": "Unavailable", "message": "Injected failure"})
+        if kind == "search":
+            lat, lon = geocode(params.get("q", [""])[0])
+            return self._send(200, [{"lat": str(lat), "lon": str(lon), "display_name": params.get("q", [""])[0]}])
+        if kind == "reverse":
+            lat, lon = float(params["lat"][0]), float(params["lon"][0])
+            return self._send(200, {"display_name": reverse(lat, lon)})
+        if kind == "route":
+            return self._send(200, route(_coordinates(url.path)))
+        if kind == "table":
+            return self._send(200, table(_coordinates(url.path), params))
+        if kind == "stats":
+            with self.lock:
+                return self._send(200, dict(self.counts))
+        self._send(404, {"code": "NotFound", "message": url.path})
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients dropping keep-alive connections at shutdown are not errors
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+# Start the fake services in a background thread; returns the server
+def serve(port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=0):
+    Handler.config = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate}
+    Handler.random = random.Random(seed)
+    Handler.counts = {}
+    server = Server(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Nominatim and OSRM for benchmarks")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"Fake Nominatim/OSRM listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+# Load driver for a running server. Worker threads pick operations from a
+# weighted mix until the time is up, and the report gives throughput and
+# latency percentiles per endpoint, saved as JSON so runs can be compared:
+#
+#   python bench/load.py run --base-url http://127.0.0.1:5000 --duration 60 --out after.json
+#   python bench/load.py compare before.json after.json
+DEFAULT_MIX = {
+    "donate": 5, "request": 5, "donations": 35, "requests": 25,
+    "update_status": 20, "delete_donation": 5, "delete_request": 5,
+}
+LIST_FIELDS = {
+    "donations": "id,username,user_address,category,warehouse_name,distance,duration,status,timestamp,quantity",
+    "requests": "rid,requester_name,requester_address,warehouse_name,distance,duration,status,timestamp",
+}
+STATUSES = ["Pending", "Processed", "Picked Up"]
+CATEGORIES = ["Thực phẩm khô", "Tươi sống", "Đồ hộp", "Sữa/ Đồ lạnh", "Gia vị"]
+DATES = ["Trong ngày", "Trong tuần", "Trong tháng", "Trên 6 tháng"]
+METHODS = ["Bình thường", "Cần kho mát", "Đông lạnh"]
+ID_POOL = 5000                         # existing ids fetched per table for updates and deletes
+BOUNDS = (10.70, 10.88, 106.60, 106.80)
+
+def _ids(session, base_url, table, key):
+    ids, cursor = [], None
+    while len(ids) < ID_POOL:
+        params = {"limit": 500, "fields": key}
+        if cursor:
+            params["cursor"] = cursor
+        body = session.get(f"{base_url}/{table}", params=params, timeout=30).json()
+        ids.extend(item[key] for item in body["items"])
+        cursor = body.get("next_cursor")
+        if not cursor:
+            break
+    return ids
+
+class Pools:
+    def __init__(self, donations, requests_):
+        self.lock = threading.Lock()
+        self.donations = donations
+        self.requests = requests_
+
+    def pick(self, rng, name):
+        with self.lock:
+            pool = getattr(self, name)
+            return rng.choice(pool) if pool else None
+
+    def take(self, rng, name):
+        with self.lock:
+            pool = getattr(self, name)
+            if not pool:
+                return None
+            i = rng.randrange(len(pool))
+            pool[i], pool[-1] = pool[-1], pool[i]
+            return pool.pop()
+
+def _location(rng):
+    if rng.random() < 0.5:
+        return {"address": f"{rng.randint(1, 500)} Đường số {rng.randint(1, 40)}, Quận {rng.randint(1, 12)}"}
+    return {"latitude": rng.uniform(BOUNDS[0], BOUNDS[1]), "longitude": rng.uniform(BOUNDS[2], BOUNDS[3])}
+
+# One call of operation `name` as (method, path, json body, params),
+# or None when there is nothing left to act on
+def build_call(name, rng, pools):
+    if name == "donate":
+        return "POST", "/donate", dict(_location(rng), **{
+            "user_name": "bench", "category": rng.choice(CATEGORIES), "date": rng.choice(DATES),
+            "method": rng.choice(METHODS), "quantity": rng.randint(1, 20), "weight": round(rng.uniform(1, 30), 1),
+        }), None
+    if name == "request":
+        return "POST", "/request", dict(_location(rng), **{
+            "requester_name": "bench", "dry_food_qty": rng.randint(0, 10), "spice_qty": rng.randint(0, 3),
+        }), None
+    if name in ("donations", "requests"):
+        params = {"limit": 50, "fields": LIST_FIELDS[name]}
+        if rng.random() < 0.5:
+            params["status"] = rng.choice(STATUSES)
+        return "GET", f"/{name}", None, params
+    if name == "update_status":
+        row_id = pools.pick(rng, "donations")
+        if row_id is None:
+            return None
+        return "POST", f"/donations/{row_id}/status", {"status": rng.choice(STATUSES)}, None
+    if name == "delete_donation":
+        row_id = pools.take(rng, "donations")
+        return None if row_id is None else ("DELETE", f"/delete_donation/{row_id}", None, None)
+    if name == "delete_request":
+        row_id = pools.take(rng, "requests")
+        return None if row_id is None else ("DELETE", f"/delete_request/{row_id}", None, None)
+    raise ValueError(f"Unknown operation {name}")
+
+def _worker(base_url, mix, seed, deadline, pools, samples):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    while time.time() < deadline:
+        name = rng.choices(names, weights=weights)[0]
+        call = build_call(name, rng, pools)
+        if call is None:
+            continue
+        method, path, body, params = call
+        started = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, json=body, params=params, timeout=60).status_code
+        except requests.RequestException:
+            status = 0
+        samples.append((name, time.perf_counter() - started, status))
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(samples, elapsed):
+    groups = {}
+    for name, seconds, status in samples:
+        groups.setdefault(name, []).append((seconds, status))
+    groups["total"] = [(seconds, status) for _, seconds, status in samples]
+    report = {}
+    for name, items in sorted(groups.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in items)
+        report[name] = {
+            "count": len(items),
+            "throughput_rps": round(len(items) / elapsed, 2),
+            "errors": sum(1 for _, status in items if status == 0 or status >= 500),
+            "client_errors": sum(1 for _, status in items if 400 <= status < 500),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+    return report
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+# Drive `base_url` with `concurrency` threads for `duration` seconds and
+# return the report
+def run_load(base_url, duration=30, concurrency=8, mix=None, seed=0, label=None):
+    mix = dict(mix or DEFAULT_MIX)
+    session = requests.Session()
+    pools = Pools(_ids(session, base_url, "donations", "id"), _ids(session, base_url, "requests", "rid"))
+    samples = []
+    started = time.time()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=_worker, args=(base_url, mix, seed * 1000 + i, deadline, pools, samples))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    return {
+        "label": label,
+        "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": {"base_url": base_url, "duration": duration, "concurrency": concurrency, "mix": mix, "seed": seed},
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": summarize(samples, elapsed),
+    }
+
+# Side-by-side p50/p95/p99 and throughput of two reports. Returns the
+# endpoints whose p95 got worse by more than `threshold` (a fraction).
+def compare(before, after, threshold=0.10):
+    regressions = []
+    print(f"{'endpoint':<16}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>18}")
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        a, b = before["endpoints"].get(name), after["endpoints"].get(name)
+        if not a or not b:
+            print(f"{name:<16}{'(missing in one run)':>18}")
+            continue
+        cells = "".join(
+            f"{a[metric]:>8.1f} ->{b[metric]:>7.1f}" for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+        )
+        flag = ""
+        if a["p95_ms"] and (b["p95_ms"] - a["p95_ms"]) / a["p95_ms"] > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<16}{cells}{flag}")
+    return regressions
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load driver")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run")
+    run.add_argument("--base-url", default="http://127.0.0.1:5000")
+    run.add_argument("--duration", type=float, default=30)
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--mix", type=_parse_mix, help="e.g. donations=50,update_status=50")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--label")
+    run.add_argument("--out", help="write the JSON report here")
+    diff = commands.add_parser("compare")
+    diff.add_argument("before")
+    diff.add_argument("after")
+    diff.add_argument("--threshold", type=float, default=0.10, help="allowed p95 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+
+    report = run_load(args.base_url, args.duration, args.concurrency, args.mix, args.seed, args.label)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import fake_services
+import load
+
+# One benchmark run end to end: fake upstreams, a seeded data directory,
+# the app under gunicorn (or the Flask dev server) pointed at both, and
+# the load driver. The report JSON also records the seed sizes and the
+# fake latency settings.
+#
+#   python bench/run.py --donations 100000 --requests 50000 --duration 60 --out results/main.json
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT_S = 60
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _start_server(server, port, env):
+    if server == "gunicorn":
+        command = ["gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+def _wait_ready(base_url, process):
+    deadline = time.time() + STARTUP_TIMEOUT_S
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/warehouses", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("Server did not become ready")
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed, serve and load-test the app against fake upstreams")
+    parser.add_argument("--donations", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--data-dir", help="reuse this seeded directory instead of a fresh temporary one")
+    parser.add_argument("--server", choices=["gunicorn", "flask"], default="gunicorn")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    fakes = fake_services.serve(0, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    fake_url = f"http://127.0.0.1:{fakes.server_address[1]}"
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="webapp-bench-")
+    counts = None
+    if not args.data_dir:
+        # Seed in a child process so this one never imports the app
+        subprocess.run([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed.py"),
+            "--data-dir", data_dir, "--donations", str(args.donations),
+            "--requests", str(args.requests), "--seed", str(args.seed),
+        ], check=True)
+        counts = {"donations": args.donations, "requests": args.requests}
+
+    port = _free_port()
+    env = dict(
+        os.environ, DATA_DIR=data_dir, OSRM_URL=fake_url,
+        NOMINATIM_URL=f"{fake_url}/search", NOMINATIM_REVERSE_URL=f"{fake_url}/reverse",
+    )
+    process = _start_server(args.server, port, env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base_url, process)
+        report = load.run_load(base_url, args.duration, args.concurrency, seed=args.seed, label=args.label)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        fakes.shutdown()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report["config"].update(
+        server=args.server, seeded=counts, upstream={
+            "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+            "calls": fake_services.Handler.counts,
+        }
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<16} {stats['count']:>7} req {stats['throughput_rps']:>8.1f}/s  "
+              f"p50 {stats['p50_ms']:>7.1f}  p95 {stats['p95_ms']:>7.1f}  p99 {stats['p99_ms']:>7.1f} ms  "
+              f"errors {stats['errors']}")
+    print(f"Report written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Fill donations.db and requestlist.db in a data directory with seeded,
+# realistic rows (10k to 1M each) for benchmarks. The schema comes from
+# the app itself, and rows go through the normal triggers, so the change
+# log and summary tables match what production would have.
+#
+#   python bench/seed.py --data-dir /tmp/bench --donations 100000 --requests 50000
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH = 10000
+DAYS = 180
+STATUS_WEIGHTS = {"Pending": 60, "Processed": 25, "Picked Up": 15}
+BOUNDS = (10.70, 10.88, 106.60, 106.80)
+
+def _load_app(data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ["DATA_DIR"] = data_dir
+    # Never reach the public services while seeding
+    for name in ("NOMINATIM_URL", "NOMINATIM_REVERSE_URL", "OSRM_URL"):
+        os.environ.setdefault(name, "http://127.0.0.1:9")
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+def _route(app, lat, lon):
+    warehouse, km = app.find_nearest_warehouse(lat, lon)
+    meters = km * 1000 * 1.3
+    seconds = meters / (25 / 3.6)
+    geometry = app.encode_geometry([(lat, lon), (warehouse["lat"], warehouse["lon"])])
+    return warehouse, f"{meters/1000:.1f} km", f"{seconds/60:.1f} mins", meters, seconds, geometry
+
+def _common(app, rng, now):
+    lat = rng.uniform(BOUNDS[0], BOUNDS[1])
+    lon = rng.uniform(BOUNDS[2], BOUNDS[3])
+    status = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+    timestamp = (now - timedelta(seconds=rng.uniform(0, DAYS * 86400))).isoformat()
+    return lat, lon, _route(app, lat, lon), status, timestamp
+
+def donation_rows(app, rng, count, now):
+    for i in range(count):
+        lat, lon, (warehouse, distance, duration, meters, seconds, geometry), status, timestamp = _common(app, rng, now)
+        exp = (now + timedelta(days=rng.randint(1, 365))).strftime("%Y-%m-%d") if rng.random() < 0.5 else ""
+        yield (
+            f"donor{i}", lat, lon, f"{rng.randint(1, 500)} Đường số {rng.randint(1, 40)}", rng.choice(app.CATEGORIES),
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            distance, duration, meters, seconds, geometry, status, timestamp,
+            rng.choice(app.DATE), rng.randint(1, 50), round(rng.uniform(0.5, 40), 1), rng.choice(app.PSMETHOD), exp
+        )
+
+def request_rows(app, rng, count, now):
+    columns = list(app.CATEGORY_QTY_COLUMNS.values())
+    for i in range(count):
+        lat, lon, (warehouse, distance, duration, meters, seconds, geometry), status, timestamp = _common(app, rng, now)
+        wanted = set(rng.sample(columns, rng.randint(1, 3)))
+        yield (
+            f"requester{i}", lat, lon, f"{rng.randint(1, 500)} Đường số {rng.randint(1, 40)}",
+            warehouse["name"], warehouse["lat"], warehouse["lon"],
+            distance, duration, meters, seconds, geometry, status, timestamp,
+            *[rng.randint(1, 30) if column in wanted else 0 for column in columns]
+        )
+
+def _insert(db, db_path, sql, rows):
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            with db.transaction(db_path) as conn:
+                conn.executemany(sql, batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        with db.transaction(db_path) as conn:
+            conn.executemany(sql, batch)
+        inserted += len(batch)
+    return inserted
+
+def seed(data_dir, donations, requests, seed_value=0, reset=False):
+    if reset:
+        for name in ("donations.db", "requestlist.db", "cache.db"):
+            for suffix in ("", "-wal", "-shm"):
+                path = os.path.join(data_dir, name + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+    app = _load_app(data_dir)
+    import db
+    rng = random.Random(seed_value)
+    now = datetime(2026, 1, 1)
+    started = time.time()
+    counts = {
+        "donations": _insert(db, db.DONATIONS_DB, app.INSERT_DONATION_SQL, donation_rows(app, rng, donations, now)),
+        "requests": _insert(db, db.REQUESTS_DB, app.INSERT_REQUEST_SQL, request_rows(app, rng, requests, now)),
+    }
+    for path in (db.DONATIONS_DB, db.REQUESTS_DB):
+        db.get_connection(path).execute("ANALYZE")
+    counts["seconds"] = round(time.time() - started, 1)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed benchmark databases")
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--donations", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="delete existing databases first")
+    args = parser.parse_args()
+    counts = seed(args.data_dir, args.donations, args.requests, args.seed, args.reset)
+    print(f"Seeded {counts['donations']} donations and {counts['requests']} requests "
+          f"in {args.data_dir} ({counts['seconds']} s).")
+
+if __name__ == "__main__":
+    main()
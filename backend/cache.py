@@ -0,0 +1,414 @@
+import hashlib
+import json
+import math
+import os
+import re
+import time
+import threading
+import unicodedata
+
+import db
+import metrics
+
+CACHE_DB = os.path.join(db.DATA_DIR, "cache.db")
+
+# Reverse geocode cache configuration
+REVERSE_PRECISION = 5                  # decimal places kept in the key (~1 m)
+REVERSE_TTL = 30 * 24 * 3600           # seconds before an address is looked up again
+REVERSE_FAILURE_TTL = 10 * 60          # seconds before a failed lookup is tried again
+REVERSE_MAX_ENTRIES = 20000            # rows kept before the oldest are evicted
+EVICT_EVERY = 100                      # writes between size checks
+
+# Forward geocode cache configuration
+FORWARD_TTL = 90 * 24 * 3600
+FORWARD_MAX_ENTRIES = 50000
+
+# Route cache configuration
+ROUTE_GRID_METERS = 50                 # origins within one grid cell share a route
+ROUTE_TTL = 7 * 24 * 3600
+ROUTE_MAX_ENTRIES = 50000
+TRAVEL_TIME_MAX_ENTRIES = 500000       # cell-to-cell drive times for pickup tours
+
+_writes = 0
+
+def setup_cache():
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reverse_geocode (
+                lat_key INTEGER,
+                lon_key INTEGER,
+                address TEXT,
+                created_at REAL,
+                PRIMARY KEY (lat_key, lon_key)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reverse_geocode_created ON reverse_geocode (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS forward_geocode (
+                address_key TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                created_at REAL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_forward_geocode_created ON forward_geocode (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS routes (
+                lat_cell INTEGER,
+                lon_cell INTEGER,
+                dest_key TEXT,
+                distance_m REAL,
+                duration_s REAL,
+                steps TEXT,
+                geometry TEXT,
+                created_at REAL,
+                PRIMARY KEY (lat_cell, lon_cell, dest_key)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_routes_created ON routes (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS durations (
+                lat_cell INTEGER,
+                lon_cell INTEGER,
+                durations TEXT,
+                created_at REAL,
+                PRIMARY KEY (lat_cell, lon_cell)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS travel_times (
+                src_lat INTEGER,
+                src_lon INTEGER,
+                dst_lat INTEGER,
+                dst_lon INTEGER,
+                duration_s REAL,
+                created_at REAL,
+                PRIMARY KEY (src_lat, src_lon, dst_lat, dst_lon)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_travel_times_created ON travel_times (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                host TEXT PRIMARY KEY,
+                next_at REAL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                hits INTEGER DEFAULT 0,
+                misses INTEGER DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_snapshots (
+                pid INTEGER PRIMARY KEY,
+                snapshot TEXT,
+                updated_at REAL
+            )
+        """)
+
+def _coord_key(lat, lon, precision):
+    scale = 10 ** precision
+    return int(round(float(lat) * scale)), int(round(float(lon) * scale))
+
+# Cached address, "" for a lookup that failed less than
+# REVERSE_FAILURE_TTL ago, or None when Nominatim should be asked
+def get_reverse(lat, lon):
+    lat_key, lon_key = _coord_key(lat, lon, REVERSE_PRECISION)
+    now = time.time()
+    row = db.get_connection(CACHE_DB).execute(
+        "SELECT address, created_at FROM reverse_geocode WHERE lat_key = ? AND lon_key = ? AND created_at > ?",
+        (lat_key, lon_key, now - REVERSE_TTL)
+    ).fetchone()
+    if row is None:
+        return None
+    if row[0] is None:
+        return "" if row[1] > now - REVERSE_FAILURE_TTL else None
+    return row[0]
+
+# address=None records a failed lookup
+def put_reverse(lat, lon, address):
+    global _writes
+    lat_key, lon_key = _coord_key(lat, lon, REVERSE_PRECISION)
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO reverse_geocode (lat_key, lon_key, address, created_at) VALUES (?, ?, ?, ?)",
+            (lat_key, lon_key, address, time.time())
+        )
+        _writes += 1
+        if _writes % EVICT_EVERY == 0:
+            _evict_reverse(conn)
+
+# Drop expired rows, then the oldest rows beyond REVERSE_MAX_ENTRIES
+def _evict_reverse(conn):
+    conn.execute("DELETE FROM reverse_geocode WHERE created_at <= ?", (time.time() - REVERSE_TTL,))
+    conn.execute("""
+        DELETE FROM reverse_geocode WHERE created_at <= (
+            SELECT created_at FROM reverse_geocode ORDER BY created_at DESC LIMIT 1 OFFSET ?
+        )
+    """, (REVERSE_MAX_ENTRIES,))
+
+# Vietnamese address normalization. Abbreviations are expanded after
+# diacritics are folded, so "Q.1", "q 1" and "Quận 1" share one key.
+ABBREVIATIONS = {
+    "q": "quan",
+    "p": "phuong",
+    "tx": "thi xa",
+    "tp": "thanh pho",
+    "tphcm": "thanh pho ho chi minh",
+    "hcm": "ho chi minh",
+    "hcmc": "ho chi minh",
+    "d": "duong",
+}
+
+def fold_diacritics(text):
+    text = text.replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+def normalize_address(address):
+    text = fold_diacritics(address or "").lower()
+    # Split "q.1" / "p12" style abbreviations away from their numbers
+    text = re.sub(r"\b(q|p|tp|tx|d)\.?\s*(\d+)", r"\1 \2", text)
+    tokens = re.sub(r"[^a-z0-9/]+", " ", text).split()
+    return " ".join(ABBREVIATIONS.get(token, token) for token in tokens)
+
+def get_forward(address_key):
+    row = db.get_connection(CACHE_DB).execute(
+        "SELECT lat, lon FROM forward_geocode WHERE address_key = ? AND created_at > ?",
+        (address_key, time.time() - FORWARD_TTL)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def put_forward(address_key, lat, lon):
+    global _writes
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO forward_geocode (address_key, lat, lon, created_at) VALUES (?, ?, ?, ?)",
+            (address_key, lat, lon, time.time())
+        )
+        _writes += 1
+        if _writes % EVICT_EVERY == 0:
+            _evict_forward(conn)
+
+def _evict_forward(conn):
+    conn.execute("DELETE FROM forward_geocode WHERE created_at <= ?", (time.time() - FORWARD_TTL,))
+    conn.execute("""
+        DELETE FROM forward_geocode WHERE created_at <= (
+            SELECT created_at FROM forward_geocode ORDER BY created_at DESC LIMIT 1 OFFSET ?
+        )
+    """, (FORWARD_MAX_ENTRIES,))
+
+# Snap an origin to a grid of roughly ROUTE_GRID_METERS square cells
+def _grid_cell(lat, lon):
+    lat_step = ROUTE_GRID_METERS / 111320.0
+    lat_cell = int(round(lat / lat_step))
+    lon_step = ROUTE_GRID_METERS / (111320.0 * max(math.cos(math.radians(lat_cell * lat_step)), 0.01))
+    return lat_cell, int(round(lon / lon_step))
+
+def _dest_key(lat, lon):
+    return f"{lat:.6f},{lon:.6f}"
+
+# Cached route as (distance_m, duration_s, steps, encoded geometry), None on miss
+def get_route(origin_lat, origin_lon, dest_lat, dest_lon):
+    lat_cell, lon_cell = _grid_cell(origin_lat, origin_lon)
+    row = db.get_connection(CACHE_DB).execute(
+        "SELECT distance_m, duration_s, steps, geometry FROM routes "
+        "WHERE lat_cell = ? AND lon_cell = ? AND dest_key = ? AND created_at > ?",
+        (lat_cell, lon_cell, _dest_key(dest_lat, dest_lon), time.time() - ROUTE_TTL)
+    ).fetchone()
+    if not row:
+        return None
+    return row[0], row[1], json.loads(row[2]), row[3]
+
+def put_route(origin_lat, origin_lon, dest_lat, dest_lon, distance_m, duration_s, steps, geometry):
+    global _writes
+    lat_cell, lon_cell = _grid_cell(origin_lat, origin_lon)
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO routes (lat_cell, lon_cell, dest_key, distance_m, duration_s, steps, geometry, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (lat_cell, lon_cell, _dest_key(dest_lat, dest_lon), distance_m, duration_s,
+             json.dumps(steps, ensure_ascii=False), geometry, time.time())
+        )
+        _writes += 1
+        if _writes % EVICT_EVERY == 0:
+            conn.execute("DELETE FROM routes WHERE created_at <= ?", (time.time() - ROUTE_TTL,))
+            conn.execute("""
+                DELETE FROM routes WHERE created_at <= (
+                    SELECT created_at FROM routes ORDER BY created_at DESC LIMIT 1 OFFSET ?
+                )
+            """, (ROUTE_MAX_ENTRIES,))
+
+# Cached drive times from an origin cell to every warehouse, as a
+# {warehouse name: seconds} dict, None on miss
+def get_durations(origin_lat, origin_lon):
+    lat_cell, lon_cell = _grid_cell(origin_lat, origin_lon)
+    row = db.get_connection(CACHE_DB).execute(
+        "SELECT durations FROM durations WHERE lat_cell = ? AND lon_cell = ? AND created_at > ?",
+        (lat_cell, lon_cell, time.time() - ROUTE_TTL)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def put_durations(origin_lat, origin_lon, durations):
+    lat_cell, lon_cell = _grid_cell(origin_lat, origin_lon)
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO durations (lat_cell, lon_cell, durations, created_at) VALUES (?, ?, ?, ?)",
+            (lat_cell, lon_cell, json.dumps(durations, ensure_ascii=False), time.time())
+        )
+
+# Cached drive times between points, as {(i, j): seconds} for the pairs
+# of `points` ([(lat, lon)]) that are cached. Both ends snap to the grid.
+def get_travel_times(points):
+    cells = [_grid_cell(lat, lon) for lat, lon in points]
+    positions = {}
+    for i, cell in enumerate(cells):
+        positions.setdefault(cell, []).append(i)
+    conn = db.get_connection(CACHE_DB)
+    cutoff = time.time() - ROUTE_TTL
+    found = {}
+    for src, sources in positions.items():
+        rows = conn.execute(
+            "SELECT dst_lat, dst_lon, duration_s FROM travel_times WHERE src_lat = ? AND src_lon = ? AND created_at > ?",
+            (src[0], src[1], cutoff)
+        ).fetchall()
+        for dst_lat, dst_lon, seconds in rows:
+            for j in positions.get((dst_lat, dst_lon), ()):
+                for i in sources:
+                    found[(i, j)] = seconds
+    return found
+
+# Store drive times given as [((src lat, lon), (dst lat, lon), seconds)]
+def put_travel_times(entries):
+    global _writes
+    now = time.time()
+    rows = [(*_grid_cell(*src), *_grid_cell(*dst), seconds, now) for src, dst, seconds in entries]
+    with db.transaction(CACHE_DB) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO travel_times (src_lat, src_lon, dst_lat, dst_lon, duration_s, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        _writes += 1
+        if _writes % EVICT_EVERY == 0:
+            conn.execute("DELETE FROM travel_times WHERE created_at <= ?", (now - ROUTE_TTL,))
+            conn.execute("""
+                DELETE FROM travel_times WHERE created_at <= (
+                    SELECT created_at FROM travel_times ORDER BY created_at DESC LIMIT 1 OFFSET ?
+                )
+            """, (TRAVEL_TIME_MAX_ENTRIES,))
+
+def clear_routes():
+    with db.transaction(CACHE_DB) as conn:
+        deleted = conn.execute("DELETE FROM routes").rowcount
+        conn.execute("DELETE FROM durations")
+        conn.execute("DELETE FROM travel_times")
+    return deleted
+
+# Drop every cached route when the warehouse list differs from the one
+# the cache was built against. Returns True if the cache was cleared.
+def sync_warehouses(warehouses):
+    fingerprint = hashlib.sha1(json.dumps(
+        sorted((w["name"], w["lat"], w["lon"]) for w in warehouses), ensure_ascii=False
+    ).encode("utf-8")).hexdigest()
+    with db.transaction(CACHE_DB) as conn:
+        row = conn.execute("SELECT value FROM cache_meta WHERE name = 'warehouses'").fetchone()
+        changed = row is None or row[0] != fingerprint
+        if changed:
+            conn.execute("DELETE FROM routes")
+            conn.execute("DELETE FROM durations")
+            conn.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('warehouses', ?)", (fingerprint,))
+    return changed
+
+# Persistent hit/miss counters. Lookups are counted in memory and added
+# to cache_stats by flush_stats(), which app.py calls along with the
+# metrics snapshot, so a cache hit costs no write transaction.
+_pending_stats = {}     # name -> [hits, misses] not yet in cache_stats
+_stats_lock = threading.Lock()
+
+def record(name, hit):
+    metrics.inc("cache_lookups_total", cache=name, result="hit" if hit else "miss")
+    with _stats_lock:
+        counts = _pending_stats.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+def flush_stats():
+    global _pending_stats
+    with _stats_lock:
+        pending, _pending_stats = _pending_stats, {}
+    if not pending:
+        return
+    try:
+        with db.transaction(CACHE_DB) as conn:
+            conn.executemany(
+                "INSERT INTO cache_stats (name, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(name, hits, misses) for name, (hits, misses) in pending.items()]
+            )
+    except BaseException:
+        # Keep the counts for the next flush
+        with _stats_lock:
+            for name, (hits, misses) in pending.items():
+                counts = _pending_stats.setdefault(name, [0, 0])
+                counts[0] += hits
+                counts[1] += misses
+        raise
+
+# Totals over every worker; other workers' latest lookups show up once
+# they flush
+def get_stats():
+    flush_stats()
+    rows = db.get_connection(CACHE_DB).execute("SELECT name, hits, misses FROM cache_stats").fetchall()
+    return {name: {"hits": hits, "misses": misses} for name, hits, misses in rows}
+
+# Latest metrics snapshot of each worker process, so any worker can
+# answer /metrics for all of them. Snapshots older than max_age belong
+# to workers that have exited and are dropped.
+def put_metrics(pid, snapshot):
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO metric_snapshots (pid, snapshot, updated_at) VALUES (?, ?, ?)",
+            (pid, json.dumps(snapshot), time.time())
+        )
+
+def get_metrics(max_age):
+    cutoff = time.time() - max_age
+    with db.transaction(CACHE_DB) as conn:
+        conn.execute("DELETE FROM metric_snapshots WHERE updated_at < ?", (cutoff,))
+        rows = conn.execute("SELECT snapshot FROM metric_snapshots").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+# Single-flight: concurrent callers with the same key share one call to fn
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def single_flight(key, fn):
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        leader = entry is None
+        if leader:
+            entry = {"done": threading.Event(), "result": None, "error": None}
+            _inflight[key] = entry
+    if not leader:
+        entry["done"].wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["result"]
+    try:
+        entry["result"] = fn()
+        return entry["result"]
+    except Exception as e:
+        entry["error"] = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        entry["done"].set()
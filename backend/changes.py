@@ -0,0 +1,75 @@
+import db
+
+# Only the newest KEEP entries are kept; older clients get a full reload
+KEEP = 50000
+PRUNE_EVERY = 1000
+
+# Change log. Triggers append (version, table, row id, op) for every
+# insert, update and delete, so a client can ask for everything after the
+# version it last saw instead of refetching the list.
+def setup_changes(conn, table, key):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_changes_table_version ON changes (table_name, version)")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS changes_prune
+        AFTER INSERT ON changes WHEN NEW.version % {PRUNE_EVERY} = 0
+        BEGIN
+            DELETE FROM changes WHERE version <= NEW.version - {KEEP};
+        END
+    """)
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_changes
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO changes (table_name, row_id, op)
+                VALUES ('{table}', {row}.{key}, '{event.lower()}');
+            END
+        """)
+
+# Latest version of a table; 0 before its first change
+def version(db_path, table):
+    row = db.get_connection(db_path).execute(
+        "SELECT MAX(version) FROM changes WHERE table_name = ?", (table,)
+    ).fetchone()
+    return row[0] or 0
+
+# True when entries after `since` were already pruned
+def _pruned(conn, table, since):
+    oldest = conn.execute(
+        "SELECT MIN(version) FROM changes WHERE table_name = ?", (table,)
+    ).fetchone()[0]
+    return oldest is not None and since < oldest - 1
+
+# Ids of rows changed after `since`, up to `until`. Returns None when
+# entries after `since` were already pruned and the caller must reload.
+def changed_ids(db_path, table, since, until):
+    conn = db.get_connection(db_path)
+    if since < until and _pruned(conn, table, since):
+        return None
+    rows = conn.execute(
+        "SELECT DISTINCT row_id FROM changes WHERE table_name = ? AND version > ? AND version <= ?",
+        (table, since, until)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+# Log entries after `since` in order, as (version, row id, op, status)
+# with the row's current status (None once deleted). Returns None when
+# the log was pruned past `since`.
+def entries(db_path, table, key, since, limit):
+    conn = db.get_connection(db_path)
+    if _pruned(conn, table, since):
+        return None
+    return conn.execute(f"""
+        SELECT c.version, c.row_id, c.op, t.status
+        FROM changes c LEFT JOIN {table} t ON t.{key} = c.row_id
+        WHERE c.table_name = ? AND c.version > ?
+        ORDER BY c.version LIMIT ?
+    """, (table, since, limit)).fetchall()
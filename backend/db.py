@@ -0,0 +1,94 @@
+import sqlite3
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# DATA_DIR moves every database elsewhere, e.g. for benchmark runs
+DATA_DIR = os.environ.get("DATA_DIR", BASE_DIR)
+DONATIONS_DB = os.path.join(DATA_DIR, "donations.db")
+REQUESTS_DB = os.path.join(DATA_DIR, "requestlist.db")
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+# Open a connection tuned for many short statements from several
+# gunicorn workers: WAL so readers never block the writer, NORMAL sync
+# (durable at checkpoints, no fsync per commit) and a busy timeout
+# instead of failing straight away with "database is locked".
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+# Reusable connection for this thread. Connections are keyed by pid as
+# well, so a worker forked from a preloaded master opens its own.
+def get_connection(path):
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = _open(path)
+        _local.connections[path] = conn
+    return conn
+
+# Attach another database file to a connection under `alias`, once.
+# ATTACH is not allowed inside a transaction.
+def attach(conn, alias, path):
+    if alias not in {row[1] for row in conn.execute("PRAGMA database_list")}:
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        conn.execute(f"PRAGMA {alias}.synchronous=NORMAL")
+
+# Run statements in one write transaction. BEGIN IMMEDIATE takes the
+# write lock up front, so concurrent writers queue on busy_timeout rather
+# than deadlocking on a read-to-write upgrade. `attached` maps aliases to
+# other database files written in the same transaction; their write locks
+# are taken by the same BEGIN, and they are detached again afterwards so
+# later transactions on this pooled connection lock only `path`. In WAL
+# mode each file commits on its own, so a crash can leave the changes to
+# one file without those to the other. A COMMIT that fails (a deferred
+# constraint, SQLITE_BUSY) is rolled back too, so the pooled connection
+# is never handed on mid-transaction. The time spent waiting for the
+# lock is recorded as sqlite_lock_wait_seconds.
+@contextmanager
+def transaction(path, attached=None):
+    conn = get_connection(path)
+    for alias, other in (attached or {}).items():
+        attach(conn, alias, other)
+    try:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        metrics.observe("sqlite_lock_wait_seconds", time.perf_counter() - started, db=os.path.basename(path))
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+    finally:
+        for alias in attached or {}:
+            conn.execute(f"DETACH DATABASE {alias}")
+
+def close_all():
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
@@ -0,0 +1,173 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+import changes
+
+# Event stream configuration
+POLL_INTERVAL = 0.5                    # seconds between change-log reads while anyone listens
+HEARTBEAT_INTERVAL = 15                # comment line so proxies keep idle streams open
+STREAM_MAX_SECONDS = 300               # streams end and the browser reconnects with Last-Event-ID
+QUEUE_SIZE = 1000                      # events buffered per subscriber before it is reset
+BATCH_SIZE = 500
+RETRY_MS = 3000
+
+# Tables published on the stream: name -> (database, key column)
+_tables = {}
+_lock = threading.Lock()
+_subscribers = []
+_cursor = {}
+_poller_pid = None
+
+def register(table, db_path, key):
+    _tables[table] = (db_path, key)
+
+# Event ids carry the change version of every table, e.g. "12.7", so a
+# reconnecting client resumes each table where it left off.
+def format_id(cursor):
+    return ".".join(str(cursor[table]) for table in sorted(_tables))
+
+def parse_id(event_id):
+    try:
+        versions = [int(v) for v in event_id.split(".")]
+    except (AttributeError, ValueError):
+        return None
+    if len(versions) != len(_tables):
+        return None
+    return dict(zip(sorted(_tables), versions))
+
+def _current():
+    return {table: changes.version(db_path, table) for table, (db_path, _) in _tables.items()}
+
+# Read every table's log after `cursor`, oldest first. Returns None when a
+# table's log was pruned past the cursor.
+def _read(cursor):
+    events = []
+    for table, (db_path, key) in _tables.items():
+        rows = changes.entries(db_path, table, key, cursor[table], BATCH_SIZE)
+        if rows is None:
+            return None
+        events.extend(
+            {"table": table, "id": row_id, "op": op, "status": status, "version": version}
+            for version, row_id, op, status in rows
+        )
+    return events
+
+def _publish(event):
+    with _lock:
+        _cursor[event["table"]] = max(_cursor[event["table"]], event["version"])
+        for subscriber in _subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                subscriber.overflowed = True
+
+# One poller per process tails the change logs in SQLite, so writes made
+# by any gunicorn worker reach the subscribers of every worker.
+def _poll():
+    while True:
+        time.sleep(POLL_INTERVAL)
+        with _lock:
+            if not _subscribers:
+                continue
+            cursor = dict(_cursor)
+        try:
+            events = _read(cursor)
+        except Exception:
+            traceback.print_exc()
+            continue
+        if events is None:
+            with _lock:
+                _cursor.update(_current())
+                for subscriber in _subscribers:
+                    subscriber.overflowed = True
+            continue
+        for event in events:
+            _publish(event)
+
+def _start_poller():
+    global _poller_pid
+    with _lock:
+        if _poller_pid == os.getpid():
+            return
+        _poller_pid = os.getpid()
+        _cursor.update(_current())
+    threading.Thread(target=_poll, daemon=True).start()
+
+class _Subscriber(queue.Queue):
+    overflowed = False
+
+# Subscribe and return (queue, cursor): the queue receives every event
+# after the returned cursor.
+def subscribe():
+    _start_poller()
+    subscriber = _Subscriber(QUEUE_SIZE)
+    with _lock:
+        _subscribers.append(subscriber)
+        cursor = dict(_cursor)
+    return subscriber, cursor
+
+def unsubscribe(subscriber):
+    with _lock:
+        if subscriber in _subscribers:
+            _subscribers.remove(subscriber)
+
+def _message(name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {name}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+# Server-sent events for `tables`. Missed events after `last_event_id` are
+# replayed from the change log first; a "reset" event tells the client to
+# reload because the log no longer covers its position (or it fell too
+# far behind).
+def stream(tables, last_event_id=None):
+    subscriber, cursor = subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        resume = parse_id(last_event_id)
+        if resume is not None:
+            live_cursor, cursor = cursor, resume
+            while True:
+                backlog = _read(cursor)
+                if backlog is None:
+                    cursor = live_cursor
+                    yield _message("reset", {}, format_id(cursor))
+                    break
+                if not backlog:
+                    break
+                # Versions are per table, so sorting only interleaves tables
+                for event in sorted(backlog, key=lambda e: e["version"]):
+                    cursor[event["table"]] = event["version"]
+                    if event["table"] in tables:
+                        yield _message("change", event, format_id(cursor))
+        else:
+            yield _message("ready", {}, format_id(cursor))
+
+        ends_at = time.time() + STREAM_MAX_SECONDS
+        heartbeat_at = time.time() + HEARTBEAT_INTERVAL
+        while time.time() < ends_at:
+            try:
+                event = subscriber.get(timeout=max(0, min(heartbeat_at, ends_at) - time.time()))
+            except queue.Empty:
+                if time.time() >= heartbeat_at:
+                    yield ": heartbeat\n\n"
+                    heartbeat_at = time.time() + HEARTBEAT_INTERVAL
+                continue
+            if subscriber.overflowed:
+                yield _message("reset", {}, format_id(_current()))
+                return
+            # Replayed events also come through the queue; skip repeats
+            if event["version"] <= cursor[event["table"]]:
+                continue
+            cursor[event["table"]] = event["version"]
+            if event["table"] in tables:
+                yield _message("change", event, format_id(cursor))
+    finally:
+        unsubscribe(subscriber)
@@ -0,0 +1,317 @@
+import array
+import csv
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import cache
+import packed
+import roadgraph
+
+# Offline gazetteer for Vietnamese addresses. `build` indexes named
+# places, streets and address points from an OSM XML extract or a CSV
+# dump (name, kind, lat, lon) into one packed file:
+#   - entries: coordinates, kind and display name
+#   - a sorted vocabulary of diacritic-folded tokens (cache.normalize_address)
+#     with postings lists and IDF weights
+#   - a trigram -> token index for misspelt or unaccented-and-truncated words
+#
+# An address is geocoded part by part (comma separated). Each part is
+# scored against entries by IDF-weighted token overlap, fuzzy tokens
+# counting by their trigram similarity; a candidate for the most specific
+# part wins extra score for every ward/district/city match of the other
+# parts that lies around it, so "Lê Lợi, Quận 1" picks the Lê Lợi in
+# District 1 rather than the one in Gò Vấp.
+MAGIC = b"GAZETTR1"
+COORD_SCALE = 1e6
+STREET_MERGE_DEG = 0.02                # street ways with one name closer than this are one entry
+CANDIDATES_PER_PART = 20
+MIN_SCORE = 0.6                        # weakest match for the most specific part
+MIN_FUZZY = 0.35                       # weakest trigram similarity for a fuzzy token
+FUZZY_TOKENS = 5                       # vocabulary tokens considered per unknown query token
+COMMON_TOKEN_POSTINGS = 5000           # tokens in more entries than this only rescore candidates
+CONTEXT_WEIGHT = 0.5                   # weight of a surrounding ward/district/city match at its centre
+
+# Entry kinds, most specific first, with the radius in km within which a
+# more specific entry is taken to lie inside one of them. The context
+# bonus fades linearly to zero at the radius.
+KINDS = ["address", "street", "neighbourhood", "ward", "district", "city"]
+CONTEXT_RADIUS_KM = {"neighbourhood": 2, "ward": 4, "district": 12, "city": 50}
+PLACE_KINDS = {
+    "neighbourhood": "neighbourhood", "hamlet": "neighbourhood", "isolated_dwelling": "neighbourhood",
+    "quarter": "ward", "suburb": "ward", "village": "ward",
+    "town": "district", "city_district": "district", "district": "district", "county": "district",
+    "city": "city", "municipality": "city", "province": "city", "state": "city",
+}
+STREET_HIGHWAYS = set(roadgraph.SPEEDS) | {"pedestrian", "footway", "track"}
+
+def tokenize(text):
+    return cache.normalize_address(text).split()
+
+def _trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _kind_for_admin_level(level):
+    level = int(level) if level.isdigit() else 0
+    if level >= 8:
+        return "ward"
+    if level >= 5:
+        return "district"
+    return "city"
+
+# Named entries as (name, kind, lat, lon) from an OSM extract: place
+# nodes, address points, admin boundary labels and named streets (one
+# entry per name and neighbourhood, placed on the middle node of the
+# longest way).
+def _read_osm(path):
+    entries = []
+    ways, labels = [], {}
+    with roadgraph.open_osm(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag not in ("node", "way", "relation"):
+                continue
+            tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            name = tags.get("name")
+            if elem.tag == "node":
+                if tags:
+                    lat, lon = float(elem.get("lat")), float(elem.get("lon"))
+                    if name and tags.get("place") in PLACE_KINDS:
+                        entries.append((name, PLACE_KINDS[tags["place"]], lat, lon))
+                    if tags.get("addr:housenumber") and tags.get("addr:street"):
+                        entries.append((f"{tags['addr:housenumber']} {tags['addr:street']}", "address", lat, lon))
+            elif elem.tag == "way":
+                refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                if name and tags.get("highway") in STREET_HIGHWAYS and refs:
+                    ways.append((name, "street", refs))
+                elif name and tags.get("place") in PLACE_KINDS and refs:
+                    ways.append((name, PLACE_KINDS[tags["place"]], refs))
+                if tags.get("addr:housenumber") and tags.get("addr:street") and refs:
+                    ways.append((f"{tags['addr:housenumber']} {tags['addr:street']}", "address", refs))
+            elif name and tags.get("boundary") == "administrative":
+                members = {m.get("role"): int(m.get("ref")) for m in elem.iter("member") if m.get("type") == "node"}
+                node = members.get("label", members.get("admin_centre"))
+                if node is not None:
+                    labels[node] = (name, _kind_for_admin_level(tags.get("admin_level", "")))
+            elem.clear()
+
+    wanted = set(labels)
+    for _, _, refs in ways:
+        wanted.update(refs)
+    coords = roadgraph.read_nodes(path, wanted) if wanted else {}
+    for node, (name, kind) in labels.items():
+        if node in coords:
+            entries.append((name, kind, *coords[node]))
+
+    streets = {}
+    for name, kind, refs in ways:
+        points = [coords[ref] for ref in refs if ref in coords]
+        if not points:
+            continue
+        if kind != "street":
+            lat = sum(p[0] for p in points) / len(points)
+            lon = sum(p[1] for p in points) / len(points)
+            entries.append((name, kind, lat, lon))
+            continue
+        middle = points[len(points) // 2]
+        cell = (name, math.floor(middle[0] / STREET_MERGE_DEG), math.floor(middle[1] / STREET_MERGE_DEG))
+        if cell not in streets or len(points) > streets[cell][0]:
+            streets[cell] = (len(points), middle)
+    for (name, _, _), (_, (lat, lon)) in streets.items():
+        entries.append((name, "street", lat, lon))
+    return entries
+
+def _read_csv(path):
+    entries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            kind = (row.get("kind") or "").strip()
+            if row.get("name") and kind in KINDS:
+                entries.append((row["name"].strip(), kind, float(row["lat"]), float(row["lon"])))
+    return entries
+
+def _csr(lists):
+    offsets = array.array("I", [0])
+    values = array.array("I")
+    for items in lists:
+        values.extend(items)
+        offsets.append(len(values))
+    return offsets, values
+
+# Index an OSM extract (.osm/.osm.gz/.osm.bz2) or a .csv dump into the
+# gazetteer file. Returns (entries, tokens).
+def build(source_path, out_path):
+    raw = _read_csv(source_path) if source_path.lower().endswith(".csv") else _read_osm(source_path)
+    seen = set()
+    entries = []
+    for name, kind, lat, lon in raw:
+        tokens = list(dict.fromkeys(tokenize(name)))
+        key = (tuple(tokens), kind, round(lat, 4), round(lon, 4))
+        if tokens and key not in seen:
+            seen.add(key)
+            entries.append((name, kind, lat, lon, tokens))
+
+    vocabulary = sorted({token for entry in entries for token in entry[4]})
+    token_ids = {token: i for i, token in enumerate(vocabulary)}
+    postings = [[] for _ in vocabulary]
+    for i, entry in enumerate(entries):
+        for token in entry[4]:
+            postings[token_ids[token]].append(i)
+    idf = array.array("f", (math.log(1 + len(entries) / len(p)) for p in postings))
+
+    grams = {}
+    for i, token in enumerate(vocabulary):
+        if not token.isdigit():
+            for gram in _trigrams(token):
+                grams.setdefault(gram, []).append(i)
+    gram_list = sorted(grams)
+
+    name_bytes = bytearray()
+    name_offsets = array.array("I", [0])
+    for entry in entries:
+        name_bytes += entry[0].encode("utf-8")
+        name_offsets.append(len(name_bytes))
+    entry_offsets, entry_tokens = _csr([token_ids[t] for t in entry[4]] for entry in entries)
+    posting_offsets, posting_entries = _csr(postings)
+    gram_offsets, gram_tokens = _csr(grams[g] for g in gram_list)
+
+    packed.write(out_path, MAGIC, {"entries": len(entries), "kinds": KINDS}, {
+        "lat": array.array("i", (round(e[2] * COORD_SCALE) for e in entries)),
+        "lon": array.array("i", (round(e[3] * COORD_SCALE) for e in entries)),
+        "kind": array.array("B", (KINDS.index(e[1]) for e in entries)),
+        "name_offsets": name_offsets, "names": array.array("B", name_bytes),
+        "entry_offsets": entry_offsets, "entry_tokens": entry_tokens,
+        "entry_weight": array.array("f", (sum(idf[token_ids[t]] for t in e[4]) for e in entries)),
+        "vocabulary": array.array("B", "\n".join(vocabulary).encode("ascii")),
+        "idf": idf, "posting_offsets": posting_offsets, "postings": posting_entries,
+        "grams": array.array("B", "\n".join(gram_list).encode("ascii")),
+        "gram_offsets": gram_offsets, "gram_tokens": gram_tokens,
+    })
+    return len(entries), len(vocabulary)
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    return roadgraph.haversine_m(lat1, lon1, lat2, lon2) / 1000
+
+class Gazetteer:
+    def __init__(self, path):
+        header, arrays = packed.load(path, MAGIC)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+        self.entry_count = header["entries"]
+        self.kinds = header["kinds"]
+        # The two string tables are small; dicts make lookups O(1)
+        vocabulary = bytes(self.vocabulary).decode("ascii")
+        self.tokens = vocabulary.split("\n") if vocabulary else []
+        self.token_ids = {t: i for i, t in enumerate(self.tokens)}
+        grams = bytes(self.grams).decode("ascii")
+        self.gram_ids = {g: i for i, g in enumerate(grams.split("\n"))} if grams else {}
+        self.max_idf = max(self.idf, default=1.0)
+
+    def name(self, i):
+        return bytes(self.names[self.name_offsets[i]:self.name_offsets[i + 1]]).decode("utf-8")
+
+    def coord(self, i):
+        return self.lat[i] / COORD_SCALE, self.lon[i] / COORD_SCALE
+
+    # {vocabulary token id: similarity} for a query token
+    def _expand(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is not None:
+            return {token_id: 1.0}
+        if token.isdigit() or len(token) < 3:
+            return {}
+        grams = _trigrams(token)
+        shared = {}
+        for gram in grams:
+            g = self.gram_ids.get(gram)
+            if g is not None:
+                for k in range(self.gram_offsets[g], self.gram_offsets[g + 1]):
+                    t = self.gram_tokens[k]
+                    shared[t] = shared.get(t, 0) + 1
+        scored = []
+        for t, count in shared.items():
+            similarity = count / (len(grams) + len(self.tokens[t]) - count)
+            if similarity >= MIN_FUZZY:
+                scored.append((similarity, t))
+        scored.sort(reverse=True)
+        return {t: similarity for similarity, t in scored[:FUZZY_TOKENS]}
+
+    # Top entries for one address part as [(score, entry)]. Score blends
+    # how much of the entry name the part covers with how much of the
+    # part the entry explains, both IDF weighted.
+    def _candidates(self, tokens):
+        expanded = [self._expand(token) for token in tokens]
+        query_weight = sum(
+            max((self.idf[t] for t in options), default=self.max_idf) for options in expanded
+        )
+        entries = set()
+        for options in expanded:
+            for t in options:
+                if self.posting_offsets[t + 1] - self.posting_offsets[t] <= COMMON_TOKEN_POSTINGS:
+                    entries.update(self.postings[self.posting_offsets[t]:self.posting_offsets[t + 1]])
+        if not entries:
+            # Only common tokens ("quan", "1"): intersect their postings instead
+            for options in filter(None, expanded):
+                found = set()
+                for t in options:
+                    found.update(self.postings[self.posting_offsets[t]:self.posting_offsets[t + 1]])
+                entries = found if not entries else entries & found
+                if not entries:
+                    return []
+
+        scored = []
+        for entry in entries:
+            entry_tokens = set(self.entry_tokens[self.entry_offsets[entry]:self.entry_offsets[entry + 1]])
+            matched = 0.0
+            for options in expanded:
+                best = max((s * self.idf[t] for t, s in options.items() if t in entry_tokens), default=0.0)
+                matched += best
+            coverage = matched / self.entry_weight[entry]
+            precision = matched / query_weight if query_weight else 0.0
+            scored.append((0.7 * min(coverage, 1.0) + 0.3 * min(precision, 1.0), entry))
+        scored.sort(key=lambda item: (-item[0], self.kind[item[1]]))
+        return scored[:CANDIDATES_PER_PART]
+
+    # Best (lat, lon, name, kind, score) for a free-form address, or None
+    # when its most specific part has no confident match
+    def geocode(self, address):
+        parts = [tokenize(part) for part in (address or "").split(",")]
+        parts = [tokens for tokens in parts if tokens]
+        if not parts:
+            return None
+        candidates = [self._candidates(tokens) for tokens in parts]
+        best = None
+        for score, entry in candidates[0]:
+            if score < MIN_SCORE:
+                break
+            kind = self.kinds[self.kind[entry]]
+            lat, lon = self.coord(entry)
+            context = {}
+            for other in candidates:
+                for other_score, other_entry in other:
+                    other_kind = self.kinds[self.kind[other_entry]]
+                    radius = CONTEXT_RADIUS_KM.get(other_kind)
+                    if radius is None or self.kind[other_entry] <= self.kind[entry]:
+                        continue
+                    closeness = 1 - _distance_km(lat, lon, *self.coord(other_entry)) / radius
+                    if closeness > 0:
+                        context[other_kind] = max(context.get(other_kind, 0), other_score * closeness)
+            total = score + CONTEXT_WEIGHT * sum(context.values())
+            rank = (total, -self.kind[entry])
+            if best is None or rank > best[0]:
+                best = (rank, (lat, lon, self.name(entry), kind, round(score, 3)))
+        return best[1] if best else None
+
+_gazetteers = {}
+_lock = threading.Lock()
+
+# Gazetteer at `path`, loaded once per process; None if the file is missing
+def get_gazetteer(path):
+    gazetteer = _gazetteers.get(path)
+    if gazetteer is None and os.path.exists(path):
+        with _lock:
+            gazetteer = _gazetteers.get(path)
+            if gazetteer is None:
+                gazetteer = _gazetteers[path] = Gazetteer(path)
+    return gazetteer
@@ -0,0 +1,6 @@
+# Threaded workers, so long-lived /events streams don't each hold a
+# whole worker process
+worker_class = "gthread"
+workers = 2
+threads = 16
+timeout = 60
@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import db
+import cache
+import metrics
+
+USER_AGENT = "CharityDonationApp"
+
+# Per-host policy. timeout is (connect, read) seconds; min_interval is
+# the minimum spacing between calls across all workers (Nominatim's
+# usage policy allows one request per second).
+DEFAULT_POLICY = {
+    "timeout": (3.05, 10),
+    "min_interval": 0,
+    "retries": 2,
+    "backoff": 0.5,
+    "breaker_threshold": 5,
+    "breaker_cooldown": 30,
+}
+HOST_POLICIES = {
+    "nominatim.openstreetmap.org": {"timeout": (3.05, 10), "min_interval": 1.0, "retries": 2},
+    "router.project-osrm.org": {"timeout": (3.05, 5), "retries": 1, "breaker_threshold": 3},
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POOL_SIZE = 10
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+_local = threading.local()
+_lock = threading.Lock()
+_breakers = {}
+_stats = {}
+
+def policy_for(host):
+    return dict(DEFAULT_POLICY, **HOST_POLICIES.get(host, {}))
+
+# One keep-alive session per thread; sessions are not thread-safe to
+# configure but pool connections per host internally.
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        _local.session = session
+    return session
+
+def _host_stats(host):
+    stats = _stats.get(host)
+    if stats is None:
+        stats = _stats.setdefault(host, {
+            "requests": 0, "errors": 0, "retries": 0, "rate_limit_wait_s": 0.0,
+            "breaker_rejections": 0, "breaker_opens": 0,
+            "latency_count": 0, "latency_sum_s": 0.0, "latency_max_s": 0.0,
+            "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+    return stats
+
+def _observe(host, seconds, error):
+    metrics.inc("upstream_requests_total", host=host, outcome="error" if error else "ok")
+    metrics.observe("upstream_request_duration_seconds", seconds, host=host)
+    with _lock:
+        stats = _host_stats(host)
+        stats["requests"] += 1
+        if error:
+            stats["errors"] += 1
+        stats["latency_count"] += 1
+        stats["latency_sum_s"] += seconds
+        stats["latency_max_s"] = max(stats["latency_max_s"], seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats["latency_buckets"][i] += 1
+                break
+        else:
+            stats["latency_buckets"][-1] += 1
+
+def _count(host, name, amount=1):
+    with _lock:
+        _host_stats(host)[name] += amount
+
+# Token bucket of size one shared by every worker: each caller reserves
+# the next free slot in cache.db and sleeps until it comes round.
+def _wait_for_slot(host, interval):
+    if not interval:
+        return
+    now = time.time()
+    with db.transaction(cache.CACHE_DB) as conn:
+        row = conn.execute("SELECT next_at FROM rate_limits WHERE host = ?", (host,)).fetchone()
+        slot = max(now, row[0] if row else 0)
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_limits (host, next_at) VALUES (?, ?)", (host, slot + interval)
+        )
+    if slot > now:
+        _count(host, "rate_limit_wait_s", slot - now)
+        time.sleep(slot - now)
+
+# Circuit breaker per host: after breaker_threshold consecutive failures
+# calls fail fast for breaker_cooldown seconds, then one trial call is let
+# through (half-open) and its result closes or re-opens the circuit.
+def _breaker_allows(host, policy):
+    with _lock:
+        breaker = _breakers.setdefault(host, {"failures": 0, "open_until": 0, "trial": False})
+        if breaker["open_until"] == 0:
+            return True
+        if time.time() < breaker["open_until"] or breaker["trial"]:
+            _host_stats(host)["breaker_rejections"] += 1
+            return False
+        breaker["trial"] = True
+        return True
+
+def _breaker_record(host, policy, ok):
+    with _lock:
+        breaker = _breakers[host]
+        breaker["trial"] = False
+        if ok:
+            breaker["failures"] = 0
+            breaker["open_until"] = 0
+            return
+        breaker["failures"] += 1
+        if breaker["failures"] >= policy["breaker_threshold"]:
+            if breaker["open_until"] == 0:
+                _host_stats(host)["breaker_opens"] += 1
+            breaker["open_until"] = time.time() + policy["breaker_cooldown"]
+
+# GET with the host's timeout, rate limit, jittered retries and circuit
+# breaker. Returns the final response (which may still be an error
+# status) or raises a requests.RequestException.
+def get(url, params=None, headers=None, timeout=None):
+    host = urlsplit(url).hostname
+    policy = policy_for(host)
+    attempts = policy["retries"] + 1
+    for attempt in range(attempts):
+        if not _breaker_allows(host, policy):
+            raise CircuitOpenError(f"Circuit open for {host}")
+        _wait_for_slot(host, policy["min_interval"])
+        started = time.perf_counter()
+        try:
+            response = _session().get(url, params=params, headers=headers, timeout=timeout or policy["timeout"])
+        except requests.RequestException:
+            _observe(host, time.perf_counter() - started, True)
+            _breaker_record(host, policy, False)
+            if attempt == attempts - 1:
+                raise
+        else:
+            failed = response.status_code in RETRY_STATUSES
+            _observe(host, time.perf_counter() - started, failed)
+            _breaker_record(host, policy, not failed)
+            if not failed or attempt == attempts - 1:
+                return response
+        _count(host, "retries")
+        metrics.inc("upstream_retries_total", host=host)
+        # Full jitter keeps retrying workers from stampeding together
+        time.sleep(random.uniform(0, policy["backoff"] * 2 ** attempt))
+
+def get_stats():
+    with _lock:
+        stats = {host: dict(values, latency_buckets=list(values["latency_buckets"])) for host, values in _stats.items()}
+        for host, breaker in _breakers.items():
+            state = "closed"
+            if breaker["open_until"]:
+                state = "open" if time.time() < breaker["open_until"] else "half-open"
+            stats.setdefault(host, {})["breaker_state"] = state
+    return {"latency_bucket_bounds_s": LATENCY_BUCKETS, "hosts": stats}
@@ -0,0 +1,170 @@
+import json
+import random
+import threading
+import time
+import traceback
+
+import db
+import metrics
+import profiler
+
+# Job queue configuration
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 5                       # seconds before the first retry, doubled each attempt
+BACKOFF_MAX = 600
+LEASE_SECONDS = 120                    # a claimed job is retried if not finished by then
+POLL_INTERVAL = 2
+
+# Raised by a handler when retrying cannot help; the job fails at once
+class PermanentError(Exception):
+    pass
+
+_handlers = {}
+_databases = []
+_wakeup = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+
+# Jobs live in the same database as the rows they enrich, so a record
+# and its job are committed in one transaction.
+def setup_jobs(db_path):
+    with db.transaction(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                record_id INTEGER,
+                payload TEXT,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_run_at ON jobs (state, run_at)")
+    if db_path not in _databases:
+        _databases.append(db_path)
+
+def register(kind, handler):
+    _handlers[kind] = handler
+
+# Queue a job on an open transaction
+def enqueue(conn, kind, record_id, payload=None):
+    now = time.time()
+    conn.execute(
+        "INSERT INTO jobs (kind, record_id, payload, state, run_at, created_at, updated_at) "
+        "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+        (kind, record_id, json.dumps(payload or {}, ensure_ascii=False), now, now, now)
+    )
+    _wakeup.set()
+
+# Claim the next due job, or a running one whose lease ran out because
+# its worker died. The claim is a single UPDATE so two workers can never
+# take the same job.
+def _claim(db_path):
+    now = time.time()
+    with db.transaction(db_path) as conn:
+        row = conn.execute("""
+            UPDATE jobs
+            SET state = 'running', attempts = attempts + 1, run_at = ?, updated_at = ?
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE state IN ('queued', 'running') AND run_at <= ?
+                ORDER BY run_at LIMIT 1
+            )
+            RETURNING job_id, kind, record_id, payload, attempts
+        """, (now + LEASE_SECONDS, now, now)).fetchone()
+    return row
+
+def _finish(db_path, job_id):
+    with db.transaction(db_path) as conn:
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+# Reschedule with jittered exponential backoff, or give up. Returns True
+# when the job will not be retried.
+def _retry(db_path, job_id, attempts, error):
+    now = time.time()
+    with db.transaction(db_path) as conn:
+        if attempts >= MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', last_error = ?, updated_at = ? WHERE job_id = ?",
+                (error, now, job_id)
+            )
+            return True
+        delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+        delay *= random.uniform(0.5, 1.5)
+        conn.execute(
+            "UPDATE jobs SET state = 'queued', run_at = ?, last_error = ?, updated_at = ? WHERE job_id = ?",
+            (now + delay, error, now, job_id)
+        )
+    return False
+
+# Run one job if any is due. Handlers raise to ask for a retry; the
+# handler registered as "<kind>.failed" is called after the last attempt.
+# Each run is traced, so a slow job is logged with its stage breakdown,
+# and sampled while an on-demand profile is running.
+def _run(db_path, job_id, kind, record_id, payload, attempts):
+    handler = _handlers.get(kind)
+    try:
+        if handler is None:
+            raise RuntimeError(f"No handler for job kind {kind}")
+        handler(record_id, json.loads(payload or "{}"))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if isinstance(e, PermanentError):
+            attempts = MAX_ATTEMPTS
+        if _retry(db_path, job_id, attempts, error):
+            on_failed = _handlers.get(f"{kind}.failed")
+            if on_failed is not None:
+                on_failed(record_id, error)
+    else:
+        _finish(db_path, job_id)
+
+def run_once():
+    for db_path in list(_databases):
+        job = _claim(db_path)
+        if job is None:
+            continue
+        job_id, kind, record_id, payload, attempts = job
+        metrics.start_trace()
+        profiler.begin()
+        try:
+            _run(db_path, *job)
+        finally:
+            profiler.end()
+            trace = metrics.finish_trace()
+            metrics.observe("job_duration_seconds", trace["seconds"], kind=kind)
+            metrics.log_slow(trace, metrics.SLOW_JOB_S, "slow_job", kind=kind, record_id=record_id)
+        return True
+    return False
+
+def _worker():
+    while True:
+        try:
+            if run_once():
+                continue
+        except Exception:
+            traceback.print_exc()
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+def start_workers(count):
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    for _ in range(count):
+        threading.Thread(target=_worker, daemon=True).start()
+
+def get_stats():
+    stats = {}
+    for db_path in _databases:
+        rows = db.get_connection(db_path).execute(
+            "SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state"
+        ).fetchall()
+        for kind, state, count in rows:
+            stats.setdefault(kind, {})[state] = count
+    return stats
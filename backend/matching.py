@@ -0,0 +1,231 @@
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+
+import changes
+import db
+import warehouses
+
+# Proposed allocation of pending donations to pending requests.
+#
+# Per category, donations are taken most urgent first (shortest shelf
+# life, then earliest expiry date, then oldest) and each one fills the
+# oldest open requests at its own warehouse, then at the next nearest
+# warehouses. Allocation is greedy on remaining quantities, so new or
+# changed rows are matched against what is left without redoing the rest.
+OPEN_STATUS = "Pending"
+NO_EXPIRY = "9999-12-31"
+EPSILON = 1e-9
+LOAD_CHUNK = 500                 # ids per IN (...) when reloading changed rows
+
+_lock = threading.Lock()
+_config = {"category_columns": {}, "horizons": []}
+_state = {"versions": None, "warehouse_version": None, "order": {}, "distances": {},
+          "donations": {}, "requests": {}, "allocations": {}}
+
+# category_columns maps category -> requests *_qty column; horizons is the
+# donation "date" choices, shortest shelf life first
+def configure(category_columns, horizons):
+    _config["category_columns"] = dict(category_columns)
+    _config["horizons"] = list(horizons)
+
+# Expiry as YYYY-MM-DD for sorting; accepts YYYY-MM-DD and DD/MM/YYYY
+# (or DD-MM-YYYY). Regexes rather than strptime: most rows have no or
+# free-text expiry and failed strptime calls are slow.
+ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+DMY_DATE = re.compile(r"(\d{1,2})[/-](\d{1,2})[/-](\d{4})")
+
+@lru_cache(maxsize=4096)
+def _parse_exp(exp):
+    # Bulk JSON ingest can store a number here
+    if not exp or not isinstance(exp, str):
+        return NO_EXPIRY
+    exp = exp.strip()
+    match = ISO_DATE.fullmatch(exp)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DMY_DATE.fullmatch(exp)
+        if not match:
+            return NO_EXPIRY
+        day, month, year = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+def _urgency(row):
+    horizons = _config["horizons"]
+    rank = horizons.index(row["date"]) if row["date"] in horizons else len(horizons)
+    return (rank, _parse_exp(row["exp"]), row["timestamp"] or "", row["id"])
+
+# Warehouses by distance from each warehouse, itself first
+def _warehouse_order():
+    version = warehouses.version()
+    if version != _state["warehouse_version"]:
+        everything = warehouses.all_warehouses()
+        order, distances = {}, {}
+        for w in everything:
+            hits = warehouses.nearest(w["lat"], w["lon"], len(everything))
+            order[w["name"]] = [other["name"] for other, km in hits]
+            distances.update({(w["name"], other["name"]): km for other, km in hits})
+        _state["order"], _state["distances"] = order, distances
+        _state["warehouse_version"] = version
+    return _state["order"]
+
+def _load_donations(ids=None):
+    sql = ("SELECT id, category, quantity, warehouse_name, date, exp, timestamp FROM donations "
+           "WHERE status = ? AND quantity > 0")
+    params = [OPEN_STATUS]
+    if ids is not None:
+        sql += f" AND id IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    for row in db.get_connection(db.DONATIONS_DB).execute(sql, params):
+        _state["donations"][row["id"]] = {
+            "id": row["id"], "category": row["category"], "warehouse": row["warehouse_name"],
+            "quantity": row["quantity"], "remaining": row["quantity"], "urgency": _urgency(row),
+        }
+
+def _load_requests(ids=None):
+    columns = _config["category_columns"]
+    sql = f"SELECT rid, warehouse_name, timestamp, {', '.join(columns.values())} FROM requests WHERE status = ?"
+    params = [OPEN_STATUS]
+    if ids is not None:
+        sql += f" AND rid IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    for row in db.get_connection(db.REQUESTS_DB).execute(sql, params):
+        remaining = {category: row[column] for category, column in columns.items() if (row[column] or 0) > 0}
+        if remaining:
+            _state["requests"][row["rid"]] = {
+                "rid": row["rid"], "warehouse": row["warehouse_name"], "timestamp": row["timestamp"] or "",
+                "quantity": dict(remaining), "remaining": remaining,
+            }
+
+# Greedy allocation of what is left in one category
+def _match(category):
+    order = _warehouse_order()
+    supply = sorted(
+        (d for d in _state["donations"].values() if d["category"] == category and d["remaining"] > EPSILON),
+        key=lambda d: d["urgency"]
+    )
+    open_requests = sorted(
+        (r for r in _state["requests"].values() if r["remaining"].get(category, 0) > EPSILON),
+        key=lambda r: (r["timestamp"], r["rid"])
+    )
+    demand = {}
+    for r in open_requests:
+        demand.setdefault(r["warehouse"], deque()).append(r)
+
+    for donation in supply:
+        for warehouse in order.get(donation["warehouse"], [donation["warehouse"]]):
+            queue = demand.get(warehouse)
+            while queue and donation["remaining"] > EPSILON:
+                req = queue[0]
+                amount = min(donation["remaining"], req["remaining"][category])
+                key = (donation["id"], req["rid"], category)
+                _state["allocations"][key] = _state["allocations"].get(key, 0) + amount
+                donation["remaining"] -= amount
+                req["remaining"][category] -= amount
+                if req["remaining"][category] <= EPSILON:
+                    queue.popleft()
+            if donation["remaining"] <= EPSILON:
+                break
+
+# Drop donations or requests and hand their allocated amounts back to
+# the other side, in one pass over the allocations. Returns the
+# categories that need matching again.
+def _release(side, row_ids):
+    touched = set()
+    position = 0 if side == "donations" else 1
+    for key in [k for k in _state["allocations"] if k[position] in row_ids]:
+        donation_id, rid, category = key
+        amount = _state["allocations"].pop(key)
+        if side == "donations" and rid in _state["requests"]:
+            _state["requests"][rid]["remaining"][category] += amount
+        if side == "requests" and donation_id in _state["donations"]:
+            _state["donations"][donation_id]["remaining"] += amount
+        touched.add(category)
+    for row_id in row_ids:
+        row = _state[side].pop(row_id, None)
+        if row is not None:
+            touched.update([row["category"]] if side == "donations" else row["quantity"])
+    return touched
+
+def _rebuild(versions):
+    _state.update(donations={}, requests={}, allocations={}, versions=versions)
+    _load_donations()
+    _load_requests()
+    for category in _config["category_columns"]:
+        _match(category)
+
+# Bring the allocation up to date with the change log: only rows changed
+# since the last call are released, reloaded and matched.
+def _refresh(full=False):
+    versions = {
+        "donations": changes.version(db.DONATIONS_DB, "donations"),
+        "requests": changes.version(db.REQUESTS_DB, "requests"),
+    }
+    if full or _state["versions"] is None or _state["warehouse_version"] != warehouses.version():
+        _rebuild(versions)
+        return
+    if versions == _state["versions"]:
+        return
+    donation_ids = changes.changed_ids(
+        db.DONATIONS_DB, "donations", _state["versions"]["donations"], versions["donations"]
+    )
+    request_ids = changes.changed_ids(
+        db.REQUESTS_DB, "requests", _state["versions"]["requests"], versions["requests"]
+    )
+    if donation_ids is None or request_ids is None:
+        _rebuild(versions)
+        return
+
+    touched = _release("donations", set(donation_ids)) | _release("requests", set(request_ids))
+    for start in range(0, len(donation_ids), LOAD_CHUNK):
+        _load_donations(donation_ids[start:start + LOAD_CHUNK])
+    for start in range(0, len(request_ids), LOAD_CHUNK):
+        _load_requests(request_ids[start:start + LOAD_CHUNK])
+    for donation_id in donation_ids:
+        if donation_id in _state["donations"]:
+            touched.add(_state["donations"][donation_id]["category"])
+    for rid in request_ids:
+        if rid in _state["requests"]:
+            touched.update(_state["requests"][rid]["quantity"])
+    for category in touched:
+        _match(category)
+    _state["versions"] = versions
+
+# Current proposal, optionally narrowed to one category or to allocations
+# touching one warehouse. full=True recomputes from scratch.
+def get_matches(category=None, warehouse=None, full=False):
+    with _lock:
+        _refresh(full)
+        allocations = []
+        for (donation_id, rid, cat), amount in sorted(_state["allocations"].items()):
+            if amount <= EPSILON or (category and cat != category):
+                continue
+            donation = _state["donations"][donation_id]
+            req = _state["requests"][rid]
+            if warehouse and warehouse not in (donation["warehouse"], req["warehouse"]):
+                continue
+            allocations.append({
+                "donation_id": donation_id,
+                "request_id": rid,
+                "category": cat,
+                "quantity": amount,
+                "donation_warehouse": donation["warehouse"],
+                "request_warehouse": req["warehouse"],
+                "transfer_km": _state["distances"].get((donation["warehouse"], req["warehouse"])),
+            })
+        unmatched_supply, unmatched_demand = {}, {}
+        for d in _state["donations"].values():
+            if d["remaining"] > EPSILON and (not category or d["category"] == category):
+                unmatched_supply[d["category"]] = unmatched_supply.get(d["category"], 0) + d["remaining"]
+        for r in _state["requests"].values():
+            for cat, amount in r["remaining"].items():
+                if amount > EPSILON and (not category or cat == category):
+                    unmatched_demand[cat] = unmatched_demand.get(cat, 0) + amount
+        return {
+            "allocations": allocations,
+            "unmatched_supply": unmatched_supply,
+            "unmatched_demand": unmatched_demand,
+            "versions": dict(_state["versions"]),
+        }
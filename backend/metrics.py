@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process counters and histograms, rendered in the Prometheus text
+# format. Every worker process keeps its own; app.py publishes snapshots
+# to cache.db so /metrics can sum them across gunicorn workers.
+PREFIX = "webapp_"
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SLOW_REQUEST_S = 1.0                   # requests slower than this are logged with their stages
+SLOW_JOB_S = 5.0                       # same for background jobs
+DESCRIPTIONS = {
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "stage_duration_seconds": ("histogram", "Time spent in each named stage"),
+    "job_duration_seconds": ("histogram", "Background job run time by kind"),
+    "upstream_requests_total": ("counter", "Calls to upstream services by host and outcome"),
+    "upstream_request_duration_seconds": ("histogram", "Upstream call latency by host"),
+    "upstream_retries_total": ("counter", "Upstream calls retried"),
+    "cache_lookups_total": ("counter", "Cache lookups by cache and result"),
+    "sqlite_lock_wait_seconds": ("histogram", "Time BEGIN IMMEDIATE waited for the write lock"),
+    "rows_serialized_total": ("counter", "Rows turned into JSON, CSV or NDJSON"),
+    "slow_requests_total": ("counter", "Requests and jobs over the slow threshold"),
+    "jobs": ("gauge", "Jobs in the queue by kind and state"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_local = threading.local()
+
+_slow_log = logging.getLogger("webapp.slow")
+if not _slow_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _slow_log.addHandler(_handler)
+    _slow_log.setLevel(logging.INFO)
+    _slow_log.propagate = False
+
+def _label_text(labels):
+    return ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in sorted(labels.items())
+    )
+
+def _note(name, amount):
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["counts"][name] = trace["counts"].get(name, 0) + amount
+
+def inc(name, amount=1, **labels):
+    key = _label_text(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+        _note(name, amount)
+
+def _observe(name, value, labels):
+    key = _label_text(labels)
+    series = _histograms.setdefault(name, {})
+    counts = series.get(key)
+    if counts is None:
+        # One slot per bucket, then +Inf, sum and count
+        counts = series[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            counts[i] += 1
+            break
+    else:
+        counts[len(LATENCY_BUCKETS)] += 1
+    counts[-2] += value
+    counts[-1] += 1
+
+def observe(name, value, **labels):
+    with _lock:
+        _observe(name, value, labels)
+        _note(name, value)
+
+# Time a block (or, as a decorator, a function) as `stage`. Inside a
+# trace the time also goes into that trace's per-stage breakdown.
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        with _lock:
+            _observe("stage_duration_seconds", seconds, {"stage": stage})
+            trace = getattr(_local, "trace", None)
+            if trace is not None:
+                total = trace["stages"].setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+
+# A trace collects the spans and counts of one request or job on this
+# thread. bind() carries the caller's trace into pool threads.
+def start_trace():
+    _local.trace = {"started": time.perf_counter(), "stages": {}, "counts": {}}
+
+def finish_trace():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if trace is not None:
+        trace["seconds"] = time.perf_counter() - trace.pop("started")
+    return trace
+
+def bind(fn):
+    trace = getattr(_local, "trace", None)
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, "trace", None)
+        _local.trace = trace
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return run
+
+# One JSON line per slow trace, with milliseconds and calls per stage
+def log_slow(trace, threshold, event, **fields):
+    if trace is None or trace["seconds"] < threshold:
+        return False
+    inc("slow_requests_total", event=event)
+    fields.update(
+        event=event,
+        duration_ms=round(trace["seconds"] * 1000, 1),
+        stages={
+            stage: {"ms": round(seconds * 1000, 1), "calls": calls}
+            for stage, (seconds, calls) in sorted(trace["stages"].items(), key=lambda item: -item[1][0])
+        },
+        counts={name: round(value, 4) for name, value in trace["counts"].items()},
+    )
+    _slow_log.warning(json.dumps(fields, ensure_ascii=False))
+    return True
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": {name: dict(series) for name, series in _counters.items()},
+            "histograms": {name: {key: list(counts) for key, counts in series.items()} for name, series in _histograms.items()},
+        }
+
+# Sum snapshots from several processes
+def merge(snapshots):
+    merged = {"counters": {}, "histograms": {}}
+    for snap in snapshots:
+        for name, series in snap.get("counters", {}).items():
+            target = merged["counters"].setdefault(name, {})
+            for key, value in series.items():
+                target[key] = target.get(key, 0) + value
+        for name, series in snap.get("histograms", {}).items():
+            target = merged["histograms"].setdefault(name, {})
+            for key, counts in series.items():
+                if key in target:
+                    target[key] = [a + b for a, b in zip(target[key], counts)]
+                else:
+                    target[key] = list(counts)
+    return merged
+
+def _series(name, key, value, extra=""):
+    labels = ",".join(part for part in (key, extra) if part)
+    return f"{PREFIX}{name}{{{labels}}} {value}" if labels else f"{PREFIX}{name} {value}"
+
+def _header(name, default_type):
+    kind, text = DESCRIPTIONS.get(name, (default_type, name))
+    return [f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} {kind}"]
+
+# Prometheus text exposition of a (merged) snapshot. `gauges` maps names
+# to {labels dict tuple: value} read at scrape time.
+def render(snap, gauges=None):
+    lines = []
+    for name, series in sorted(snap["counters"].items()):
+        lines += _header(name, "counter")
+        lines += [_series(name, key, value) for key, value in sorted(series.items())]
+    for name, series in sorted(snap["histograms"].items()):
+        lines += _header(name, "histogram")
+        for key, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], counts):
+                cumulative += count
+                lines.append(_series(f"{name}_bucket", key, cumulative, f'le="{bound}"'))
+            lines.append(_series(f"{name}_sum", key, round(counts[-2], 6)))
+            lines.append(_series(f"{name}_count", key, counts[-1]))
+    for name, series in sorted((gauges or {}).items()):
+        lines += _header(name, "gauge")
+        lines += [_series(name, _label_text(dict(labels)), value) for labels, value in sorted(series.items())]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,27 @@
+import db
+
+# Versioned schema changes, tracked in each database's PRAGMA
+# user_version. Step n (counting from 1) runs when user_version < n, in
+# a write transaction that also sets user_version to n, so workers
+# starting together apply each step exactly once.
+#
+# A step is a function of the connection. Long data changes return True
+# while they have more batches to do: each batch commits on its own so
+# the write lock is never held for long, and user_version only moves on
+# once the step returns something falsy.
+def migrate(db_path, steps):
+    conn = db.get_connection(db_path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(steps):
+        return 0
+    applied = 0
+    for version, step in enumerate(steps, 1):
+        while True:
+            with db.transaction(db_path) as conn:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    break
+                if step(conn):
+                    continue
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied += 1
+                break
+    return applied
@@ -0,0 +1,46 @@
+import array
+import json
+import mmap
+import os
+
+# Files of flat typed arrays behind a small JSON header, used for the
+# preprocessed road graph and gazetteer. Arrays are 8-byte aligned and
+# read back as memoryviews over a read-only mmap, so loading is instant
+# and every worker process shares the same pages.
+#
+# Layout: magic, header length (8 bytes little-endian), JSON header,
+# padding, arrays.
+
+def write(path, magic, header, arrays):
+    offset = 0
+    layout = {}
+    for name, values in arrays.items():
+        offset = (offset + 7) // 8 * 8
+        layout[name] = [values.typecode, offset, len(values)]
+        offset += len(values) * values.itemsize
+    header_bytes = json.dumps(dict(header, arrays=layout), ensure_ascii=False).encode("utf-8")
+    base = (len(magic) + 8 + len(header_bytes) + 7) // 8 * 8
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(magic + len(header_bytes).to_bytes(8, "little") + header_bytes)
+        for name, values in arrays.items():
+            f.seek(base + layout[name][1])
+            values.tofile(f)
+    os.replace(tmp_path, path)
+
+# Returns (header, {name: memoryview}); raises ValueError on a wrong magic
+def load(path, magic):
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(magic)] != magic:
+        raise ValueError(f"{path} is not a {magic.decode()} file")
+    start = len(magic) + 8
+    size = int.from_bytes(mapped[len(magic):start], "little")
+    header = json.loads(mapped[start:start + size].decode("utf-8"))
+    base = (start + size + 7) // 8 * 8
+    view = memoryview(mapped)
+    arrays = {}
+    for name, (typecode, offset, length) in header["arrays"].items():
+        begin = base + offset
+        arrays[name] = view[begin:begin + length * array.array(typecode).itemsize].cast(typecode)
+    return header, arrays
@@ -0,0 +1,281 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+import cache
+import db
+
+# Sampling profiler. A background thread looks at the stacks of threads
+# that are serving a request or running a job every SAMPLE_INTERVAL_S
+# and counts them in folded form ("a.py:f;b.py:g 12"), which
+# flamegraph.pl and speedscope read directly.
+#
+# Stacks go to two places: the thread's own buffer, kept only when the
+# request turns out slower than the capture threshold, and the
+# on-demand session if one is running. Sessions are started from the
+# admin endpoints and stored in cache.db, so every gunicorn worker joins
+# in within SYNC_INTERVAL_S and adds its samples to the same profile.
+SAMPLE_INTERVAL_S = 0.01
+SYNC_INTERVAL_S = 1
+MAX_DEPTH = 128
+SESSIONS_KEPT = 20
+RUNNING = "stopped_at IS NULL AND until > ? AND (max_requests IS NULL OR requests_seen < max_requests)"
+SLOW_CAPTURES_KEPT = 50
+
+_lock = threading.Lock()
+_threads = {}           # thread ident -> (started, {stack: samples}) while busy
+_session = None         # {"id", "limited", "stacks"} while a session runs here
+_labels = {}
+_capture = False
+_started = False
+_wakeup = threading.Event()
+
+def setup_profiler():
+    with db.transaction(cache.CACHE_DB) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS profile_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                until REAL NOT NULL,
+                max_requests INTEGER,
+                requests_seen INTEGER NOT NULL DEFAULT 0,
+                stopped_at REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS profile_samples (
+                session_id INTEGER,
+                stack TEXT,
+                samples INTEGER,
+                PRIMARY KEY (session_id, stack)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS slow_profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                method TEXT,
+                path TEXT,
+                endpoint TEXT,
+                duration_ms REAL,
+                samples INTEGER,
+                folded TEXT
+            )
+        """)
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return label
+
+def fold(frame):
+    parts = []
+    while frame is not None and len(parts) < MAX_DEPTH:
+        parts.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+def folded_text(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+def _sample():
+    with _lock:
+        idents = list(_threads)
+    if not idents:
+        return
+    frames = sys._current_frames()
+    stacks = {ident: fold(frames[ident]) for ident in idents if ident in frames}
+    with _lock:
+        for ident, stack in stacks.items():
+            busy = _threads.get(ident)
+            if busy is None:
+                continue
+            if _capture:
+                busy[1][stack] = busy[1].get(stack, 0) + 1
+            if _session is not None:
+                _session["stacks"][stack] = _session["stacks"].get(stack, 0) + 1
+
+def _sampler():
+    while True:
+        if not _threads:
+            _wakeup.wait(SYNC_INTERVAL_S)
+            _wakeup.clear()
+            continue
+        _sample()
+        time.sleep(SAMPLE_INTERVAL_S)
+
+# Run the sampler and the session sync in this process. capture=True
+# keeps per-request stacks for slow-request capture.
+def start(capture):
+    global _started, _capture
+    with _lock:
+        _capture = capture
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_sampler, daemon=True).start()
+    threading.Thread(target=_sync_loop, daemon=True).start()
+
+# Mark the current thread busy until end(), which returns the seconds
+# since begin() and the stacks sampled meanwhile (empty unless capture
+# is on). Threads are only watched while capture or a session is on.
+def begin():
+    if not _capture and _session is None:
+        return
+    with _lock:
+        _threads[threading.get_ident()] = (time.perf_counter(), {})
+    _wakeup.set()
+
+def end():
+    with _lock:
+        busy = _threads.pop(threading.get_ident(), None)
+    if busy is None:
+        return 0.0, {}
+    return time.perf_counter() - busy[0], busy[1]
+
+def session_id():
+    session = _session
+    return session["id"] if session is not None else None
+
+def _take_session(stop):
+    global _session
+    with _lock:
+        session = _session
+        if session is None:
+            return None, {}
+        if stop:
+            _session = None
+        else:
+            _session = dict(session, stacks={})
+    return session["id"], session["stacks"]
+
+def _add_samples(session, stacks):
+    if not stacks:
+        return
+    with db.transaction(cache.CACHE_DB) as conn:
+        conn.executemany(
+            "INSERT INTO profile_samples (session_id, stack, samples) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id, stack) DO UPDATE SET samples = samples + excluded.samples",
+            [(session, stack, count) for stack, count in stacks.items()]
+        )
+
+def _active_session():
+    return db.get_connection(cache.CACHE_DB).execute(
+        f"SELECT id, max_requests FROM profile_sessions WHERE {RUNNING} ORDER BY id DESC LIMIT 1", (time.time(),)
+    ).fetchone()
+
+# Bring this process in line with the active session: flush what it has
+# sampled, leave a session that has ended and join a new one.
+def sync():
+    global _session
+    active = _active_session()
+    current = session_id()
+    if current is not None:
+        _add_samples(*_take_session(stop=active is None or current != active["id"]))
+    if active is not None and session_id() is None:
+        with _lock:
+            _session = {"id": active["id"], "limited": active["max_requests"] is not None, "stacks": {}}
+
+def _sync_loop():
+    while True:
+        time.sleep(SYNC_INTERVAL_S)
+        try:
+            sync()
+        except Exception:
+            traceback.print_exc()
+
+# Start a session lasting `seconds` or until `max_requests` requests have
+# finished, whichever comes first. Returns its id, or None while another
+# session is running.
+def start_session(seconds, max_requests=None):
+    now = time.time()
+    with db.transaction(cache.CACHE_DB) as conn:
+        running = conn.execute(f"SELECT 1 FROM profile_sessions WHERE {RUNNING}", (now,)).fetchone()
+        if running:
+            return None
+        new_id = conn.execute(
+            "INSERT INTO profile_sessions (started_at, until, max_requests) VALUES (?, ?, ?)",
+            (now, now + seconds, max_requests)
+        ).lastrowid
+        old = conn.execute(
+            "SELECT id FROM profile_sessions ORDER BY id DESC LIMIT -1 OFFSET ?", (SESSIONS_KEPT,)
+        ).fetchall()
+        for (old_id,) in old:
+            conn.execute("DELETE FROM profile_samples WHERE session_id = ?", (old_id,))
+            conn.execute("DELETE FROM profile_sessions WHERE id = ?", (old_id,))
+    sync()
+    return new_id
+
+def stop_session(session):
+    with db.transaction(cache.CACHE_DB) as conn:
+        now = time.time()
+        stopped = conn.execute(
+            f"UPDATE profile_sessions SET stopped_at = ? WHERE id = ? AND {RUNNING}", (now, session, now)
+        ).rowcount
+    sync()
+    return stopped > 0
+
+# Count one finished request against the running session's limit, and
+# leave the session straight away once the limit is reached
+def count_request():
+    session = _session
+    if session is None or not session["limited"]:
+        return
+    with db.transaction(cache.CACHE_DB) as conn:
+        conn.execute("UPDATE profile_sessions SET requests_seen = requests_seen + 1 WHERE id = ?", (session["id"],))
+        seen, limit = conn.execute(
+            "SELECT requests_seen, max_requests FROM profile_sessions WHERE id = ?", (session["id"],)
+        ).fetchone()
+    if seen >= limit:
+        sync()
+
+def _session_dict(row):
+    return {
+        "id": row["id"],
+        "started_at": row["started_at"],
+        "until": row["until"],
+        "max_requests": row["max_requests"],
+        "requests_seen": row["requests_seen"],
+        "stopped_at": row["stopped_at"],
+    }
+
+# (session, {stack: samples}) summed over every worker, or None. Workers
+# flush every SYNC_INTERVAL_S, so a running session keeps growing.
+def get_session(session):
+    sync()
+    conn = db.get_connection(cache.CACHE_DB)
+    row = conn.execute("SELECT * FROM profile_sessions WHERE id = ?", (session,)).fetchone()
+    if row is None:
+        return None
+    stacks = dict(conn.execute(
+        "SELECT stack, samples FROM profile_samples WHERE session_id = ?", (session,)
+    ).fetchall())
+    return _session_dict(row), stacks
+
+def list_profiles():
+    conn = db.get_connection(cache.CACHE_DB)
+    sessions = conn.execute("SELECT * FROM profile_sessions ORDER BY id DESC").fetchall()
+    slow = conn.execute(
+        "SELECT id, created_at, method, path, endpoint, duration_ms, samples FROM slow_profiles ORDER BY id DESC"
+    ).fetchall()
+    return {"sessions": [_session_dict(row) for row in sessions], "slow": [dict(row) for row in slow]}
+
+def save_slow(method, path, endpoint, seconds, stacks):
+    with db.transaction(cache.CACHE_DB) as conn:
+        conn.execute("""
+            INSERT INTO slow_profiles (created_at, method, path, endpoint, duration_ms, samples, folded)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (time.time(), method, path, endpoint, round(seconds * 1000, 1), sum(stacks.values()), folded_text(stacks)))
+        conn.execute(
+            "DELETE FROM slow_profiles WHERE id <= (SELECT id FROM slow_profiles ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (SLOW_CAPTURES_KEPT,)
+        )
+
+def get_slow(capture):
+    row = db.get_connection(cache.CACHE_DB).execute(
+        "SELECT folded FROM slow_profiles WHERE id = ?", (capture,)
+    ).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,298 @@
+import array
+import bisect
+import bz2
+import gzip
+import heapq
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import packed
+
+# Offline road graph. `build` turns an OSM XML extract (.osm, .osm.gz or
+# .osm.bz2) into one preprocessed file of flat arrays: node coordinates,
+# forward and reverse CSR adjacency, and a grid index for snapping,
+# loaded with packed.load.
+MAGIC = b"ROADGRF1"
+GRID_DEG = 0.005                       # snap grid cell, about 550 m
+MAX_SNAP_M = 1500                      # points further than this from a road are not routed
+COORD_SCALE = 1e6
+EARTH_RADIUS_M = 6371000
+
+# Default speeds in km/h for routable highway types
+SPEEDS = {
+    "motorway": 80, "trunk": 60, "primary": 40, "secondary": 35, "tertiary": 30,
+    "motorway_link": 45, "trunk_link": 40, "primary_link": 30, "secondary_link": 30, "tertiary_link": 25,
+    "unclassified": 25, "residential": 20, "living_street": 10, "service": 15, "road": 20,
+}
+ONEWAY_VALUES = {"yes", "true", "1"}
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+def _cell(lat, lon):
+    return (math.floor(lat / GRID_DEG) << 32) | (math.floor(lon / GRID_DEG) & 0xFFFFFFFF)
+
+def open_osm(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def _speed(tags):
+    speed = SPEEDS[tags["highway"]]
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    if maxspeed.isdigit():
+        speed = min(speed, int(maxspeed))
+    return speed
+
+# Routable ways as (node refs, speed km/h, oneway: 1 / -1 / 0, name)
+def _read_ways(path):
+    ways = []
+    with open_osm(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "way":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if tags.get("highway") in SPEEDS and tags.get("access") not in ("no", "private"):
+                    oneway = tags.get("oneway", "")
+                    direction = -1 if oneway == "-1" else 1 if (
+                        oneway in ONEWAY_VALUES or tags.get("junction") == "roundabout"
+                    ) else 0
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    if len(refs) > 1:
+                        ways.append((refs, _speed(tags), direction, tags.get("name", "")))
+                elem.clear()
+            elif elem.tag in ("node", "relation"):
+                elem.clear()
+    return ways
+
+def read_nodes(path, wanted):
+    coords = {}
+    with open_osm(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "node":
+                node_id = int(elem.get("id"))
+                if node_id in wanted:
+                    coords[node_id] = (float(elem.get("lat")), float(elem.get("lon")))
+            elem.clear()
+    return coords
+
+# Preprocess an OSM extract into the graph file. Returns (nodes, edges).
+def build(osm_path, out_path):
+    ways = _read_ways(osm_path)
+    coords = read_nodes(osm_path, {ref for refs, _, _, _ in ways for ref in refs})
+
+    names = [""]
+    name_index = {"": 0}
+    index = {}
+    edges = []                         # (from, to, seconds, meters, name)
+    for refs, speed, direction, name in ways:
+        refs = [ref for ref in refs if ref in coords]
+        name_id = name_index.setdefault(name, len(names))
+        if name_id == len(names):
+            names.append(name)
+        for a, b in zip(refs, refs[1:]):
+            u = index.setdefault(a, len(index))
+            v = index.setdefault(b, len(index))
+            meters = haversine_m(*coords[a], *coords[b])
+            seconds = meters / (speed / 3.6)
+            if direction >= 0:
+                edges.append((u, v, seconds, meters, name_id))
+            if direction <= 0:
+                edges.append((v, u, seconds, meters, name_id))
+
+    n = len(index)
+    lat = array.array("i", [0]) * n
+    lon = array.array("i", [0]) * n
+    for node_id, i in index.items():
+        lat[i] = round(coords[node_id][0] * COORD_SCALE)
+        lon[i] = round(coords[node_id][1] * COORD_SCALE)
+
+    edges.sort()
+    offsets = array.array("I", [0]) * (n + 1)
+    for u, _, _, _, _ in edges:
+        offsets[u + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    targets = array.array("I", (e[1] for e in edges))
+    seconds = array.array("f", (e[2] for e in edges))
+    meters = array.array("f", (e[3] for e in edges))
+    name_ids = array.array("I", (e[4] for e in edges))
+
+    reverse = sorted(range(len(edges)), key=lambda k: edges[k][1])
+    rev_offsets = array.array("I", [0]) * (n + 1)
+    for k in reverse:
+        rev_offsets[edges[k][1] + 1] += 1
+    for i in range(n):
+        rev_offsets[i + 1] += rev_offsets[i]
+    rev_sources = array.array("I", (edges[k][0] for k in reverse))
+    rev_edges = array.array("I", reverse)
+
+    cells = sorted((_cell(lat[i] / COORD_SCALE, lon[i] / COORD_SCALE), i) for i in range(n))
+    cell_keys, cell_offsets = array.array("q"), array.array("I")
+    for position, (key, _) in enumerate(cells):
+        if not cell_keys or cell_keys[-1] != key:
+            cell_keys.append(key)
+            cell_offsets.append(position)
+    cell_offsets.append(len(cells))
+    cell_nodes = array.array("I", (i for _, i in cells))
+
+    max_speed = max((e[3] / e[2] for e in edges if e[2] > 0), default=1.0)
+    packed.write(out_path, MAGIC, {"nodes": n, "edges": len(edges), "max_speed_mps": max_speed, "names": names}, {
+        "lat": lat, "lon": lon,
+        "offsets": offsets, "targets": targets, "seconds": seconds, "meters": meters, "name_ids": name_ids,
+        "rev_offsets": rev_offsets, "rev_sources": rev_sources, "rev_edges": rev_edges,
+        "cell_keys": cell_keys, "cell_offsets": cell_offsets, "cell_nodes": cell_nodes,
+    })
+    return n, len(edges)
+
+class RoadGraph:
+    def __init__(self, path):
+        header, arrays = packed.load(path, MAGIC)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+        self.names = header["names"]
+        self.node_count = header["nodes"]
+        self.max_speed = header["max_speed_mps"]
+
+    def coord(self, i):
+        return self.lat[i] / COORD_SCALE, self.lon[i] / COORD_SCALE
+
+    # Closest graph node within MAX_SNAP_M, searching grid rings outwards
+    def snap(self, lat, lon):
+        row, col = math.floor(lat / GRID_DEG), math.floor(lon / GRID_DEG)
+        best, best_m = None, MAX_SNAP_M
+        ring = 0
+        # A node in ring r is at least (r - 1) cells away
+        while (ring - 1) * GRID_DEG * 111000 * math.cos(math.radians(lat)) < best_m:
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    key = (r << 32) | (c & 0xFFFFFFFF)
+                    k = bisect.bisect_left(self.cell_keys, key)
+                    if k == len(self.cell_keys) or self.cell_keys[k] != key:
+                        continue
+                    for p in range(self.cell_offsets[k], self.cell_offsets[k + 1]):
+                        node = self.cell_nodes[p]
+                        meters = haversine_m(lat, lon, *self.coord(node))
+                        if meters < best_m:
+                            best, best_m = node, meters
+            ring += 1
+        return best
+
+    # Lower bound on seconds between two nodes. Equirectangular distance
+    # is a planar metric, so the averaged potentials below stay consistent.
+    def _bound(self, i, target_lat, target_lon, cos_lat):
+        dlat = (self.lat[i] / COORD_SCALE - target_lat) * 111195
+        dlon = (self.lon[i] / COORD_SCALE - target_lon) * 111195 * cos_lat
+        return 0.99 * math.sqrt(dlat * dlat + dlon * dlon) / self.max_speed
+
+    # Bidirectional A* on drive time with the average of the forward and
+    # backward potentials. Returns (node path, [edge index]) or None.
+    def shortest_path(self, source, target):
+        if source == target:
+            return [source], []
+        s_lat, s_lon = self.coord(source)
+        t_lat, t_lon = self.coord(target)
+        cos_lat = math.cos(math.radians((s_lat + t_lat) / 2))
+
+        potentials = {}
+
+        def potential(i):
+            value = potentials.get(i)
+            if value is None:
+                value = potentials[i] = (
+                    self._bound(i, t_lat, t_lon, cos_lat) - self._bound(i, s_lat, s_lon, cos_lat)
+                ) / 2
+            return value
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        done = (set(), set())
+        heaps = ([(potential(source), source)], [(-potential(target), target)])
+        best, meeting = math.inf, None
+        # The potentials cancel in the sum of the two keys, so this is the
+        # usual bidirectional stop: neither frontier can improve `best`
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, u = heapq.heappop(heaps[side])
+            if u in done[side]:
+                continue
+            done[side].add(u)
+            d = dist[side][u]
+            if side == 0:
+                neighbours = ((self.targets[k], k) for k in range(self.offsets[u], self.offsets[u + 1]))
+            else:
+                neighbours = (
+                    (self.rev_sources[k], self.rev_edges[k]) for k in range(self.rev_offsets[u], self.rev_offsets[u + 1])
+                )
+            for v, edge in neighbours:
+                nd = d + self.seconds[edge]
+                if nd < dist[side].get(v, math.inf):
+                    dist[side][v] = nd
+                    parent[side][v] = (u, edge)
+                    heapq.heappush(heaps[side], (nd + (potential(v) if side == 0 else -potential(v)), v))
+                    other = dist[1 - side].get(v)
+                    if other is not None and nd + other < best:
+                        best, meeting = nd + other, v
+        if meeting is None:
+            return None
+
+        nodes, edges = [meeting], []
+        node = meeting
+        while parent[0][node] is not None:
+            node, edge = parent[0][node]
+            nodes.append(node)
+            edges.append(edge)
+        nodes.reverse()
+        edges.reverse()
+        node = meeting
+        while parent[1][node] is not None:
+            node, edge = parent[1][node]
+            nodes.append(node)
+            edges.append(edge)
+        return nodes, edges
+
+    # Route between two points as (meters, seconds, steps, [(lat, lon)]),
+    # steps being (road name, meters, seconds) per named stretch, or None
+    # when either point is off the graph or no path exists.
+    def route(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        source = self.snap(origin_lat, origin_lon)
+        target = self.snap(dest_lat, dest_lon)
+        if source is None or target is None:
+            return None
+        found = self.shortest_path(source, target)
+        if found is None:
+            return None
+        nodes, edges = found
+        steps = []
+        for edge in edges:
+            name = self.names[self.name_ids[edge]]
+            if steps and steps[-1][0] == name:
+                steps[-1][1] += self.meters[edge]
+                steps[-1][2] += self.seconds[edge]
+            else:
+                steps.append([name, self.meters[edge], self.seconds[edge]])
+        meters = sum(step[1] for step in steps)
+        seconds = sum(step[2] for step in steps)
+        return meters, seconds, [tuple(step) for step in steps], [self.coord(i) for i in nodes]
+
+_graphs = {}
+_lock = threading.Lock()
+
+# Graph at `path`, loaded once per process; None if the file is missing
+def get_graph(path):
+    graph = _graphs.get(path)
+    if graph is None and os.path.exists(path):
+        with _lock:
+            graph = _graphs.get(path)
+            if graph is None:
+                graph = _graphs[path] = RoadGraph(path)
+    return graph
@@ -0,0 +1,151 @@
+import db
+
+# Running totals per (warehouse, category, status), kept by triggers on
+# every insert, update and delete so reads never scan the raw tables.
+# Rows still being enriched have no warehouse yet and count under "".
+#
+# Supply lives in donations.db: a donation adds its quantity and weight
+# to its category. Demand lives in requestlist.db: a request adds each
+# non-zero *_qty column to that column's category.
+SUPPLY_AMOUNTS = ["quantity", "weight"]
+DEMAND_AMOUNTS = ["quantity"]
+
+# Trigger statement adding (sign "+") or removing (sign "-") one row.
+# INSERT ... SELECT needs a WHERE before ON CONFLICT to parse.
+def _upsert(table, sign, row, category, amounts, condition="1"):
+    columns = ", ".join(amounts)
+    values = ", ".join(f"{sign}COALESCE({expr}, 0)" for expr in amounts.values())
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in amounts)
+    return f"""
+        INSERT INTO {table} (warehouse_name, category, status, count, {columns})
+        SELECT COALESCE({row}.warehouse_name, ''), {category}, COALESCE({row}.status, ''), {sign}1, {values}
+        WHERE {condition}
+        ON CONFLICT (warehouse_name, category, status) DO UPDATE SET
+            count = count + excluded.count, {updates};
+    """
+
+def _supply_statements(sign, row):
+    return _upsert("supply_summary", sign, row, f"COALESCE({row}.category, '')", {
+        "quantity": f"{row}.quantity",
+        "weight": f"{row}.weight",
+    })
+
+def _demand_statements(category_columns):
+    def statements(sign, row):
+        return "".join(
+            _upsert(
+                "demand_summary", sign, row, f"'{category}'", {"quantity": f"{row}.{column}"},
+                f"COALESCE({row}.{column}, 0) != 0"
+            )
+            for category, column in category_columns.items()
+        )
+    return statements
+
+# Returns True if the table is new and has to be filled from the raw rows
+def _create_table(conn, table, amounts):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    columns = "".join(f"{name} REAL NOT NULL DEFAULT 0,\n" for name in amounts)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            warehouse_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            {columns}
+            PRIMARY KEY (warehouse_name, category, status)
+        )
+    """)
+    return exists is None
+
+def _create_triggers(conn, source, watched, statements):
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_insert_summary AFTER INSERT ON {source}
+        BEGIN {statements("+", "NEW")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_delete_summary AFTER DELETE ON {source}
+        BEGIN {statements("-", "OLD")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_update_summary AFTER UPDATE OF {", ".join(watched)} ON {source}
+        BEGIN {statements("-", "OLD")} {statements("+", "NEW")} END
+    """)
+
+def setup_summaries(category_columns):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        created = _create_table(conn, "supply_summary", SUPPLY_AMOUNTS)
+        _create_triggers(
+            conn, "donations", ["warehouse_name", "category", "status", "quantity", "weight"],
+            _supply_statements
+        )
+        if created:
+            _rebuild_supply(conn)
+
+    with db.transaction(db.REQUESTS_DB) as conn:
+        created = _create_table(conn, "demand_summary", DEMAND_AMOUNTS)
+        _create_triggers(
+            conn, "requests", ["warehouse_name", "status"] + list(category_columns.values()),
+            _demand_statements(category_columns)
+        )
+        if created:
+            _rebuild_demand(conn, category_columns)
+
+def _rebuild_supply(conn):
+    conn.execute("DELETE FROM supply_summary")
+    conn.execute("""
+        INSERT INTO supply_summary (warehouse_name, category, status, count, quantity, weight)
+        SELECT COALESCE(warehouse_name, ''), COALESCE(category, ''), COALESCE(status, ''),
+               COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(weight), 0)
+        FROM donations
+        GROUP BY 1, 2, 3
+    """)
+
+def _rebuild_demand(conn, category_columns):
+    conn.execute("DELETE FROM demand_summary")
+    for category, column in category_columns.items():
+        conn.execute(f"""
+            INSERT INTO demand_summary (warehouse_name, category, status, count, quantity)
+            SELECT COALESCE(warehouse_name, ''), ?, COALESCE(status, ''), COUNT(*), SUM({column})
+            FROM requests
+            WHERE COALESCE({column}, 0) != 0
+            GROUP BY 1, 3
+        """, (category,))
+
+# Recompute both summaries from the raw tables, e.g. after editing the
+# databases by hand
+def rebuild(category_columns):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        _rebuild_supply(conn)
+    with db.transaction(db.REQUESTS_DB) as conn:
+        _rebuild_demand(conn, category_columns)
+
+def _read(db_path, table, amounts, warehouse, category, status):
+    where = ["count != 0"]
+    params = []
+    for column, value in (("warehouse_name", warehouse), ("category", category), ("status", status)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    return db.get_connection(db_path).execute(
+        f"SELECT warehouse_name, category, status, count, {', '.join(amounts)} FROM {table} "
+        f"WHERE {' AND '.join(where)}",
+        params
+    ).fetchall()
+
+# Totals nested as {warehouse: {category: {"supply": {status: totals},
+# "demand": {status: totals}}}}, optionally narrowed to one warehouse,
+# category or status
+def get_stats(warehouse=None, category=None, status=None):
+    stats = {}
+    for side, db_path, table, amounts in (
+        ("supply", db.DONATIONS_DB, "supply_summary", SUPPLY_AMOUNTS),
+        ("demand", db.REQUESTS_DB, "demand_summary", DEMAND_AMOUNTS),
+    ):
+        for row in _read(db_path, table, amounts, warehouse, category, status):
+            entry = stats.setdefault(row["warehouse_name"], {}).setdefault(
+                row["category"], {"supply": {}, "demand": {}}
+            )
+            entry[side][row["status"]] = {"count": row["count"], **{name: row[name] for name in amounts}}
+    return stats
@@ -0,0 +1,198 @@
+import math
+import time
+
+import requests
+
+import cache
+import http_client
+
+# Pickup tour configuration
+COLD_METHODS = ("Cần kho mát", "Đông lạnh")
+OSRM_TABLE_BLOCK = 50                  # sources and destinations per table call (100 coordinates)
+MATRIX_BUDGET_S = 2.0                  # time spent fetching drive times before estimating the rest
+IMPROVE_BUDGET_S = 1.5                 # time spent on 2-opt/Or-opt per request
+AVERAGE_SPEED_KMH = 25                 # city driving speed for estimated legs
+ROAD_FACTOR = 1.3                      # road distance / straight-line distance
+EARTH_RADIUS_KM = 6371
+
+def _estimate(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, [a[0], a[1], b[0], b[1]])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    km = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+    return km * ROAD_FACTOR / AVERAGE_SPEED_KMH * 3600
+
+def _fetch_block(osrm_url, points, sources, destinations):
+    coords = [points[i] for i in sources] + [points[j] for j in destinations]
+    response = http_client.get(
+        f"{osrm_url}/table/v1/driving/" + ";".join(f"{lon},{lat}" for lat, lon in coords),
+        params={
+            "sources": ";".join(str(k) for k in range(len(sources))),
+            "destinations": ";".join(str(len(sources) + k) for k in range(len(destinations))),
+            "annotations": "duration",
+        }
+    )
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get("code") != "Ok":
+        return None
+    return data["durations"]
+
+# Drive-time matrix in seconds between `points` ([(lat, lon)]). Cached
+# legs are used first, missing blocks are fetched from the OSRM table
+# service within MATRIX_BUDGET_S, and anything left is estimated from
+# the straight-line distance. Returns (matrix, counts by source).
+def travel_matrix(points, osrm_url):
+    n = len(points)
+    matrix = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+    counts = {"cache": 0, "osrm": 0, "estimate": 0}
+    for (i, j), seconds in cache.get_travel_times(points).items():
+        if i != j:
+            matrix[i][j] = seconds
+            counts["cache"] += 1
+
+    deadline = time.time() + MATRIX_BUDGET_S
+    blocks = [list(range(start, min(start + OSRM_TABLE_BLOCK, n))) for start in range(0, n, OSRM_TABLE_BLOCK)]
+    fetched = []
+    for sources in blocks:
+        for destinations in blocks:
+            if time.time() > deadline:
+                break
+            if all(matrix[i][j] is not None for i in sources for j in destinations):
+                continue
+            try:
+                durations = _fetch_block(osrm_url, points, sources, destinations)
+            except (requests.RequestException, ValueError, KeyError):
+                durations = None
+            if durations is None:
+                deadline = 0
+                break
+            for row, i in zip(durations, sources):
+                for seconds, j in zip(row, destinations):
+                    if seconds is not None and matrix[i][j] is None:
+                        matrix[i][j] = seconds
+                        counts["osrm"] += 1
+                        fetched.append((points[i], points[j], seconds))
+    if fetched:
+        cache.put_travel_times(fetched)
+
+    for i in range(n):
+        for j in range(n):
+            if matrix[i][j] is None:
+                matrix[i][j] = _estimate(points[i], points[j])
+                counts["estimate"] += 1
+    return matrix, counts
+
+# Nearest-neighbour order of `stops` starting from node `start`
+def _nearest_neighbour(stops, cost, start):
+    order = []
+    left = set(stops)
+    current = start
+    while left:
+        current = min(left, key=lambda j: (cost[current][j], j))
+        order.append(current)
+        left.remove(current)
+    return order
+
+# Improve a closed path [0, ..., 0] with 2-opt and Or-opt moves until no
+# move helps or the deadline passes. Positions before `boundary` and from
+# `boundary` on are improved separately so cold stops stay at the end.
+def _improve(path, cost, boundary, deadline):
+    n = len(path) - 1
+    improved = True
+    while improved and time.time() < deadline:
+        improved = False
+        # 2-opt: reverse path[i..j]
+        for i in range(1, n - 1):
+            a, b = path[i - 1], path[i]
+            for j in range(i + 1, n):
+                if i < boundary <= j:
+                    break
+                c, d = path[j], path[j + 1]
+                if cost[a][c] + cost[b][d] < cost[a][b] + cost[c][d] - 1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    b = path[i]
+                    improved = True
+            if time.time() > deadline:
+                return path
+        # Or-opt: move a run of 1-3 stops elsewhere in its section
+        for length in (1, 2, 3):
+            for i in range(1, n - length + 1):
+                if i < boundary < i + length:
+                    continue
+                run = path[i:i + length]
+                before, after = path[i - 1], path[i + length]
+                removed = cost[before][run[0]] + cost[run[-1]][after] - cost[before][after]
+                rest = path[:i] + path[i + length:]
+                # Insert after rest[k]; k ranges over the run's own section
+                if i >= boundary:
+                    positions = range(boundary - 1, len(rest) - 1)
+                else:
+                    positions = range(0, boundary - length)
+                best, best_k = 1e-9, None
+                for k in positions:
+                    added = cost[rest[k]][run[0]] + cost[run[-1]][rest[k + 1]] - cost[rest[k]][rest[k + 1]]
+                    if removed - added > best:
+                        best, best_k = removed - added, k
+                if best_k is not None:
+                    path[:] = rest[:best_k + 1] + run + rest[best_k + 1:]
+                    improved = True
+    return path
+
+# Split stops into trips of at most `capacity` weight. Cold stops are
+# packed first, so they are collected on the earliest trips.
+def _split(order, stops, capacity):
+    ordered = [i for i in order if stops[i]["cold"]] + [i for i in order if not stops[i]["cold"]]
+    if not capacity:
+        return [ordered]
+    trips, current, load = [], [], 0
+    for i in ordered:
+        weight = stops[i]["weight"]
+        if current and load + weight > capacity:
+            trips.append(current)
+            current, load = [], 0
+        current.append(i)
+        load += weight
+    if current:
+        trips.append(current)
+    return trips
+
+# Plan pickup trips from a depot. `stops` are dicts with lat, lon, weight
+# and method; node 0 of the matrix is the depot and node i + 1 is
+# stops[i]. Within a trip ordinary stops come first and cold-chain stops
+# last, so chilled goods spend the least time on board.
+def plan_tour(depot, stops, capacity, osrm_url):
+    points = [(depot["lat"], depot["lon"])] + [(s["lat"], s["lon"]) for s in stops]
+    matrix, counts = travel_matrix(points, osrm_url)
+    # Heuristics work on the symmetric average; reported times use the real legs
+    cost = [[(matrix[i][j] + matrix[j][i]) / 2 for j in range(len(points))] for i in range(len(points))]
+    nodes = [dict(s, weight=s.get("weight") or 0, cold=s.get("method") in COLD_METHODS) for s in stops]
+    nodes.insert(0, None)
+
+    giant = _nearest_neighbour(range(1, len(points)), cost, 0)
+    deadline = time.time() + IMPROVE_BUDGET_S
+    trips = []
+    for members in _split(giant, nodes, capacity):
+        normal = _nearest_neighbour([i for i in members if not nodes[i]["cold"]], cost, 0)
+        cold = _nearest_neighbour([i for i in members if nodes[i]["cold"]], cost, normal[-1] if normal else 0)
+        path = _improve([0] + normal + cold + [0], cost, len(normal) + 1, deadline)
+
+        elapsed = 0
+        visits = []
+        for previous, node in zip(path, path[1:-1]):
+            elapsed += matrix[previous][node]
+            visits.append(dict(stops[node - 1], cold=nodes[node]["cold"], arrival_s=round(elapsed, 1)))
+        elapsed += matrix[path[-2]][0]
+        load = sum(nodes[i]["weight"] for i in members)
+        trips.append({
+            "stops": visits,
+            "load": load,
+            # A single stop heavier than the vehicle still gets its own trip
+            "over_capacity": bool(capacity) and load > capacity,
+            "duration_s": round(elapsed, 1),
+        })
+    return {
+        "trips": trips,
+        "total_duration_s": round(sum(t["duration_s"] for t in trips), 1),
+        "matrix": counts,
+    }
@@ -0,0 +1,226 @@
+import heapq
+import math
+import threading
+import time
+
+import db
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371
+RELOAD_CHECK_INTERVAL = 2              # seconds between checks for table changes
+
+_lock = threading.Lock()
+# The index ({"version", "warehouses", "tree", "vectors"}) is replaced as a
+# whole on reload, so a reader that took it once never mixes the tree of
+# one version with the warehouse list of another
+_state = {"checked_at": 0, "index": None}
+
+# Warehouses live in donations.db. Triggers bump warehouse_version on
+# every change, so workers notice edits with one cheap read and rebuild
+# their index.
+def setup_warehouses(seed):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS warehouses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS warehouse_version (version INTEGER NOT NULL)")
+        if conn.execute("SELECT COUNT(*) FROM warehouse_version").fetchone()[0] == 0:
+            conn.execute("INSERT INTO warehouse_version (version) VALUES (0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS warehouses_{event.lower()}_version
+                AFTER {event} ON warehouses
+                BEGIN
+                    UPDATE warehouse_version SET version = version + 1;
+                END
+            """)
+        if conn.execute("SELECT COUNT(*) FROM warehouses").fetchone()[0] == 0:
+            conn.executemany(
+                "INSERT INTO warehouses (name, lat, lon) VALUES (?, ?, ?)",
+                [(w["name"], w["lat"], w["lon"]) for w in seed]
+            )
+
+def to_unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+# Straight-line chord between unit vectors <-> great-circle distance
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+# Static 3-d tree over unit-sphere vectors. Euclidean (chord) order
+# matches great-circle order, so nearest in the tree is nearest on Earth.
+class KDTree:
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indexes, depth):
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.points[i][axis])
+        mid = len(indexes) // 2
+        return (
+            indexes[mid], axis,
+            self._build(indexes[:mid], depth + 1),
+            self._build(indexes[mid + 1:], depth + 1)
+        )
+
+    def _dist2(self, i, point):
+        p = self.points[i]
+        return (p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2 + (p[2] - point[2]) ** 2
+
+    # k nearest as [(squared chord, index)], closest first
+    def nearest(self, point, k):
+        heap = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            index, axis, left, right = node
+            d2 = self._dist2(index, point)
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, index))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, index))
+            diff = point[axis] - self.points[index][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Visit the far side only if the splitting plane is closer
+            # than the current k-th best
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return sorted((-d2, index) for d2, index in heap)
+
+    def within(self, point, radius):
+        r2 = radius * radius
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            index, axis, left, right = node
+            d2 = self._dist2(index, point)
+            if d2 <= r2:
+                found.append((d2, index))
+            diff = point[axis] - self.points[index][axis]
+            if diff < 0 or diff * diff <= r2:
+                stack.append(left)
+            if diff >= 0 or diff * diff <= r2:
+                stack.append(right)
+        return sorted(found)
+
+def _load():
+    conn = db.get_connection(db.DONATIONS_DB)
+    version = conn.execute("SELECT version FROM warehouse_version").fetchone()[0]
+    rows = conn.execute("SELECT id, name, lat, lon FROM warehouses ORDER BY id").fetchall()
+    warehouses = [{"id": r["id"], "name": r["name"], "lat": r["lat"], "lon": r["lon"]} for r in rows]
+    points = [to_unit_vector(w["lat"], w["lon"]) for w in warehouses]
+    _state["index"] = {
+        "version": version,
+        "warehouses": warehouses,
+        "tree": KDTree(points),
+        "vectors": np.array(points, dtype=np.float64).reshape(-1, 3) if np is not None else None,
+    }
+
+# Reload the index if the table changed, checking at most every
+# RELOAD_CHECK_INTERVAL seconds. Returns the current index.
+def _refresh():
+    now = time.time()
+    index = _state["index"]
+    if index is not None and now - _state["checked_at"] < RELOAD_CHECK_INTERVAL:
+        return index
+    with _lock:
+        index = _state["index"]
+        if index is not None and now - _state["checked_at"] < RELOAD_CHECK_INTERVAL:
+            return index
+        version = db.get_connection(db.DONATIONS_DB).execute(
+            "SELECT version FROM warehouse_version"
+        ).fetchone()[0]
+        if index is None or version != index["version"]:
+            _load()
+        _state["checked_at"] = now
+        return _state["index"]
+
+def all_warehouses():
+    return list(_refresh()["warehouses"])
+
+def version():
+    return _refresh()["version"]
+
+# k nearest warehouses as [(warehouse, km)], closest first
+def nearest(lat, lon, k=1):
+    index = _refresh()
+    if not index["warehouses"]:
+        return []
+    hits = index["tree"].nearest(to_unit_vector(lat, lon), k)
+    return [(index["warehouses"][i], chord_to_km(math.sqrt(d2))) for d2, i in hits]
+
+def within(lat, lon, radius_km):
+    index = _refresh()
+    if not index["warehouses"]:
+        return []
+    hits = index["tree"].within(to_unit_vector(lat, lon), km_to_chord(radius_km))
+    return [(index["warehouses"][i], chord_to_km(math.sqrt(d2))) for d2, i in hits]
+
+# k nearest warehouses for many points at once: one [(warehouse, km)]
+# list per point, closest first. Uses one matrix product per chunk when
+# NumPy is installed (max dot product = min distance), otherwise falls
+# back to the tree.
+BATCH_CHUNK = 4096
+
+def nearest_batch(lats, lons, k=1):
+    index = _refresh()
+    if not index["warehouses"]:
+        return [[] for _ in lats]
+    if np is None:
+        return [nearest(lat, lon, k) for lat, lon in zip(lats, lons)]
+    k = min(k, len(index["warehouses"]))
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    points = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+    results = []
+    for start in range(0, len(points), BATCH_CHUNK):
+        dots = points[start:start + BATCH_CHUNK] @ index["vectors"].T
+        if k < dots.shape[1]:
+            best = np.argpartition(-dots, k - 1, axis=1)[:, :k]
+        else:
+            best = np.tile(np.arange(dots.shape[1]), (len(dots), 1))
+        best_dots = np.take_along_axis(dots, best, axis=1)
+        order = np.argsort(-best_dots, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        angles = np.arccos(np.clip(np.take_along_axis(best_dots, order, axis=1), -1.0, 1.0))
+        results.extend(
+            [(index["warehouses"][i], float(a) * EARTH_RADIUS_KM) for i, a in zip(row, row_angles)]
+            for row, row_angles in zip(best.tolist(), angles.tolist())
+        )
+    return results
+
+def add(name, lat, lon):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        warehouse_id = conn.execute(
+            "INSERT INTO warehouses (name, lat, lon) VALUES (?, ?, ?)", (name, lat, lon)
+        ).lastrowid
+    _state["checked_at"] = 0
+    return warehouse_id
+
+def remove(warehouse_id):
+    with db.transaction(db.DONATIONS_DB) as conn:
+        deleted = conn.execute("DELETE FROM warehouses WHERE id = ?", (warehouse_id,)).rowcount
+    _state["checked_at"] = 0
+    return deleted